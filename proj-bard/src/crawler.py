@@ -0,0 +1,249 @@
+##!/usr/bin/env python
+"""
+    The crawler that downloads the No Fear scene pages.  The plays are crawled at the same time over one shared connection
+    pool (each worker thread has its own requests session on it), the requests to a host are spaced by a token bucket and the number of requests in flight is bounded.  The scenes
+    of an act are requested in order and the act ends at the first missing scene.  With a PageCache the pages are revalidated
+    against the cache (or only read from it in offline mode).
+    ...
+    Classes
+    __________
+    TokenBucket(rate, capacity) : Spaces the requests made to one host
+    NoFearCrawler(url_base) : Downloads the scene pages of the plays, crawlPlays(plays, callback) runs the crawl
+"""
+import asyncio
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import random
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2021 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+# Constants
+ACTS = 5
+MAX_SCENES = 24
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+class TokenBucket(object):
+
+    def __init__(self, rate, capacity):
+        '''
+        A token bucket that lets at most capacity requests through at once and then rate requests a second
+        ...
+        Parameters
+        ----------
+        rate: The number of tokens added a second
+        capacity: The most tokens the bucket holds
+        '''
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.resume_at = 0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for a number of seconds (i.e. the Retry-After of a 429)
+        """
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+        self.tokens = 0
+        # The pause isn't refilled, tokens only come back at the rate once it ends
+        self.updated = self.resume_at
+
+    async def acquire(self):
+        """
+        Wait for a token
+        """
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.resume_at:
+                    await asyncio.sleep(self.resume_at - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class NoFearCrawler(object):
+
+    def __init__(self, url_base, headers = None, max_concurrency = 4, rate = 0.5, burst = 2, max_retries = 6,
+                backoff = 2.0, max_backoff = 120.0, timeout = (10, 30), cache = None):
+        '''
+        The crawler of the scene pages
+        ...
+        Parameters
+        ----------
+        url_base: The scene url with the play, act and scene to fill in (i.e. https://host/%s/act-%i-scene-%i/)
+        headers: The headers sent with each request
+        max_concurrency: The most requests in flight across all the plays
+        rate: The requests a second made to a host
+        burst: The requests a host can get at once before the rate applies
+        max_retries: The retries of a page that times out or gets a 429 or 5xx
+        backoff: The seconds waited before the first retry, doubled on every retry
+        max_backoff: The most seconds waited before a retry
+        timeout: The connect and read timeouts of a request
+        cache: The PageCache the pages are kept in, every page is downloaded if None
+        '''
+        self.url_base = url_base
+        self.headers = headers or {}
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.buckets = {}
+
+        # Sessions aren't thread safe, the worker threads each get one and share the adapter's connection pool
+        self.adapter = HTTPAdapter(pool_connections = max_concurrency, pool_maxsize = max_concurrency)
+        self.local = threading.local()
+
+    def session(self):
+        """
+        The requests session of the calling thread, mounted on the shared adapter
+        """
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+            self.local.session.mount('http://', self.adapter)
+            self.local.session.mount('https://', self.adapter)
+        return self.local.session
+
+    def get(self, url, headers):
+        """
+        Make a request with the session of the calling thread
+        """
+        return self.session().get(url, headers = headers, timeout = self.timeout)
+
+    def bucket(self, url):
+        """
+        The token bucket of the host of a url
+        """
+        host = urlparse(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+        return self.buckets[host]
+
+    def retryDelay(self, response, attempt):
+        """
+        The seconds to wait before retrying a request, the Retry-After of the response when it has one and an exponential
+        backoff with jitter otherwise
+        """
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                try:
+                    return min(max((parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds(), 0), self.max_backoff)
+                except (TypeError, ValueError):
+                    pass
+        return min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.5)
+
+    async def fetch(self, url):
+        """
+        Download a page, retrying timeouts, rate limits and server errors
+        ...
+        Parameters
+        ----------
+        url: The url of the page
+        ----------
+        Returns: The text of the page, None when the page doesn't exist (or isn't cached in offline mode)
+        """
+        # The cache is read and written in a thread so the disk doesn't hold up the other requests
+        entry = await asyncio.to_thread(self.cache.lookup, url) if self.cache is not None else None
+        if entry is not None and self.cache.isFresh(entry):
+            return await asyncio.to_thread(self.cache.read, entry)
+        if self.cache is not None and self.cache.offline:
+            return None
+
+        headers = dict(self.headers, **(self.cache.conditionalHeaders(entry) if self.cache is not None else {}))
+        for attempt in range(self.max_retries + 1):
+            # The token is taken before the slot so requests waiting on the rate don't hold slots other hosts could use
+            await self.bucket(url).acquire()
+            async with self.semaphore:
+                try:
+                    response = await asyncio.to_thread(self.get, url, headers)
+                except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                    response = None
+
+            if response is not None:
+                if response.status_code == 200:
+                    if self.cache is not None:
+                        await asyncio.to_thread(self.cache.store, url, response.text, response.headers)
+                    return response.text
+                if response.status_code == 304 and entry is not None:
+                    return await asyncio.to_thread(self.cache.revalidated, url, entry)
+                if response.status_code in [400, 404]:
+                    return None
+                if response.status_code not in RETRY_STATUS:
+                    raise RuntimeError('Unexpected status %i for %s' % (response.status_code, url))
+
+            delay = self.retryDelay(response, attempt)
+            if response is not None and response.status_code == 429:
+                print('RateLimit, waiting %.0f seconds' % delay)
+                self.bucket(url).pause(delay)
+            await asyncio.sleep(delay)
+        raise RuntimeError('Gave up on %s after %i attempts' % (url, self.max_retries + 1))
+
+    async def crawlAct(self, play, act):
+        """
+        Download the scenes of an act in order until a scene is missing
+        """
+        pages = []
+        for scene in range(1, MAX_SCENES + 1):
+            page = await self.fetch(self.url_base % (play, act, scene))
+            if page is None:
+                break
+            pages.append((act, scene, page))
+        return pages
+
+    async def crawlPlay(self, play):
+        """
+        Download the scenes of a play, the acts are downloaded at the same time
+        ...
+        Returns
+        ----------
+         > A tuple of the play and a list of (act, scene, page) in act and scene order
+        """
+        acts = await asyncio.gather(*[self.crawlAct(play, act) for act in range(1, ACTS + 1)])
+        return play, [page for pages in acts for page in pages]
+
+    async def crawl(self, plays, callback):
+        """
+        Download the plays at the same time, handing each play to the callback (in a thread) as soon as it is complete
+        """
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.buckets = {}
+        for future in asyncio.as_completed([self.crawlPlay(play) for play in plays]):
+            play, pages = await future
+            await asyncio.to_thread(callback, play, pages)
+
+    def crawlPlays(self, plays, callback):
+        """
+        Download the scene pages of a list of plays
+        ...
+        Parameters
+        ----------
+        plays: The plays to download (the keys of PLAYS)
+        callback: Called with the play and its list of (act, scene, page) once the play is downloaded
+        ----------
+        Example: NoFearCrawler(URL_BASE).crawlPlays(['othello'], getNoFearData)
+        """
+        asyncio.run(self.crawl(plays, callback))
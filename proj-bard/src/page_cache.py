@@ -0,0 +1,124 @@
+##!/usr/bin/env python
+"""
+    An on disk cache of the downloaded pages.  The page bodies are stored gzipped under the sha256 of their content (so a page
+    that didn't change isn't stored twice) and each url has a small json entry with the hash of its body and the ETag and
+    Last-Modified headers used to revalidate it.  In offline mode the cache answers every request and a url that isn't cached
+    is treated as missing, which lets the plays be parsed again without the network.
+    ...
+    Classes
+    __________
+    PageCache(cache_dir, offline, max_age) : lookup(url), read(entry), store(url, text, headers), revalidated(url, entry)
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2021 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+def writeAtomic(path, data):
+    """
+    Write a file through a temporary file so a crawl that is stopped never leaves a partial file
+    """
+    tmp_path = path.with_name('%s.%i.%i.tmp' % (path.name, os.getpid(), threading.get_ident()))
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class PageCache(object):
+
+    def __init__(self, cache_dir, offline = False, max_age = None):
+        '''
+        The page cache
+        ...
+        Parameters
+        ----------
+        cache_dir: The directory of the cache
+        offline: Only answer from the cache, never from the network
+        max_age: The seconds a cached page is used without revalidating it, every page is revalidated if None
+        '''
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self.max_age = max_age
+        self.url_dir = cache_dir.joinpath('urls')
+        self.body_dir = cache_dir.joinpath('bodies')
+        self.url_dir.mkdir(parents = True, exist_ok = True)
+        self.body_dir.mkdir(parents = True, exist_ok = True)
+
+    def entryPath(self, url):
+        """
+        The path of the json entry of a url
+        """
+        return self.url_dir.joinpath('%s.json' % hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def lookup(self, url):
+        """
+        Get the cache entry of a url, None if the url isn't cached
+        """
+        path = self.entryPath(url)
+        if not path.exists():
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def isFresh(self, entry):
+        """
+        Whether a cached page can be used without revalidating it
+        """
+        return self.offline or (self.max_age is not None and time.time() - entry['checked'] < self.max_age)
+
+    def read(self, entry):
+        """
+        Read the body of a cached page
+        """
+        with gzip.open(self.body_dir.joinpath('%s.html.gz' % entry['sha256']), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def conditionalHeaders(self, entry):
+        """
+        The headers that revalidate a cached page, the server answers 304 when the page is unchanged
+        """
+        headers = {}
+        if entry is not None and entry.get('etag') is not None:
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry.get('last_modified') is not None:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, text, headers):
+        """
+        Store a downloaded page
+        ...
+        Parameters
+        ----------
+        url: The url of the page
+        text: The body of the page
+        headers: The response headers
+        """
+        data = text.encode('utf-8')
+        sha = hashlib.sha256(data).hexdigest()
+        body_path = self.body_dir.joinpath('%s.html.gz' % sha)
+        if not body_path.exists():
+            writeAtomic(body_path, gzip.compress(data))
+
+        entry = {'url': url, 'sha256': sha, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified'),
+                 'fetched': time.time(), 'checked': time.time()}
+        writeAtomic(self.entryPath(url), json.dumps(entry).encode('utf-8'))
+
+    def revalidated(self, url, entry):
+        """
+        Record that a cached page was revalidated (the server answered 304) and return its body
+        """
+        entry['checked'] = time.time()
+        writeAtomic(self.entryPath(url), json.dumps(entry).encode('utf-8'))
+        return self.read(entry)
@@ -0,0 +1,142 @@
+##!/usr/bin/env python
+"""
+    The parser of a No Fear scene page.  Each row of the scene tables gives the modern and original text and speakers of a
+    line.  The page is walked once with lxml and compiled XPath, and each cell is walked once to find its text.
+    ...
+    Functions
+    __________
+    extractRow(row) -> text: Using a table row, get the proper text from the play
+    parseScene(page) -> rows: The rows of a scene
+
+    tests/test_scene_parser.py checks the rows match the BeautifulSoup parser the scenes were parsed with before, on the
+    fixture pages and on the cached pages when NOFEAR_HTML_CACHE is set.
+"""
+import re
+from lxml import etree, html
+from unidecode import unidecode
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2021 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+# Constants
+DIGITS = re.compile('[0-9]+')
+# The rows of the tables that aren't inside another table, in page order
+SCENE_ROWS = etree.XPath('//table[not(ancestor::table)]//tr')
+TIME_PERIODS = ['modern','original']
+CELL_CLASS = dict((time_pd, 'noFear__cell noFear__cell--%s' % time_pd) for time_pd in TIME_PERIODS)
+STAGE_CLASSES = dict((time_pd, set(['noFear__stage noFear__stage--%s' % time_pd,
+                                   'noFear__stage noFear__stage--%s noFear__stage--hasLineNumber' % time_pd]))
+                     for time_pd in TIME_PERIODS)
+LINE_CLASSES = dict((time_pd, set(['noFear__line noFear__line--%s' % time_pd,
+                                  'noFear__line noFear__line--%s noFear__line--hasLineNumber' % time_pd]))
+                    for time_pd in TIME_PERIODS)
+
+def textOf(element):
+    """
+    The text of an element and its children, comments have no text
+    """
+    if not isinstance(element.tag, str):
+        return ''
+    return ''.join(element.itertext())
+
+def classOf(element):
+    """
+    The class attribute of an element with its whitespace normalized
+    """
+    return ' '.join(element.get('class', '').split())
+
+def joinWords(pieces):
+    """
+    Join the words of a list of texts with single spaces, unidecode them and remove the line numbers
+    """
+    return DIGITS.sub('', unidecode(' '.join(word for piece in pieces for word in piece.split())))
+
+def emPieces(em):
+    """
+    The texts of the children of an em element in order (its text, then each child and the text that follows it)
+    """
+    pieces = [em.text or '']
+    for child in em:
+        pieces.append(textOf(child))
+        pieces.append(child.tail or '')
+    return pieces
+
+def extractCell(cell, time_pd):
+    """
+    Get the text and speaker of the cell of one time period of a row with a single pass over the cell
+    """
+    stage, lines, line_tags, speaker, em = [], [], [], None, None
+    for element in cell.iter(tag = etree.Element):
+        tag = element.tag
+        if tag == 'div':
+            cls = classOf(element)
+            if cls in STAGE_CLASSES[time_pd]:
+                stage.append(element)
+            elif cls in LINE_CLASSES[time_pd]:
+                lines.append(element)
+        elif tag == 'p' and speaker is None and 'noFear__speaker' in element.get('class', '').split():
+            speaker = element
+        elif tag == 'line':
+            line_tags.append(element)
+        elif tag == 'em' and em is None:
+            em = element
+
+    if len(stage) > 0:
+        return joinWords(textOf(x) for x in stage), 'STAGE_TEXT'
+
+    speaker = 'INTERRUPTED_SPEACH' if speaker is None else textOf(speaker).strip()
+    if len(lines) > 0:
+        return joinWords(textOf(x) for x in lines), speaker
+    if len(line_tags) > 0:
+        return joinWords(textOf(x) for x in line_tags), speaker
+    if em is not None:
+        return joinWords(emPieces(em)), 'STAGE_TEXT'
+    return unidecode(textOf(cell)), 'STAGE_TEXT'
+
+def extractRow(row):
+    '''
+    Takes a row of the page table and extracts the correct speaker, both modern and not for the dataset.
+    ...
+    Parameters
+    ----------
+    row: An lxml tr element to be processed.
+    ----------
+    Returns: Four Strings with the below order, all None for title rows and rows without an original cell.  A row without a
+    modern cell has empty modern text and the original speaker
+        1. Modern Play Text
+        2. Original Play Text
+        3. Modern Play Speaker
+        4. Original Play Speaker
+    '''
+    tds = list(row.iter('td'))
+    classes = set(cls for td in tds for cls in td.get('class', '').split())
+    if 'noFear__cell--title' in classes or len(classes) == 0:
+        return None, None, None, None
+
+    modern, original = [next((td for td in tds if classOf(td) == CELL_CLASS[time_pd]), None) for time_pd in TIME_PERIODS]
+    if original is None:
+        return None, None, None, None
+    orig_txt, orig_speaker = extractCell(original, 'original')
+    if modern is None:
+        return '', orig_txt, orig_speaker, orig_speaker
+    mod_txt, mod_speaker = extractCell(modern, 'modern')
+    return mod_txt, orig_txt, mod_speaker, orig_speaker
+
+def parseScene(page):
+    """
+    Parse the rows of a scene page with lxml
+    ...
+    Parameters
+    ----------
+    page: The html of the scene page
+    ----------
+    Returns: A list of the (modern text, original text, modern speaker, original speaker) of each table row
+    """
+    return [extractRow(row) for row in SCENE_ROWS(html.document_fromstring(page))]
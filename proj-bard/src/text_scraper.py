@@ -4,33 +4,35 @@
     ...
     Functions
     __________
-    api_call(url, headers) -> response: This function moderates all of the api calls
-    extractTextFromTable(tbl_row) -> text: Using a table cell, get the proper text from the play
-    getNoFearData(play) : Iterate through all of the acts/scenes in an associated play
+    getNoFearData(play, pages) : Iterate through all of the acts/scenes in an associated play
+    formatPlayRows(play, scenes) -> lines: Number the parsed rows of the scenes of a play
+    reparsePlays(plays) : Parse the cached pages of the plays across a process pool
     applyThemesToPlays() : Taking predefined themes, apply them to the plays and datasets
 
 
+    The scene pages are downloaded by the NoFearCrawler (crawler.py), which crawls the plays at the same time while rate
+    limiting the requests to sparknotes.  Set NOFEAR_URL_BASE to crawl another host (i.e. a local copy of the pages).  The
+    pages are kept in a PageCache (page_cache.py) and revalidated on later downloads, the reparse option parses the cached
+    pages again without the network (i.e. after a change to the parser) and parses the plays across a
+    process pool.  The rows of a scene are parsed by parseScene (scene_parser.py).
+
     The processed data gets dumped into json file as well as a mongodb database for easier querying.  The mongodb commands used to create the 
     collection are below
     create > db.createCollection("collected_works", {storageEngine : {wiredTiger :{configString :'block_compressor=zstd'}}})
     ix > db.collected_works.createIndex({"PLAY":"text","ACT":1, "SCENE":1, "ACTION_NBR": 1}, {sparse: true})
 
 """
-from curses import raw
 from pathlib import Path
-import requests
 import os
 import json
-import time
 import sys
-from bs4 import BeautifulSoup
-import random
-from unidecode import unidecode
-from random import randrange
-from string import digits
 import re
-from fuzzywuzzy import fuzz
+from concurrent.futures import ProcessPoolExecutor
 import pymongo
+from theme_matcher import PlayMatchIndex
+from crawler import NoFearCrawler
+from page_cache import PageCache
+from scene_parser import parseScene
 
 __author__ = "Dylan Smith"
 __copyright__ = "Copyright (C) 2021 Dylan Smith"
@@ -44,9 +46,10 @@ __status__ = "Development"
 
 # Constants
 PROJ = Path(__file__).resolve().parent.parent.parent
-URL_BASE = 'https://www.sparknotes.com/nofear/shakespeare/%s/act-%i-scene-%i/'
+URL_BASE = os.environ.get('NOFEAR_URL_BASE', 'https://www.sparknotes.com/nofear/shakespeare/%s/act-%i-scene-%i/')
 PROC_DATA = PROJ.joinpath('data','bard', 'processed')
 RAW_DATA = PROJ.joinpath('data','bard', 'raw','no-fear')
+HTML_CACHE = PROJ.joinpath('data','bard', 'raw','no-fear-html')
 
 # HERNY 5 has prologue, Romeo and Juliet has a prologue # Taming of Shrew has Introduction, # Tempest has an epilogue
 # Problem w. Henry 5 Act 3 scene 7
@@ -79,193 +82,95 @@ PLAYS = {'antony': 'antony-and-cleopatra',
 HEADERS = {'User-agent': 'my-app/0.0.1'}
 REGEX = re.compile('[^a-zA-Z]')
 
-# MongoDB Constants
+# MongoDB Constants, the client connects on first use (the collection is compacted before the themes are applied)
 MONGO = pymongo.MongoClient("mongodb://127.0.0.1:27017")['shakespeare']
-MONGO.command( "compact", 'collected_works')
 WORKS_COL = MONGO['collected_works']
 
-def api_call(url, headers):
-    """ 
-    The function that calls the api for both the history and fundamental information
+def getNoFearData(play, pages = None):
+    """   
+    Function that formats the No Fear Shakespeare pages of a play from sparknotes into json
     ...
     Parameters
     ----------
-    url: The play to download from the source
-    headers: API Headers to pass on the request call
-    ----------
-    Example: api_call(url = '', headers = HEADERS)
+    play: The play to download from the source
+    pages: A list of the (act, scene, page text) of the play in order, the play is downloaded if None
     ----------
-    Returns: content from an api call
+    Example: getNoFearData(play = 'othello')
     """
-    while True:
-        try: #iterate through and if a timeout exception is reached, try again
-            api_data = requests.get(url, headers= headers, timeout=(10, 30))
-            break
-        except requests.exceptions.Timeout:
-            pass
-        except requests.exceptions.ConnectionError:
-            pass
+    if pages is None:
+        NoFearCrawler(URL_BASE, headers = HEADERS, cache = PageCache(HTML_CACHE)).crawlPlays([play], getNoFearData)
+        return
 
-    while api_data.status_code != 200:
-        if api_data.status_code == 400:
-            return 'Bad Call'
-        if api_data.status_code == 404:
-            print("Error webpage not found")
-            return None
-        elif api_data.status_code == 429:
-            print('RateLimit')
-            time.sleep(20)
-        
-        #recall the api request
-        time.sleep(2)
-
-        api_data = requests.get(url, headers= headers, timeout=(10, 30))
-    
-    return api_data
+    writePlayData(play, formatPlayRows(play, ((act, scene, parseScene(doc_text)) for act, scene, doc_text in pages)))
 
-
-def extractTextFromTable(tbl_row):
-    '''
-    Takes the row extracted from the page table and extracts the correct speaker, both modern and not for the dataset.
+def formatPlayRows(play, scenes):
+    """
+    Number the parsed rows of the scenes of a play and fill in the speakers of the interrupted speaches
     ...
     Parameters
     ----------
-    tbl_row: An beautifulsoup row to be processed.
-    ----------
-    Example: extractTextFromTable(tbl_row = row)
+    play: The play the scenes are from
+    scenes: The (act, scene, rows) of the play in act and scene order, with the rows parseScene returns for the scene
     ----------
-    Returns: Four Strings with the below order
-        1. Modern Play Text
-        2. Original Play Text
-        3. Modern Play Speaker
-        4. Original Play Speaker
-    '''
+    Returns: A list with the dictionary of each line of the play
+    """
+    line_nbr, action_nbr = 0 , 0
+    play_txt, play_nm = [], PLAYS[play].upper()
+    LAST_ORIG_SPEAKER, LAST_MOD_SPEAKER = '', ''
 
-    speakers = []
-    txt_out = []
-    # Check if a title, if so, skip out
-    classes = list(set([y for x in [x['class'] for x in tbl_row.find_all('td')] for y in x]))
+    for act, scene, rows in scenes:
+        print('Formatting data for %s Act %i, Scene %i' % (play, act, scene))
+        for MOD_TXT, ORIG_TXT, MOD_SPEAKER, ORIG_SPEAKER in rows:
+            if ORIG_TXT is None or len(ORIG_TXT) == 0:
+                continue
 
-    if 'noFear__cell--title' in classes or len(classes) == 0:
-        return None, None, None, None
+            # increment value number
+            action_nbr +=1
+            if ORIG_SPEAKER not in ['INTERRUPTED_SPEACH','STAGE_TEXT']:
+                LAST_ORIG_SPEAKER = ORIG_SPEAKER
+                LAST_MOD_SPEAKER = MOD_SPEAKER
 
-    for time_pd in ['modern','original']:
-        # Iterate between modern and non-modern text
-        cell = tbl_row.find('td', {'class': 'noFear__cell noFear__cell--%s' %  time_pd})
-        
-        
-        # first check if this is a stage value
-        txt_vals = cell.find_all('div',{'class': ['noFear__stage noFear__stage--%s' %  time_pd, 
-                                                  'noFear__stage noFear__stage--%s noFear__stage--hasLineNumber' %  time_pd]})
+            if ORIG_SPEAKER != 'STAGE_TEXT':
+                line_nbr +=1
 
-        if len(txt_vals) == 0:
-            # check if value is speaker, if the speach was interupted there will be no speaker
-            speaker = cell.find('p', {'class':'noFear__speaker'})
-            if speaker is None:
-                speaker = 'INTERRUPTED_SPEACH'
-            else:
-                speaker = speaker.get_text().strip()
+            if ORIG_SPEAKER == 'INTERRUPTED_SPEACH':
+                ORIG_SPEAKER = LAST_ORIG_SPEAKER
+                MOD_SPEAKER = LAST_MOD_SPEAKER
 
-            txt_vals = cell.find_all('div',{'class': ['noFear__line noFear__line--%s' %  time_pd,
-                                                  'noFear__line noFear__line--%s noFear__line--hasLineNumber' %  time_pd]})
-            
-            # Some lines are dropped, get normal lines
-            if len(txt_vals) == 0:
-                txt_vals = cell.find_all('line')
-            
-            if len(txt_vals) == 0:
-                txt_vals = cell.find('em')
-                speaker = 'STAGE_TEXT'
-        else:
-            speaker = 'STAGE_TEXT'
-        
-        if txt_vals is None:
-            txt = unidecode(cell.get_text())
-        else:
-            txt = re.sub('[0-9]+', '',unidecode(" ".join([y for x in [x.get_text().split() for x in txt_vals] for y in x])))
-    
-        txt_out.append(txt)
-        speakers.append(speaker)
+            play_txt.append({'PLAY': play_nm, 'ACT': act, 'SCENE': scene,
+                             'LINE_NBR': line_nbr if ORIG_SPEAKER != 'STAGE_TEXT' else 0,
+                             'ORIGINAL_TEXT': ORIG_TXT, 'ORIGINAL_SPEAKER': ORIG_SPEAKER,
+                             'MODERN_TEXT': MOD_TXT, 'MODERN_SPEAKER': MOD_SPEAKER,
+                             'ACTION_NBR': action_nbr})
+    return play_txt
 
-    return txt_out[0], txt_out[1] , speakers[0], speakers[1]
-     
+def writePlayData(play, play_txt):
+    """
+    Write the lines of a play to its json file
+    """
+    with open(RAW_DATA.joinpath('%s.json' % (PLAYS[play].upper())), 'w') as f:
+        json.dump(play_txt, f)
 
-def getNoFearData(play):
-    """   
-    Function that downloades the No Fear Shakespeare data from sparknotes and formats the data into json
+def reparsePlays(plays, max_workers = None):
+    """
+    Parse the cached pages of the plays again, each play is handed to a process pool as soon as its pages are read from the
+    cache, so only the plays waiting on a process are held in memory
     ...
     Parameters
     ----------
-    play: The play to download from the source
+    plays: The plays to parse (the keys of PLAYS)
+    max_workers: The number of processes parsing the plays, the number of cpus if None
     ----------
-    Example: getNoFearData(play = 'othello')
+    Example: reparsePlays(plays = ['othello'])
     """
-    line_nbr, action_nbr = 0 , 0
-    play_txt, line_txt = [], {"PLAY":PLAYS[play].upper()}
-    LAST_ORIG_SPEAKER, LAST_MOD_SPEAKER = '', ''
-
-    # TODO: Update the download script to capture the change in the 
-    for act in range(1,6):
-        line_txt['ACT'] = act
-        for scene in range(1,25):
-            line_txt['SCENE'] = scene
-            url = URL_BASE  % (play, act, scene)
-            time.sleep(randrange(20))
-            
-            #format text from Beautiful Soup
-            doc_text = api_call(url, HEADERS)
-            if doc_text is None:
-                break
-            
-            print('Formatting data for Act %i, Scene %i' % (act, scene))
-            soup = BeautifulSoup(doc_text.text, "lxml")
-            
-            #with open(PROC_DATA.joinpath('test_file.txt'), 'w', encoding='utf-8') as f_out:
-            #    f_out.write(soup.prettify())
-            #with open(PROC_DATA.joinpath('test_file.txt')) as f:
-            #    soup = BeautifulSoup(f.read())
-            
-            # Extract the tables from the object and define the required classes
-            tables = soup.findAll("table")
-            for table in tables:
-                if table.findParent("table") is None:
-                    rows = table.find_all("tr")
-                    for row in rows:
-                        # Get the speaker from the cell
-                        MOD_TXT, ORIG_TXT, MOD_SPEAKER, ORIG_SPEAKER  = extractTextFromTable(tbl_row= row)
-                        
-                        if ORIG_TXT is None or len(ORIG_TXT) == 0:
-                            continue
-
-                        # increment value number
-                        action_nbr +=1
-                        if ORIG_SPEAKER not in ['INTERRUPTED_SPEACH','STAGE_TEXT']:
-                            LAST_ORIG_SPEAKER = ORIG_SPEAKER
-                            LAST_MOD_SPEAKER = MOD_SPEAKER
-                            
-
-                        if ORIG_SPEAKER != 'STAGE_TEXT':
-                            line_nbr +=1
-                            line_txt['LINE_NBR'] = line_nbr
-                        else:
-                            line_txt['LINE_NBR'] = 0
-                        
-                        if ORIG_SPEAKER == 'INTERRUPTED_SPEACH':
-                            ORIG_SPEAKER = LAST_ORIG_SPEAKER
-                            MOD_SPEAKER = LAST_MOD_SPEAKER
-
-                        # Define values in the dictionary
-                        line_txt['ORIGINAL_TEXT'] = ORIG_TXT
-                        line_txt['ORIGINAL_SPEAKER'] = ORIG_SPEAKER
-                        line_txt['MODERN_TEXT'] = MOD_TXT
-                        line_txt['MODERN_SPEAKER'] = MOD_SPEAKER
-                        
-                        line_txt['ACTION_NBR'] = action_nbr
-
-                        play_txt.append(line_txt.copy())
-
-    with open(RAW_DATA.joinpath('%s.json' % (PLAYS[play].upper())), 'w') as f:
-        json.dump(play_txt, f)
+    cache = PageCache(HTML_CACHE, offline = True)
+    with ProcessPoolExecutor(max_workers = max_workers) as executor:
+        # A play's scenes are numbered in order in one process, the plays are parsed at the same time
+        futures = []
+        NoFearCrawler(URL_BASE, headers = HEADERS, cache = cache).crawlPlays(plays,
+                      lambda play, pages: futures.append(executor.submit(getNoFearData, play, pages)))
+        for future in futures:
+            future.result()
 
 def applyThemesToPlays():
     """ 
@@ -278,6 +183,8 @@ def applyThemesToPlays():
     ----------
     Example: applyThemesToPlays()
     """
+    MONGO.command( "compact", 'collected_works')
+
     # Download both the shakespeare plays and the themes.
     with open(PROC_DATA.joinpath('themes.json'), 'r', encoding="utf-8") as f:
         themes = json.load(f)
@@ -295,49 +202,23 @@ def applyThemesToPlays():
             play_text = json.load(f)
         
         if play_nm in themes.keys():
-            # Iterate over all the different themes
-            for theme in themes[play_nm].keys():
-    
-                # Go through all the different quotes in the plays
-                for quote in themes[play_nm][theme]:
-                    quotes_base = ''.join([i for i in quote if i.isalpha()])
-                    len_quote = len(quote.split(' '))
-                    found = False
-
-                    # go through each row in the play
-                    for row in play_text:
-                        # With the quote stripped try to match the quote with the associated value
-                        row_stripped = ''.join([i for i in row['ORIGINAL_TEXT'].lower() if i.isalpha()])
-                        if quote.lower() in row['ORIGINAL_TEXT'].lower() or quotes_base.lower() in row_stripped:
-                            if "THEME" in row.keys():
-                                row['THEME'].append(theme)
-                            else:
-                                row['THEME'] = [theme]
-                                found = True
-                                break
-                    
-                    if found:
-                        continue
-
-                    # if the quote isn't found above, go through the play again and use fuzzy matching to get the most likely match from the plays
-                    max_match = 0
-                    for row in play_text:
-                        len_line = len(row['ORIGINAL_TEXT'].split(' '))
-                        if len_quote > 1.1 * len_line:
-                            continue
-                        for i in range(0,len_line - len_quote):
-                            quote_check = ' '.join(row['ORIGINAL_TEXT'].split(' ')[i: i + len_quote])
-                            if fuzz.ratio(quote_check, quote) > max_match:
-                                max_match = fuzz.ratio(quote_check, quote)
-                                line_found = row['LINE_NBR']
-                    
-                    # Go through all of the plays and associate the theme with the line number in the play
-                    for row in play_text:
-                        if row['LINE_NBR'] == line_found:
-                            if "THEME" in row.keys():
-                                row['THEME'].append(theme)
-                            else:
-                                row['THEME'] = [theme]
+            # Index the lines of the play once and match all of its quotes against the index
+            index = PlayMatchIndex(play_text)
+            theme_quotes = [(theme, quote) for theme in themes[play_nm].keys() for quote in themes[play_nm][theme]]
+            matches = index.matchAll([quote for _, quote in theme_quotes])
+
+            # Associate the theme with the matched line in the play
+            unmatched = []
+            for (theme, quote), pos in zip(theme_quotes, matches):
+                if pos is None:
+                    unmatched.append(quote)
+                elif "THEME" in play_text[pos].keys():
+                    play_text[pos]['THEME'].append(theme)
+                else:
+                    play_text[pos]['THEME'] = [theme]
+
+            if len(unmatched) > 0:
+                print('%i quotes could not be matched to a line: %s' % (len(unmatched), unmatched))
 
         # Write to a cleansed json file
         with open(PROC_DATA.joinpath('no-fear',"%s.json" % play_nm), 'w') as f:
@@ -350,17 +231,17 @@ def applyThemesToPlays():
 def main():
     # Specify whether we are downloading the text data or applying the themes
     process = sys.argv[1]
-    if process not in ['download','cleanse_themes','download_and_cleanse']:
-        print("Please input a valid runtime option (download, cleanse_themes or download_and_cleanse)")
+    if process not in ['download','reparse','cleanse_themes','download_and_cleanse']:
+        print("Please input a valid runtime option (download, reparse, cleanse_themes or download_and_cleanse)")
         return 
 
-    if process in ['download','download_and_cleanse']:
-        for play in PLAYS.keys():
-            if play in ['antony','hamlet', 'macbeth']:
-                continue
-            
-            print('Downloading the data for Play %s' % play)
-            getNoFearData(play)
+    if process in ['download','reparse','download_and_cleanse']:
+        plays = [play for play in PLAYS.keys() if play not in ['antony','hamlet', 'macbeth']]
+        print('%s the data for the plays %s' % ('Parsing the cached' if process == 'reparse' else 'Downloading', ', '.join(plays)))
+        if process == 'reparse':
+            reparsePlays(plays)
+        else:
+            NoFearCrawler(URL_BASE, headers = HEADERS, cache = PageCache(HTML_CACHE)).crawlPlays(plays, getNoFearData)
 
     if process == 'cleanse_themes':
         applyThemesToPlays()
@@ -0,0 +1,191 @@
+##!/usr/bin/env python
+"""
+    An index over the lines of a play used to find the lines the theme quotes come from.  The index is built once per play:
+    the letters of each line and a character shingle index, which finds the lines that can contain a quote exactly and picks
+    the few lines that are fuzzy scored when a quote isn't found exactly.  When none of those lines scores well (i.e. a short
+    quote with a typo shares no shingle with its line) every line long enough to hold the quote is scored like before.
+    ...
+    Classes
+    __________
+    PlayMatchIndex(play_text) : The index of a play, match(quote) and matchAll(quotes) return the positions of the lines
+"""
+from collections import Counter, defaultdict
+import math
+from fuzzywuzzy import fuzz
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2021 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+# Constants
+SHINGLE_SIZE = 4
+SHINGLES_CHECKED = 3
+FUZZY_CANDIDATES = 50
+# The fuzz ratio below which the best candidate line is not trusted and every line is scored
+FUZZY_FALLBACK_RATIO = 75
+
+def letters(text):
+    """
+    The lower case letters of a text, the quotes and lines are compared without spaces or punctuation
+    """
+    return ''.join(filter(str.isalpha, text.lower()))
+
+class PlayMatchIndex(object):
+
+    def __init__(self, play_text, shingle_size = SHINGLE_SIZE, candidates = FUZZY_CANDIDATES, fallback_ratio = FUZZY_FALLBACK_RATIO):
+        '''
+        Build the match index of a play
+        ...
+        Parameters
+        ----------
+        play_text: The rows of the play with the ORIGINAL_TEXT of each line
+        shingle_size: The number of letters in a shingle of the exact match index
+        candidates: The number of lines fuzzy scored for a quote that isn't found exactly
+        fallback_ratio: The fuzz ratio of the best candidate below which every line is scored
+        '''
+        self.shingle_size = shingle_size
+        self.candidates = candidates
+        self.fallback_ratio = fallback_ratio
+        self.lines = [row['ORIGINAL_TEXT'] for row in play_text]
+        self.letters = [letters(line) for line in self.lines]
+        self.line_words = [line.split(' ') for line in self.lines]
+
+        self.shingles = defaultdict(set)
+        for pos, line_letters in enumerate(self.letters):
+            for shingle in self.lineShingles(line_letters):
+                self.shingles[shingle].add(pos)
+
+    def lineShingles(self, text_letters):
+        """
+        The set of shingles of the letters of a text
+        """
+        return set(text_letters[i: i + self.shingle_size] for i in range(len(text_letters) - self.shingle_size + 1))
+
+    def exactMatch(self, quote):
+        """
+        Find the first line that holds the letters of the quote
+        ...
+        Parameters
+        ----------
+        quote: The quote to find
+        ...
+        Returns
+        ----------
+         > The position of the line or None
+        """
+        quote_letters = letters(quote)
+        shingles = self.lineShingles(quote_letters)
+        if len(shingles) == 0:
+            candidates = range(len(self.lines))
+        else:
+            # A line holding the quote holds all its shingles, so the rarest few are enough to narrow the lines down
+            rarest = sorted(shingles, key = lambda x: len(self.shingles.get(x, ())))[:SHINGLES_CHECKED]
+            candidates = sorted(set.intersection(*[self.shingles.get(x, set()) for x in rarest]))
+
+        for pos in candidates:
+            if quote_letters in self.letters[pos]:
+                return pos
+        return None
+
+    def fittingLines(self, quote):
+        """
+        The lines that are long enough to hold a quote
+        """
+        len_quote = len(quote.split(' '))
+        return [pos for pos in range(len(self.lines)) if len_quote <= 1.1 * len(self.line_words[pos])]
+
+    def candidateLines(self, quote):
+        """
+        The lines that share the most (inverse document frequency weighted) shingles with a quote and are long enough to hold
+        it, every line that is long enough when the quote shares no shingles with the play (i.e. very short quotes)
+        """
+        len_quote = len(quote.split(' '))
+        scores = Counter()
+        for shingle in self.lineShingles(letters(quote)):
+            postings = self.shingles.get(shingle, ())
+            if len(postings) > 0:
+                weight = math.log(1 + len(self.lines) / len(postings))
+                for pos in postings:
+                    scores[pos] += weight
+
+        if len(scores) == 0:
+            return self.fittingLines(quote)
+
+        candidates = [pos for pos, _ in sorted(scores.items(), key = lambda x: (-x[1], x[0]))
+                        if len_quote <= 1.1 * len(self.line_words[pos])]
+        return candidates[:self.candidates]
+
+    def scoreLines(self, quote, positions):
+        """
+        Find the line with the window of words closest to the quote among a list of lines
+        ...
+        Parameters
+        ----------
+        quote: The quote to find
+        positions: The positions of the lines to score
+        ...
+        Returns
+        ----------
+         > A tuple of the position of the first line with the best window and its fuzz ratio, (None, 0) if no line scores
+        """
+        len_quote = len(quote.split(' '))
+        best, max_match = None, 0
+        for pos in sorted(positions):
+            line_words = self.line_words[pos]
+            for i in range(max(len(line_words) - len_quote, 0) + 1):
+                ratio = fuzz.ratio(' '.join(line_words[i: i + len_quote]), quote)
+                if ratio > max_match:
+                    best, max_match = pos, ratio
+        return best, max_match
+
+    def fuzzyMatch(self, quote):
+        """
+        Find the line with the window of words closest to the quote.  The candidate lines are scored first, and every line
+        long enough to hold the quote is scored when the best candidate is below the fallback ratio
+        ...
+        Parameters
+        ----------
+        quote: The quote to find
+        ...
+        Returns
+        ----------
+         > A tuple of the position of the line and the fuzz ratio, (None, 0) when no line can hold the quote
+        """
+        candidates = self.candidateLines(quote)
+        best, max_match = self.scoreLines(quote, candidates)
+        if max_match < self.fallback_ratio:
+            best, max_match = self.scoreLines(quote, self.fittingLines(quote))
+        return best, max_match
+
+    def match(self, quote):
+        """
+        Find the line of a quote, exactly if possible and otherwise by fuzzy matching
+        """
+        pos = self.exactMatch(quote)
+        if pos is not None:
+            return pos
+        return self.fuzzyMatch(quote)[0]
+
+    def matchAll(self, quotes):
+        """
+        Find the lines of all the quotes of a play
+        ...
+        Parameters
+        ----------
+        quotes: A list of quotes
+        ...
+        Returns
+        ----------
+         > A list with the position of the line of each quote, None for the quotes that couldn't be matched
+        """
+        matches = {}
+        for quote in quotes:
+            if quote not in matches:
+                matches[quote] = self.match(quote)
+        return [matches[quote] for quote in quotes]
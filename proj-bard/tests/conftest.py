@@ -0,0 +1,8 @@
+"""
+    Shared fixtures of the proj-bard tests.  The modules in src import each other as top level modules, so src is put on the
+    path the same way running a script from src does.
+"""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath('src')))
@@ -0,0 +1,162 @@
+"""
+    Runs the NoFearCrawler against a local http.server serving fixture scene pages.  Act 1 of a play has three scenes and the
+    other acts one, every other scene is a 404 that ends the act, and the first request of act 2 scene 1 of 'alpha' is a 429
+    with a Retry-After.  The pages have an ETag and are answered with a 304 when it matches, and 'delta' serves the same
+    pages as 'beta'.
+"""
+import asyncio
+import hashlib
+import http.server
+import json
+import re
+import threading
+import time
+import pytest
+
+pytest.importorskip('requests')
+from crawler import ACTS, NoFearCrawler, TokenBucket
+from page_cache import PageCache
+
+RETRY_AFTER = 1
+LIMITED_PATH = '/alpha/act-2-scene-1/'
+PLAYS = ['alpha', 'beta']
+ALIASES = {'delta': 'beta'}
+
+def scenePage(play, act, scene):
+    return '<html><body><table><tr><td>%s %i %i</td></tr></table></body></html>' % (play, act, scene)
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.hits.append((time.monotonic(), self.path))
+        match = re.match(r'^/(\w+)/act-(\d+)-scene-(\d+)/$', self.path)
+        if match is None or ALIASES.get(match.group(1), match.group(1)) not in PLAYS:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        if self.path == LIMITED_PATH and self.path not in self.server.limited:
+            self.server.limited.add(self.path)
+            self.send_response(429)
+            self.send_header('Retry-After', str(RETRY_AFTER))
+            self.end_headers()
+            return
+
+        play, act, scene = ALIASES.get(match.group(1), match.group(1)), int(match.group(2)), int(match.group(3))
+        if scene > (3 if act == 1 else 1):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = scenePage(play, act, scene).encode('utf-8')
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.server.not_modified.append(self.path)
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def server():
+    srv = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    srv.hits, srv.limited, srv.not_modified = [], set(), []
+    thread = threading.Thread(target = srv.serve_forever, daemon = True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+def crawl(server, plays, cache = None):
+    url_base = 'http://127.0.0.1:%i/%%s/act-%%i-scene-%%i/' % server.server_address[1]
+    crawled = {}
+    crawler = NoFearCrawler(url_base, rate = 100, burst = 10, backoff = 0.01, cache = cache)
+    crawler.crawlPlays(plays, lambda play, pages: crawled.setdefault(play, pages))
+    return crawled
+
+def expectedScenes(play):
+    play = ALIASES.get(play, play)
+    return [(act, scene, scenePage(play, act, scene)) for act in range(1, ACTS + 1) for scene in range(1, (4 if act == 1 else 2))]
+
+def test_crawl_returns_the_scenes_in_order(server):
+    crawled = crawl(server, PLAYS)
+    assert sorted(crawled) == PLAYS
+    for play in PLAYS:
+        assert crawled[play] == expectedScenes(play)
+
+def test_missing_scene_ends_the_act(server):
+    crawl(server, ['beta'])
+    paths = [path for _, path in server.hits]
+    # Each act stops at its first 404, nothing after it is requested
+    assert '/beta/act-1-scene-4/' in paths
+    assert '/beta/act-1-scene-5/' not in paths
+    assert '/beta/act-2-scene-2/' in paths
+    assert '/beta/act-2-scene-3/' not in paths
+    assert len(paths) == 4 + 2 * (ACTS - 1)
+
+def test_missing_play_has_no_scenes(server):
+    assert crawl(server, ['gamma']) == {'gamma': []}
+
+def test_rate_limit_is_retried_after_retry_after(server):
+    crawled = crawl(server, ['alpha'])
+    assert crawled['alpha'] == expectedScenes('alpha')
+
+    times = [hit_time for hit_time, path in server.hits if path == LIMITED_PATH]
+    assert len(times) == 2
+    assert times[1] - times[0] >= RETRY_AFTER * 0.9
+
+def test_cache_revalidates_and_replays_offline(server, tmp_path):
+    plays = ['beta', 'delta']
+    n_pages = len(expectedScenes('beta'))
+    cache = PageCache(tmp_path)
+    assert crawl(server, plays, cache) == {play: expectedScenes(play) for play in plays}
+    assert server.not_modified == []
+    # The two plays have the same pages, which are stored once
+    assert len(list(cache.url_dir.iterdir())) == 2 * n_pages
+    assert len(list(cache.body_dir.iterdir())) == n_pages
+
+    entries = {entry['url']: entry['checked'] for entry in map(json.loads, (path.read_text() for path in cache.url_dir.iterdir()))}
+    assert crawl(server, plays, cache) == {play: expectedScenes(play) for play in plays}
+    assert len(server.not_modified) == 2 * n_pages
+    assert all(cache.lookup(url)['checked'] > entries[url] for url in entries)
+
+    server.shutdown()
+    server.server_close()
+    offline = PageCache(tmp_path, offline = True)
+    assert crawl(server, plays, offline) == {play: expectedScenes(play) for play in plays}
+    assert len(list(cache.body_dir.iterdir())) == n_pages
+
+def test_pause_does_not_refill_the_bucket():
+    async def acquireTwice(bucket):
+        start = time.monotonic()
+        await bucket.acquire()
+        await bucket.acquire()
+        return time.monotonic() - start
+
+    bucket = TokenBucket(rate = 10, capacity = 5)
+    bucket.updated -= 10
+    bucket.pause(0.1)
+    # Both tokens come at the rate after the pause rather than from a bucket refilled over the pause
+    assert asyncio.run(acquireTwice(bucket)) >= 0.1 + 2 / bucket.rate * 0.9
+
+def test_each_thread_has_its_own_session():
+    crawler = NoFearCrawler('http://127.0.0.1/%s/act-%i-scene-%i/')
+    sessions = []
+    threads = [threading.Thread(target = lambda: sessions.append(crawler.session())) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(map(id, sessions))) == 3
+    assert all(session.get_adapter('http://127.0.0.1') is crawler.adapter for session in sessions)
+    assert crawler.session() is crawler.session()
@@ -0,0 +1,106 @@
+"""
+    Checks that parseScene gives the same rows as the BeautifulSoup parser the scenes were parsed with before it.  The
+    parsers are compared on the fixture pages and, when NOFEAR_HTML_CACHE points at a PageCache directory, on every cached
+    page, i.e.
+        NOFEAR_HTML_CACHE=../data/bard/raw/no-fear-html python -m pytest tests/test_scene_parser.py
+"""
+from pathlib import Path
+import gzip
+import os
+import re
+import pytest
+
+pytest.importorskip('lxml')
+pytest.importorskip('unidecode')
+bs4 = pytest.importorskip('bs4')
+from unidecode import unidecode
+from scene_parser import parseScene
+
+FIXTURES = Path(__file__).resolve().parent.joinpath('fixtures', 'scenes')
+
+def soupRow(tbl_row):
+    """
+    The BeautifulSoup parser of a table row the lxml parser replaced, kept here as the reference it is checked against
+    """
+    speakers = []
+    txt_out = []
+    classes = list(set([y for x in [x['class'] for x in tbl_row.find_all('td')] for y in x]))
+
+    if 'noFear__cell--title' in classes or len(classes) == 0:
+        return None, None, None, None
+
+    for time_pd in ['modern','original']:
+        cell = tbl_row.find('td', {'class': 'noFear__cell noFear__cell--%s' %  time_pd})
+        txt_vals = cell.find_all('div',{'class': ['noFear__stage noFear__stage--%s' %  time_pd,
+                                                  'noFear__stage noFear__stage--%s noFear__stage--hasLineNumber' %  time_pd]})
+
+        if len(txt_vals) == 0:
+            speaker = cell.find('p', {'class':'noFear__speaker'})
+            if speaker is None:
+                speaker = 'INTERRUPTED_SPEACH'
+            else:
+                speaker = speaker.get_text().strip()
+
+            txt_vals = cell.find_all('div',{'class': ['noFear__line noFear__line--%s' %  time_pd,
+                                                  'noFear__line noFear__line--%s noFear__line--hasLineNumber' %  time_pd]})
+            if len(txt_vals) == 0:
+                txt_vals = cell.find_all('line')
+
+            if len(txt_vals) == 0:
+                txt_vals = cell.find('em')
+                speaker = 'STAGE_TEXT'
+        else:
+            speaker = 'STAGE_TEXT'
+
+        if txt_vals is None:
+            txt = unidecode(cell.get_text())
+        else:
+            txt = re.sub('[0-9]+', '',unidecode(" ".join([y for x in [x.get_text().split() for x in txt_vals] for y in x])))
+
+        txt_out.append(txt)
+        speakers.append(speaker)
+
+    return txt_out[0], txt_out[1] , speakers[0], speakers[1]
+
+def soupScene(page):
+    """
+    The rows of the top level tables of a page with the BeautifulSoup parser
+    """
+    soup = bs4.BeautifulSoup(page, 'lxml')
+    return [soupRow(row) for table in soup.find_all('table') if table.find_parent('table') is None
+            for row in table.find_all('tr')]
+
+def scenePages():
+    pages = [pytest.param(path.read_text(encoding = 'utf-8'), id = path.name) for path in sorted(FIXTURES.glob('*.html'))]
+    cache_dir = os.environ.get('NOFEAR_HTML_CACHE')
+    if cache_dir is not None:
+        for path in sorted(Path(cache_dir).joinpath('bodies').glob('*.html.gz')):
+            with gzip.open(path, 'rb') as f:
+                pages.append(pytest.param(f.read().decode('utf-8'), id = path.name))
+    return pages
+
+@pytest.mark.parametrize('page', scenePages())
+def test_rows_match_the_soup_parser(page):
+    assert parseScene(page) == soupScene(page)
+
+def test_fixture_rows():
+    rows = parseScene(FIXTURES.joinpath('act-1-scene-1.html').read_text(encoding = 'utf-8'))
+    assert rows[0] == (None, None, None, None)
+    assert rows[1] == ('RODERIGO and IAGO enter.', 'Enter RODERIGO and IAGO', 'STAGE_TEXT', 'STAGE_TEXT')
+    # The line numbers are dropped and the text is transliterated
+    assert rows[2][1] == 'Tush, never tell me! I take it much unkindly That thou, Iago, who hast had my purse As if the strings were thine, shouldst know of this.'
+    assert rows[2][2:] == ('RODERIGO', 'RODERIGO')
+    assert rows[3][1:] == ("'Sblood, but you will not hear me.", 'INTERRUPTED_SPEACH', 'INTERRUPTED_SPEACH')
+    assert rows[4][1:] == ('Despise me If I do not. ', 'IAGO', 'IAGO')
+    assert rows[6][1] == "Aside to Roderigo softly now"
+    assert rows[7][1] == ' Exeunt  cafe 20 '
+    assert rows[-1] == (None, None, None, None)
+
+def test_rows_missing_a_cell():
+    page = '''<table>
+        <tr><td class="noFear__cell noFear__cell--original"><p class="noFear__speaker">IAGO</p>
+            <div class="noFear__line noFear__line--original">I am not what I am.</div></td></tr>
+        <tr><td class="noFear__cell noFear__cell--modern"><div class="noFear__line noFear__line--modern">Only modern</div></td></tr>
+        <tr><td class="noFear__cell--note">A note</td></tr>
+    </table>'''
+    assert parseScene(page) == [('', 'I am not what I am.', 'IAGO', 'IAGO'), (None, None, None, None), (None, None, None, None)]
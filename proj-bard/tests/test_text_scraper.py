@@ -0,0 +1,53 @@
+"""
+    Reparses fixture scenes from an offline PageCache and checks the written play against formatPlayRows run serially over
+    the same scenes.  The scenes are the two fixture pages and the end of act 2 scene 3, which starts with an interrupted
+    speach, so the action and line numbers and the speaker of the interrupted speach carry over the scene boundaries.
+"""
+from pathlib import Path
+import json
+import pytest
+
+pytest.importorskip('lxml')
+pytest.importorskip('unidecode')
+pytest.importorskip('requests')
+pytest.importorskip('pymongo')
+import text_scraper
+from page_cache import PageCache
+from scene_parser import parseScene
+
+FIXTURES = Path(__file__).resolve().parent.joinpath('fixtures', 'scenes')
+PLAY = 'othello'
+ROW_START = '\n  <tr>\n'
+
+def fixtureScenes():
+    first, third = [FIXTURES.joinpath('%s.html' % nm).read_text(encoding = 'utf-8') for nm in ['act-1-scene-1', 'act-2-scene-3']]
+    # Only the last row of act 2 scene 3, which has no speaker
+    parts = third.split(ROW_START)
+    second = parts[0] + ROW_START + parts[-1]
+    return [(1, 1, first), (2, 1, second), (2, 2, third)]
+
+def test_reparse_matches_serial_format(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_scraper, 'HTML_CACHE', tmp_path.joinpath('cache'))
+    monkeypatch.setattr(text_scraper, 'RAW_DATA', tmp_path.joinpath('raw'))
+    text_scraper.RAW_DATA.mkdir()
+    cache = PageCache(text_scraper.HTML_CACHE)
+    for act, scene, page in fixtureScenes():
+        cache.store(text_scraper.URL_BASE % (PLAY, act, scene), page, {})
+
+    text_scraper.reparsePlays([PLAY], max_workers = 2)
+    with open(text_scraper.RAW_DATA.joinpath('%s.json' % text_scraper.PLAYS[PLAY].upper()), 'r') as f:
+        reparsed = json.load(f)
+
+    serial = text_scraper.formatPlayRows(PLAY, [(act, scene, parseScene(page)) for act, scene, page in fixtureScenes()])
+    assert reparsed == serial
+
+    assert [row['ACTION_NBR'] for row in reparsed] == list(range(1, len(reparsed) + 1))
+    lines = [row['LINE_NBR'] for row in reparsed if row['ORIGINAL_SPEAKER'] != 'STAGE_TEXT']
+    assert lines == list(range(1, len(lines) + 1))
+    scenes = [(row['ACT'], row['SCENE']) for row in reparsed]
+    assert scenes.count((2, 1)) == 1
+    # The interrupted speach at the start of act 2 is spoken by the last speaker of act 1
+    last_speaker = [row for row in reparsed[:scenes.index((2, 1))] if row['ORIGINAL_SPEAKER'] != 'STAGE_TEXT'][-1]
+    continued = reparsed[scenes.index((2, 1))]
+    assert (continued['ORIGINAL_SPEAKER'], continued['MODERN_SPEAKER']) == (last_speaker['ORIGINAL_SPEAKER'], last_speaker['MODERN_SPEAKER'])
+    assert continued['ORIGINAL_SPEAKER'] == 'IAGO'
@@ -0,0 +1,72 @@
+"""
+    Checks the PlayMatchIndex against the full scan of the play the theme quotes were matched with before the index: every
+    line is checked for the quote, then every window of words of the lines long enough to hold it is fuzzy scored.
+"""
+import random
+import pytest
+
+fuzz = pytest.importorskip('fuzzywuzzy.fuzz')
+from theme_matcher import PlayMatchIndex, letters
+
+WORDS = ['love', 'night', 'crown', 'blood', 'sweet', 'honour', 'sword', 'grave', 'heaven', 'father', 'daughter', 'king',
+         'fortune', 'poison', 'phoenix', 'tempest', 'shadow', 'gentle', 'thou', 'thee', 'doth', 'hath', 'never', 'ever',
+         'fair', 'foul', 'death', 'life', 'dream', 'sleep', 'heart', 'tongue', 'eyes', 'lord', 'lady', 'queen', 'ghost']
+
+def scanMatch(play_text, quote):
+    """
+    The position of the line of a quote found by scanning the whole play
+    """
+    for pos, row in enumerate(play_text):
+        if quote.lower() in row['ORIGINAL_TEXT'].lower() or letters(quote) in letters(row['ORIGINAL_TEXT']):
+            return pos
+
+    len_quote = len(quote.split(' '))
+    best, max_match = None, 0
+    for pos, row in enumerate(play_text):
+        line_words = row['ORIGINAL_TEXT'].split(' ')
+        if len_quote > 1.1 * len(line_words):
+            continue
+        for i in range(max(len(line_words) - len_quote, 0) + 1):
+            ratio = fuzz.ratio(' '.join(line_words[i: i + len_quote]), quote)
+            if ratio > max_match:
+                best, max_match = pos, ratio
+    return best
+
+def typo(rng, text):
+    """
+    Replace one letter of a text
+    """
+    pos = rng.choice([i for i, char in enumerate(text) if char.isalpha()])
+    return text[:pos] + rng.choice('abcdefghijklmnopqrstuvwxyz'.replace(text[pos], '')) + text[pos + 1:]
+
+@pytest.fixture(scope = 'module')
+def play():
+    rng = random.Random(7)
+    play_text = [{'ORIGINAL_TEXT': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 14)))} for _ in range(400)]
+
+    quotes = []
+    for _ in range(60):
+        words = play_text[rng.randrange(len(play_text))]['ORIGINAL_TEXT'].split(' ')
+        start = rng.randrange(len(words))
+        quote = ' '.join(words[start: start + rng.randint(1, 5)])
+        quotes += [quote, typo(rng, quote), quote.upper()]
+    # Short garbled quotes share few or no shingles with their lines
+    quotes += ['hnixvn', 'pheonx', 'gohst', 'tmepest shdow']
+    return play_text, quotes
+
+def test_match_equals_scan(play):
+    play_text, quotes = play
+    index = PlayMatchIndex(play_text)
+    assert [index.match(quote) for quote in quotes] == [scanMatch(play_text, quote) for quote in quotes]
+
+def test_short_typo_falls_back():
+    # The quote only shares shingles with the decoy lines, so its own line is found by the full scan
+    play_text = [{'ORIGINAL_TEXT': 'the ixvnqqqq sword of night'}] * 60 + [{'ORIGINAL_TEXT': 'the phoenix sword of night'}]
+    assert PlayMatchIndex(play_text, fallback_ratio = 0).fuzzyMatch('hnixvn') == (0, fuzz.ratio('hnixvn', 'ixvnqqqq'))
+    assert PlayMatchIndex(play_text).fuzzyMatch('hnixvn') == (60, fuzz.ratio('hnixvn', 'phoenix'))
+    assert PlayMatchIndex(play_text).match('hnixvn') == scanMatch(play_text, 'hnixvn')
+
+def test_match_all(play):
+    play_text, quotes = play
+    index = PlayMatchIndex(play_text)
+    assert index.matchAll(quotes + quotes[:5]) == [index.match(quote) for quote in quotes + quotes[:5]]
@@ -0,0 +1,266 @@
+##!/usr/bin/env python
+"""
+ Formatter Benchmarks
+
+ Generates synthetic raw inputs at a chosen scale, runs each formatter and the consolidation step in its own process and
+ records the wall time, peak memory and rows per second to a json report.  Passing the report of an earlier run as the
+ baseline flags the stages that got slower or bigger.
+
+    python benchmark.py small
+    python benchmark.py medium --stages gdp,demographic --baseline reports/benchmark-medium.json
+"""
+
+#Imports
+import argparse
+import json
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from download_and_format import FECBulkDownloader, IndicatorDataFormatter, DemographicDataFormatter, GDPFormatter, VotingDataFormatter, VDemFormatter, ProcessedDataStore
+from download_and_format.synthetic_data import SyntheticDataGenerator, FEC_DATASETS
+import downloader
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2020 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+#constants
+PROJ = Path(__file__).resolve().parent.parent.parent
+REPORT_PATH = PROJ.joinpath('data','politics','benchmark')
+SCALES = {'small': {'counties': 100, 'fec_rows': 100000},
+          'medium': {'counties': 1000, 'fec_rows': 1000000},
+          'large': {'counties': 3100, 'fec_rows': 10000000}}
+
+def runGDP(data_path, store):
+    GDPFormatter(data_path, storage = store).processGDPData()
+
+def runIndicators(data_path, store):
+    indicator_formatter = IndicatorDataFormatter(data_path, storage = store)
+    indicator_formatter.formatCultureData()
+    indicator_formatter.formatEmploymentData()
+    indicator_formatter.formatEducationData()
+
+def runDemographics(data_path, store):
+    DemographicDataFormatter(data_path, storage = store).consolidateDemographicData()
+
+def runMITVoting(data_path, store):
+    VotingDataFormatter(data_path, storage = store).formatMITPollingData()
+
+def runCQVoting(data_path, store):
+    VotingDataFormatter(data_path, storage = store).formatCQVotes()
+
+def runVDem(data_path, store):
+    VDemFormatter(data_path, storage = store).formatPartyData()
+
+def runCampaignFinance(data_path, store):
+    fec_downloader = FECBulkDownloader(proj_data = data_path)
+    for dataset in FEC_DATASETS:
+        zip_path = fec_downloader.download_manager.zipPath(dataset, 20)
+        fec_downloader.downloadAndFormatFECBulkData(dataset, 20, download_data = True, zip_path = zip_path)
+
+def runConsolidation(data_path, store):
+    # The consolidation reads and writes through the module level store of the downloader
+    downloader.STORE = store
+    downloader.consolidateVotingDemographicAndIndicatorData()
+
+# The stage name, the function that runs it, the processed datasets it writes and what the timing covers
+STAGES = [('gdp', runGDP, ['gdp'], 'Reads the gzipped BEA tsvs'),
+          ('indicator', runIndicators, ['culture', 'employment', 'education'],
+            'The unemployment and education workbooks are read from the RawSourceCache, the time covers the cache read '
+            'and not the workbook parse of a first run'),
+          ('demographic', runDemographics, ['demographics'], 'Reads the census csvs and the 2018 gzip'),
+          ('mit_voting', runMITVoting, ['mit_voting'], 'Reads the gzipped MIT election results'),
+          ('cq_voting', runCQVoting, ['cq_voting'], 'Reads the CQ csvs'),
+          ('vdem', runVDem, ['vdem_party'], 'Reads the V-Dem party csv'),
+          ('campaign', runCampaignFinance, [],
+            'Streams the FEC bulk zips like a download (without the network), no raw gzip copy is kept'),
+          ('consolidate', runConsolidation, ['voting_demographic'], 'Reads the processed datasets of the other stages')]
+
+def peakRSS():
+    '''
+    The peak resident memory of the current process in megabytes
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def measureStage(func, data_path, store):
+    '''
+    Run a stage and measure it, this runs in a fresh worker process so the peak memory belongs to the stage alone
+    ...
+    Parameters
+    ----------
+    func: The stage function
+    data_path: The synthetic politics data directory
+    store: The ProcessedDataStore the stage writes to
+    ...
+    Returns
+    ----------
+     > A dictionary with the status, wall time and memory of the stage
+    '''
+    start_rss = peakRSS()
+    start = time.perf_counter()
+    try:
+        func(data_path, store)
+        status, error = 'ok', None
+    except Exception:
+        status, error = 'failed', traceback.format_exc()
+    return {'status': status,
+            'error': error,
+            'wall_time_sec': round(time.perf_counter() - start, 4),
+            'start_rss_mb': round(start_rss, 1),
+            'peak_rss_mb': round(peakRSS(), 1)}
+
+def outputRows(data_path, store, datasets):
+    '''
+    Count the rows a stage wrote
+    '''
+    if len(datasets) == 0:
+        # The campaign finance stage writes its own partitioned datasets
+        fec_path = data_path.joinpath('processed','campaign-finance')
+        return sum(ds.dataset(str(x), format = 'parquet', partitioning = 'hive').count_rows()
+                    for x in fec_path.iterdir() if x.is_dir())
+    return sum(len(store.readDataset(name, columns = store.getColumns(name)[:1])) for name in datasets)
+
+def compareToBaseline(report, baseline, tolerance):
+    '''
+    Find the stages that are slower or use more memory than in the baseline report
+    ...
+    Parameters
+    ----------
+    report: The report of this run
+    baseline: The report of an earlier run
+    tolerance: The fraction a measurement can grow before it is flagged (i.e. 0.2 for 20%)
+    ...
+    Returns
+    ----------
+     > A list of the regressions
+    '''
+    regressions = []
+    for name, result in report['stages'].items():
+        prior = baseline['stages'].get(name)
+        if prior is None or prior['status'] != 'ok' or result['status'] != 'ok':
+            continue
+        for metric in ['wall_time_sec', 'peak_rss_mb']:
+            if prior[metric] > 0 and result[metric] > prior[metric] * (1 + tolerance):
+                regressions.append({'stage': name, 'metric': metric, 'baseline': prior[metric], 'current': result[metric],
+                                    'ratio': round(result[metric] / prior[metric], 3)})
+    return regressions
+
+def runBenchmarks(scale = 'small', counties = None, fec_rows = None, stages = None, backend = 'parquet', work_dir = None, keep = False):
+    '''
+    Generate the synthetic inputs and run the selected stages one at a time
+    ...
+    Parameters
+    ----------
+    scale: The name of the scale (small, medium or large)
+    counties: Override the number of counties of the scale
+    fec_rows: Override the number of individual contributions of the scale
+    stages: A list of the stage names to run, all stages if None
+    backend: The ProcessedDataStore backend the formatters write to
+    work_dir: The directory the synthetic data is written to, a temporary directory if None
+    keep: Keep the synthetic data after the run
+    ...
+    Returns
+    ----------
+     > The report dictionary
+    '''
+    params = dict(SCALES[scale])
+    params['counties'] = counties or params['counties']
+    params['fec_rows'] = fec_rows or params['fec_rows']
+    data_path = Path(work_dir) if work_dir is not None else Path(tempfile.mkdtemp(prefix = 'politics-benchmark-'))
+    store = ProcessedDataStore(data_path.joinpath('processed'), backend = backend)
+
+    try:
+        print('Generating %s synthetic inputs in %s' % (scale, data_path))
+        start = time.perf_counter()
+        generator = SyntheticDataGenerator(data_path, counties = params['counties'], fec_rows = params['fec_rows'])
+        input_rows = generator.writeAll()
+        data_path.joinpath('processed','campaign-finance').mkdir(parents = True, exist_ok = True)
+        print('Generated the inputs in %.1f seconds' % (time.perf_counter() - start))
+
+        report = {'scale': scale,
+                  'counties': params['counties'],
+                  'fec_rows': params['fec_rows'],
+                  'backend': backend,
+                  'created': datetime.now().isoformat(timespec = 'seconds'),
+                  'python': platform.python_version(),
+                  'pandas': pd.__version__,
+                  'pyarrow': pa.__version__,
+                  'stages': {}}
+
+        for name, func, datasets, notes in STAGES:
+            if stages is not None and name not in stages:
+                continue
+            print('Running %s' % name)
+            with ProcessPoolExecutor(max_workers = 1) as executor:
+                result = executor.submit(measureStage, func, data_path, store).result()
+
+            if name == 'consolidate':
+                # The consolidation is driven by the voting results
+                input_rows[name] = len(store.readDataset('mit_voting', columns = ['year'])) if result['status'] == 'ok' else 0
+            result['input_rows'] = input_rows[name]
+            result['output_rows'] = outputRows(data_path, store, datasets) if result['status'] == 'ok' else 0
+            result['rows_per_sec'] = round(result['input_rows'] / result['wall_time_sec'], 1) if result['wall_time_sec'] > 0 else None
+            result['notes'] = notes
+            report['stages'][name] = result
+            print('  %s: %s in %.2fs, peak rss %.0f MB, %s rows/sec' % (name, result['status'], result['wall_time_sec'],
+                                                                        result['peak_rss_mb'], result['rows_per_sec']))
+            if result['error'] is not None:
+                print(result['error'])
+        return report
+    finally:
+        if not keep and work_dir is None:
+            shutil.rmtree(str(data_path), ignore_errors = True)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark the politics formatters on synthetic data')
+    parser.add_argument('scale', nargs = '?', default = 'small', choices = list(SCALES))
+    parser.add_argument('--counties', type = int, help = 'Override the number of counties')
+    parser.add_argument('--fec-rows', type = int, help = 'Override the number of individual contributions')
+    parser.add_argument('--stages', help = 'A comma separated list of the stages to run (%s)' % ','.join(x[0] for x in STAGES))
+    parser.add_argument('--backend', default = 'parquet', choices = ['parquet','ipc','tsv'])
+    parser.add_argument('--out', help = 'The report path, benchmark-<scale>-<timestamp>.json in the benchmark directory by default')
+    parser.add_argument('--baseline', help = 'A prior report to check for regressions')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'The growth flagged as a regression')
+    parser.add_argument('--work-dir', help = 'Write the synthetic data here instead of a temporary directory')
+    parser.add_argument('--keep', action = 'store_true', help = 'Keep the synthetic data')
+    args = parser.parse_args()
+
+    report = runBenchmarks(scale = args.scale, counties = args.counties, fec_rows = args.fec_rows,
+                        stages = args.stages.split(',') if args.stages else None, backend = args.backend,
+                        work_dir = args.work_dir, keep = args.keep)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            report['regressions'] = compareToBaseline(report, json.load(f), args.tolerance)
+        for reg in report['regressions']:
+            print('Regression in %s: %s went from %s to %s (x%s)' % (reg['stage'], reg['metric'], reg['baseline'], reg['current'], reg['ratio']))
+
+    out_path = Path(args.out) if args.out else REPORT_PATH.joinpath('benchmark-%s-%s.json' % (args.scale, datetime.now().strftime('%Y%m%d-%H%M%S')))
+    out_path.parent.mkdir(parents = True, exist_ok = True)
+    with open(out_path, 'w') as f:
+        json.dump(report, f, indent = 2)
+    print('Wrote the benchmark report to %s' % out_path)
+
+    failed = [name for name, result in report['stages'].items() if result['status'] != 'ok']
+    sys.exit(1 if len(failed) > 0 or len(report.get('regressions', [])) > 0 else 0)
+
+if __name__ == '__main__':
+    main()
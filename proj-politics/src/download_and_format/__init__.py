@@ -5,3 +5,10 @@ from download_and_format.vdem import VDemFormatter
 from download_and_format.demographics import DemographicDataFormatter
 from download_and_format.gdp import GDPFormatter
 from download_and_format.voting import VotingDataFormatter
+from download_and_format.processed_storage import ProcessedDataStore
+from download_and_format.fec_download_manager import FECDownloadManager
+from download_and_format.dimension_store import FECDimensionStore
+from download_and_format.contribution_aggregator import ContributionAggregator
+from download_and_format.stage_runner import Stage, StageRunner
+from download_and_format.geography import CountyLookup, CountyNameIndex, DistrictCrosswalk
+from download_and_format.raw_cache import RawSourceCache
@@ -0,0 +1,66 @@
+##!/usr/bin/env python
+"""
+    The reader shared by the BEA regional tables (the county gdp and CAEMP25 employment tables), which have the same layout: a
+    row per area and line with a column per year.  The suppression markers are parsed as nulls while the file is decoded and
+    the year columns are read straight into floats.
+"""
+
+#imports
+import pandas as pd
+from download_and_format.geography import encodeFIPS
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2020 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+# Constants
+# (D) suppressed to avoid disclosure, (NA) not available, (L) less than half the unit shown, (T) included in the totals
+BEA_NA_VALUES = ['(D)', '(NA)', '(L)', '(T)']
+BEA_KEY_DTYPES = {'GeoFIPS': str, 'GeoName': str, 'Region': str, 'TableName': str, 'LineCode': str,
+                  'IndustryClassification': str, 'Description': str, 'Unit': str}
+
+def yearColumns(columns):
+    """
+    The year columns of a BEA table header
+    """
+    return [col for col in columns if str(col).strip().isdigit()]
+
+def readBEATable(file_path, columns = None, value_dtype = 'float64', **kwargs):
+    """
+    Read a BEA regional table with the year columns as floats and the suppressed values as nulls.  GeoFIPS is encoded
+    as an integer (the footnote rows become nulls) and the descriptions are stripped
+    ...
+    Parameters
+    ----------
+    file_path: The path of the table
+    columns: The key columns to keep, all of them if None.  Every year column is kept
+    value_dtype: The dtype of the year columns, float32 halves the memory of counts (i.e. jobs) that fit in it exactly
+    kwargs: Passed to read_csv (i.e. the separator and compression of the file)
+    ...
+    Returns
+    ----------
+     > A DataFrame
+    """
+    header = list(pd.read_csv(file_path, nrows = 0, encoding = 'latin-1', **kwargs))
+    years = yearColumns(header)
+    keys = [col for col in header if col not in years and (columns is None or col in columns)]
+    dtypes = dict([(col, BEA_KEY_DTYPES.get(col, str)) for col in keys] + [(col, value_dtype) for col in years])
+
+    df = pd.read_csv(file_path,
+                    index_col = False,
+                    usecols = keys + years,
+                    dtype = dtypes,
+                    na_values = BEA_NA_VALUES,
+                    encoding = 'latin-1',
+                    **kwargs)
+    if 'GeoFIPS' in df.columns:
+        df['GeoFIPS'] = encodeFIPS(df['GeoFIPS']).values
+    if 'Description' in df.columns:
+        df['Description'] = df['Description'].str.strip()
+    return df
@@ -7,15 +7,18 @@
 """
 
 #Imports
-import pandas as pd
-import numpy as np
+import gzip
 import os
 import zipfile
-import os.path
-import urllib.request
 import shutil
+from contextlib import ExitStack
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
 import pyarrow.parquet as pq
+from download_and_format.fec_download_manager import FECDownloadManager, FEC_BULK_URL, cycleNames
+from download_and_format.fec_normalization import FECNormalizer
+from download_and_format.dimension_store import FECDimensionStore
 
 __author__ = "Dylan Smith"
 __copyright__ = "Copyright (C) 2019 Dylan Smith"
@@ -28,6 +31,9 @@ __email__ = "-"
 __status__ = "Development"
 
 #constants
+# The most rows in a transaction parquet file and in each of its row groups
+ROWS_PER_FILE = 5000000
+ROWS_PER_GROUP = 250000
 HEADER_RENAMES = {
     "CANDIDATE_MASTER": {"CAND_ID": "candidate_identification",
                         "CAND_NAME":"candidate_name",
@@ -110,26 +116,53 @@ HEADER_RENAMES = {
                                 "MEMO_TEXT":"memo_text",
                                 "SUB_ID":"fec_record_number"}
                                 }
-LINKS = {"CANDIDATE_COMMITTEE":"ccl",
-        "CANDIDATE_MASTER":"cn",
-        "CONTRIBUTION_COMMITTEE_CANDIDATE":"pas2",
-        "COMMITTEE_MASTER":"cm",
-        "INDIVIDUAL_SUMMARY":"indiv"}
+
+class TeeReader(object):
+
+    def __init__(self, source, side_output):
+        '''
+        A file object that copies every byte read from the source into a side output
+        ...
+        Parameters
+        ----------
+        source: The binary file object to read from
+        side_output: The binary file object the bytes are copied to
+        '''
+        self.source = source
+        self.side_output = side_output
+        self.closed = False
+
+    def read(self, size = -1):
+        data = self.source.read(size)
+        self.side_output.write(data)
+        return data
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self.closed = True
 
 class FECBulkDownloader(object):
 
-    def __init__(self, proj_data):
+    def __init__(self, proj_data, base_url = FEC_BULK_URL, max_workers = 4, block_size = 64 * 1024 * 1024):
         '''
         An object that downloads data from the FEC and stores it in a parquet dataframe for later analysis
         ...
         Parameters
         ----------
         proj_data: The Directory that stores all politics data
+        base_url: The root of the FEC bulk downloads
+        max_workers: The number of files downloaded at the same time
+        block_size: The number of bytes of a raw transaction file parsed into each batch
         '''
         self.raw_data = proj_data.joinpath('raw','campaign-finance')
         self.proc_data = proj_data.joinpath('processed','campaign-finance')
+        self.block_size = block_size
+        self.dimension_store = FECDimensionStore(self.proc_data)
+        self.download_manager = FECDownloadManager(self.raw_data.joinpath('zip'), base_url = base_url, max_workers = max_workers)
 
-    def downloadAndFormatFECBulkData(self,data_typ, yr, download_data = True):
+    def downloadAndFormatFECBulkData(self,data_typ, yr, download_data = True, keep_raw = False, zip_path = None):
         """ 
         A Function that downloads the bulk-data from the FEC campaign-finance dataset and stores it in a parquet file in the correct directory.
         ...
@@ -137,130 +170,151 @@ class FECBulkDownloader(object):
         ----------
         data_typ: The source of the data to download
         yr: The associated Year we want to download
-        download_data = True
+        download_data: Whether to read the downloaded zip file or the raw gzip copy written by a prior run
+        keep_raw: Also write the raw gzip copy of the file while streaming it
+        zip_path: The zip file already downloaded by the download manager, the file is downloaded (or checked) if None
         """
-        url_abbrev = LINKS[data_typ]
-        if yr <= 50:
-            cent = 20
-        else:
-            cent = 19
-        
-        # Zero-pad the string to ensure the correct URL
-        yr = str(yr).rjust(2, '0')
-
-        file = '%s-%i%s' % (url_abbrev, cent, yr)
-        URL = "https://www.fec.gov/files/bulk-downloads/%i%s/%s%s.zip"  % (cent, yr, url_abbrev, yr)
+        file = cycleNames(data_typ, yr)[2]
         NEW_DIR_NM = data_typ.replace('_','-').lower()
         FILE_PATH = self.raw_data.joinpath(NEW_DIR_NM,'%s.txt.gz' % file)
         COL_NAMES = list(HEADER_RENAMES[data_typ.upper()].keys())
-        TMP_PATH = self.raw_data.joinpath('tmp.zip')
 
-        # If a download is required, download the data
-        if download_data:
-            if data_typ != 'INDIVIDUAL_SUMMARY':
-                chunks = pd.read_csv(URL, sep = '|', chunksize = 100000, names = COL_NAMES, encoding = 'latin_1', compression = 'zip')
-                mode, header = 'w', True
-                for df in chunks:
-                    df.to_csv(FILE_PATH,
-                            sep = '|',
-                            header = header,
-                            encoding = 'utf-8',
-                            compression = 'gzip',
-                            mode = mode,
-                            index = False)
-                    header, mode = False, 'a'
+        with ExitStack() as stack:
+            if download_data:
+                if zip_path is None:
+                    zip_path, _ = self.download_manager.downloadFile(data_typ, yr)
+                z = stack.enter_context(zipfile.ZipFile(zip_path))
+                # The individual contributions are in itcont.txt, the other datasets hold a single member
+                member = 'itcont.txt' if data_typ == 'INDIVIDUAL_SUMMARY' else z.namelist()[0]
+                source = stack.enter_context(z.open(member))
+                if keep_raw:
+                    # The copy is written under a temporary name and only takes the raw file's name once the whole
+                    # file has been streamed, so a failed run never leaves a truncated copy behind
+                    raw_tmp = FILE_PATH.with_name(FILE_PATH.name + '.tmp')
+                    stack.callback(lambda: raw_tmp.unlink() if raw_tmp.exists() else None)
+                    raw_copy = stack.enter_context(gzip.open(raw_tmp, 'wb'))
+                    source = TeeReader(source, raw_copy)
             else:
-                with urllib.request.urlopen(URL) as response, open(TMP_PATH, 'wb') as out_file:
-                    shutil.copyfileobj(response, out_file)
-
-                # Write the temp file into the a dataframe
-                with zipfile.ZipFile(TMP_PATH) as z:
-                    with z.open('itcont.txt') as zfile:
-                        chunks = pd.read_csv(zfile,
-                                        sep = '|',
-                                        names = COL_NAMES,
-                                        encoding = 'latin_1',
-                                        chunksize = 200000,
-                                        on_bad_lines='skip')
+                source = stack.enter_context(pa.input_stream(str(FILE_PATH), compression = 'gzip'))
 
-                        mode, header = 'w', True
-                        for df in chunks:
-                            df.to_csv(FILE_PATH,
-                                    sep = '|',
-                                    header = header,
-                                    encoding = 'utf-8',
-                                    compression = 'gzip',
-                                    mode = mode,
-                                    index = False)
-                            header, mode = False, 'a'
-                    os.unlink(TMP_PATH)
-
-        chunks = pd.read_csv(FILE_PATH,
-                            sep = '|',
-                            compression = 'gzip',
-                            encoding = 'utf-8',
-                            chunksize = 200000)
-
-        if 'TRANSACTION_DT' in COL_NAMES:
-            # Delete partiion if exists
-            parquet = True
-            shutil.rmtree(str(self.proc_data.joinpath('%s' % NEW_DIR_NM,'file_nm=%s' % file)), ignore_errors=True)
-        else:
-            parquet = False
-
-        for df in chunks:
-            df['file_nm'] = file
-            df = df.replace(to_replace= r'[^0-9a-zA-Z]+', value= '-', regex=True)
-            df.rename(columns = HEADER_RENAMES[data_typ], inplace = True)
-
-            if parquet:
-                df['orig_transaction_date'] = df['transaction_date'].copy()
-                df['transaction_date'] = df['transaction_date'].astype(dtype = int, errors='ignore')
-                df['transaction_date'] = df['transaction_date'].fillna(12311901)
+            if 'TRANSACTION_DT' in COL_NAMES:
+                # Delete partiion if exists and stream the transactions straight into the parquet dataset
+                shutil.rmtree(str(self.proc_data.joinpath('%s' % NEW_DIR_NM,'file_nm=%s' % file)), ignore_errors=True)
+                self.writeTransactionBatches(source, data_typ, file)
+            else:
+                # Upsert the cycle into the dimension table, only this cycle's partition gets rewritten
+                normalizer = FECNormalizer(COL_NAMES)
+                tables = [self.formatTransactions(batch, normalizer, data_typ, file) for batch in self.readRawBatches(source, data_typ)]
+                if len(tables) > 0:
+                    self.dimension_store.upsert(pa.concat_tables(tables), data_typ, file)
 
-                # Format the Zip Codes succesfully
-                df['contributor_zip'] = df['contributor_zip'].apply(lambda x: str(x)[:5] + '-' + str(x)[5:] if len(str(x)) == 9 else str(x))
-                df['transaction_date'] = pd.to_datetime(df['transaction_date'], format = '%m%d%Y',errors='coerce')
-                # Set values for year
-                df['transaction_year'] = df['transaction_date'].dt.year
-                df['transaction_year'] = df['transaction_year'].replace(np.nan, 1901)
-                df['transaction_year'] = df['transaction_year'].astype('int')
+            if download_data and keep_raw:
+                # Copy whatever the parser left unread so the raw copy is the whole member
+                for _ in iter(lambda: source.read(1 << 20), b''):
+                    pass
+                raw_copy.close()
+                os.replace(raw_tmp, FILE_PATH)
 
-                # Set values for month
-                df['transaction_month'] = df['transaction_date'].dt.month
-                df['transaction_month'] = df['transaction_month'].replace(np.nan, 12)
-                df['transaction_month'] = df['transaction_month'].astype('int')
-                # Convert the data to a string
-                for col in list(df):
-                    df[col] = df[col].astype('str')
+    def readRawBatches(self, source, data_typ):
+        """ 
+        Open a raw pipe delimited FEC file with the arrow csv reader.  Every column is read as a string so the normalizer
+        decides the types, and malformed rows are skipped.
+        ...
+        Parameters
+        ----------
+        source: A binary file object of the raw file
+        data_typ: The source of the data
+        ...
+        Returns
+        ----------
+         > An iterator of arrow RecordBatches of block_size bytes of the file
+        """
+        COL_NAMES = list(HEADER_RENAMES[data_typ.upper()].keys())
+        return csv.open_csv(source,
+                            read_options = csv.ReadOptions(column_names = COL_NAMES, encoding = 'latin1', block_size = self.block_size),
+                            parse_options = csv.ParseOptions(delimiter = '|', quote_char = False, invalid_row_handler = lambda row: 'skip'),
+                            convert_options = csv.ConvertOptions(column_types = {col: pa.string() for col in COL_NAMES},
+                                                                strings_can_be_null = True))
 
-                df['transaction_amount'] = df['transaction_amount'].str.replace('[a-zA-Z]', '0', regex = True)
-                df['transaction_amount'] = df['transaction_amount'].astype('float')
+    def writeTransactionBatches(self, source, data_typ, file):
+        """ 
+        Stream a raw FEC transaction file through the arrow csv reader into the partitioned parquet dataset.  Each formatted
+        block is split by (year, month) and appended to a writer kept open for that partition, so a partition gets one
+        file per ROWS_PER_FILE rows rather than a small file per block.  Only one block of the file is held in memory.
+        ...
+        Parameters
+        ----------
+        source: A binary file object of the raw pipe delimited file
+        data_typ: The source of the data
+        file: The file name of the cycle (i.e. indiv-2022)
+        """
+        COL_NAMES = list(HEADER_RENAMES[data_typ.upper()].keys())
+        normalizer = FECNormalizer(COL_NAMES)
+        file_path = self.proc_data.joinpath(data_typ.replace('_','-').lower(), 'file_nm=%s' % file)
+        writers = {}
+        print('Writing %s to parquet' % file)
+        try:
+            for batch in self.readRawBatches(source, data_typ):
+                table = self.formatTransactions(batch, normalizer, data_typ, file)
+                # Sort the block by its partition and append each run of rows to the partition's writer
+                key = pc.add(pc.multiply(table.column('transaction_year'), 100), table.column('transaction_month'))
+                order = pc.sort_indices(key)
+                table = table.take(order).drop(['file_nm', 'transaction_year', 'transaction_month'])
+                offset = 0
+                for run in pc.value_counts(key.take(order)).to_pylist():
+                    part = table.slice(offset, run['counts'])
+                    offset += run['counts']
+                    writer = writers.get(run['values'])
+                    if writer is None or writer[2] >= ROWS_PER_FILE:
+                        writer = self.partitionWriter(file_path, run['values'], part.schema, writer)
+                        writers[run['values']] = writer
+                    writer[0].write_table(part, row_group_size = ROWS_PER_GROUP)
+                    writer[2] += part.num_rows
+        finally:
+            for writer in writers.values():
+                writer[0].close()
 
-                print('Writing table to parquet')
-                table = pa.Table.from_pandas(df, preserve_index=False)
-                pq.write_to_dataset(table, root_path = str(self.proc_data.joinpath('%s' % NEW_DIR_NM)),
-                            partition_cols = ['file_nm','transaction_year', 'transaction_month'], compression = 'GZIP')
-            else:
-                # Read the file if it exists
-                file_nm = self.proc_data.joinpath('%s.tsv.gz' % data_typ.lower())
-                if os.path.exists(file_nm):
-                    df_init = pd.read_csv(file_nm,
-                            compression = 'gzip',
-                            sep = '\t',
-                            index_col = False,
-                            encoding = 'utf-8',
-                            lineterminator = '\n')
-                    
-                    # Concatenate the two dataframes and drop the duplicates
-                    df = pd.concat([df_init, df])
-                    df = df.drop_duplicates(keep = "first").reset_index(drop= True)        
+    def partitionWriter(self, file_path, key, schema, prior = None):
+        """ 
+        Open the next parquet file of a (year, month) partition of a cycle, closing the prior file of the partition
+        ...
+        Parameters
+        ----------
+        file_path: The file_nm partition directory of the cycle
+        key: The partition as year * 100 + month
+        schema: The schema of the rows
+        prior: The [writer, file number, rows] of the partition's full file, None for its first file
+        ...
+        Returns
+        ----------
+         > A list of the writer, its file number and the number of rows written to it
+        """
+        number = 0
+        if prior is not None:
+            prior[0].close()
+            number = prior[1] + 1
+        part_dir = file_path.joinpath('transaction_year=%i' % (key // 100), 'transaction_month=%i' % (key % 100))
+        part_dir.mkdir(parents = True, exist_ok = True)
+        return [pq.ParquetWriter(str(part_dir.joinpath('part-%i.parquet' % number)), schema, compression = 'gzip'), number, 0]
 
-                # Write the dataframe to the file
-                df.to_csv(file_nm,
-                        compression = 'gzip',
-                        mode = 'w',
-                        sep='\t',
-                        index = False,
-                        encoding='utf-8',
-                        line_terminator = '\n')
\ No newline at end of file
+    def formatTransactions(self, batch, normalizer, data_typ, file):
+        """ 
+        Format a batch of raw FEC rows for the parquet datasets.  The identifiers and names are cleaned as text while the
+        dates, amounts, years and record numbers are kept as typed columns.
+        ...
+        Parameters
+        ----------
+        batch: An arrow RecordBatch of raw string columns
+        normalizer: The FECNormalizer compiled for the layout of the file
+        data_typ: The source of the data
+        file: The file name of the cycle
+        ...
+        Returns
+        ----------
+         > An arrow Table
+        """
+        renames = dict(HEADER_RENAMES[data_typ], orig_TRANSACTION_DT = 'orig_transaction_date',
+                        TRANSACTION_DT_YEAR = 'transaction_year', TRANSACTION_DT_MONTH = 'transaction_month')
+        columns = {renames[col]: arr for col, arr in normalizer.normalize(batch).items()}
+        columns['file_nm'] = pa.array([file] * batch.num_rows, pa.string())
+        return pa.table(columns)
@@ -0,0 +1,319 @@
+##!/usr/bin/env python3
+"""
+    This script aggregates the partitioned FEC contribution datasets.  Each file_nm partition is reduced once to a rollup
+    of contribution totals and counts per committee, state, zip code and month, and the rollups are cached in parquet.  A
+    partition is scanned batch by batch, each batch is reduced to partial totals and the partials are combined, so a
+    partition is never held in memory whole.  The cache is refreshed incrementally (only new or rewritten file_nm partitions
+    are scanned).  Alongside each rollup a small view per query dimension (committee, month, zip code and candidate) is
+    written, so the candidate, committee, zip/FIPS and month totals read a few columns of a few rows and are summed in
+    arrow instead of regrouping the full rollup in pandas.
+"""
+
+#Imports
+import json
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from download_and_format.parquet_reader import ParquetReader
+from download_and_format.dimension_store import FECDimensionStore
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2019 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+#constants
+ROLLUP_KEYS = ['transaction_year', 'transaction_month', 'filer_identification_number', 'contributor_state', 'contributor_zip5']
+MEASURES = ['total_amount', 'contribution_count']
+# The keys of the views kept next to the rollup, every view keeps the transaction year so the queries can filter on it
+ROLLUP_VIEWS = {'committee': ['cycle', 'transaction_year', 'filer_identification_number'],
+                'month': ['transaction_year', 'transaction_month'],
+                'zip': ['transaction_year', 'contributor_state', 'contributor_zip5'],
+                'candidate': ['cycle', 'transaction_year', 'candidate_identification']}
+
+class ContributionAggregator(object):
+
+    def __init__(self, proc_data, dataset = 'individual-summary', combine_rows = 2000000):
+        '''
+        An object that maintains the rollup cache of a partitioned FEC contribution dataset and answers aggregate queries
+        ...
+        Parameters
+        ----------
+        proc_data: The processed campaign finance directory
+        dataset: The partitioned transaction dataset to aggregate (individual-summary or contribution-committee-candidate)
+        combine_rows: The number of partial rollup rows held before the partials are combined
+        '''
+        self.source_path = proc_data.joinpath(dataset)
+        self.rollup_path = proc_data.joinpath('rollups', dataset)
+        self.views_path = proc_data.joinpath('rollups', '%s-views' % dataset)
+        self.manifest_path = self.rollup_path.joinpath('_manifest.json')
+        self.dimension_store = FECDimensionStore(proc_data)
+        self.combine_rows = combine_rows
+
+    def partitionFingerprint(self, part_dir):
+        """
+        A fingerprint of the files in a file_nm partition, it changes whenever the partition is rewritten
+        """
+        files = [f.stat() for f in part_dir.rglob('*.parquet')]
+        return '%i-%i-%i' % (len(files), sum(f.st_size for f in files), max([int(f.st_mtime_ns) for f in files], default = 0))
+
+    def loadManifest(self):
+        """
+        Read the fingerprints of the partitions in the rollup cache
+        """
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def refresh(self):
+        """
+        Bring the rollup cache up to date with the transaction dataset.  Only the file_nm partitions that are new or changed
+        since the last refresh are scanned, and rollups of deleted partitions are removed.
+        ...
+        Returns
+        ----------
+         > A list of the file_nm partitions that were rebuilt
+        """
+        manifest = self.loadManifest()
+        current = {x.name.split('=', 1)[1]: self.partitionFingerprint(x) for x in self.source_path.iterdir()
+                    if x.is_dir() and x.name.startswith('file_nm=')}
+        # A rollup written before the views were kept is rebuilt to add them
+        changed = [file for file, fingerprint in current.items() if manifest.get(file) != fingerprint or
+                    (self.rollup_path.joinpath('file_nm=%s' % file).exists() and
+                    not self.views_path.joinpath('committee', 'file_nm=%s' % file).exists())]
+
+        for file in [file for file in manifest if file not in current]:
+            self.writeRollup(None, file)
+            del manifest[file]
+
+        columns = self.sourceColumns() if len(changed) > 0 else None
+        for file in changed:
+            print('Building the contribution rollup for %s' % file)
+            with ParquetReader(self.source_path, 'file_nm', n = 1, columns = columns, filters = [('file_nm', '=', file)]) as reader:
+                self.writeRollup(self.rollupBatches(reader.batches()), file)
+
+        self.rollup_path.mkdir(parents = True, exist_ok = True)
+        manifest.update({file: current[file] for file in changed})
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent = 2, sort_keys = True)
+        os.replace(tmp_path, self.manifest_path)
+        return changed
+
+    def sourceColumns(self):
+        """
+        The columns of the transaction dataset needed for the rollup
+        """
+        names = ds.dataset(str(self.source_path), format = 'parquet', partitioning = 'hive').schema.names
+        columns = ['file_nm', 'transaction_year', 'transaction_month', 'filer_identification_number', 'contributor_state',
+                    'contributor_zip', 'transaction_amount']
+        return columns + (['candidate_identification'] if 'candidate_identification' in names else [])
+
+    def rollupTable(self, table):
+        """
+        Reduce transactions to totals and counts at the rollup grain
+        ...
+        Parameters
+        ----------
+        table: An arrow Table of transactions
+        ...
+        Returns
+        ----------
+         > An arrow Table with the rollup keys, total_amount and contribution_count
+        """
+        table = table.append_column('contributor_zip5', pc.utf8_slice_codeunits(table.column('contributor_zip'), 0, 5))
+        keys = ROLLUP_KEYS + (['candidate_identification'] if 'candidate_identification' in table.column_names else [])
+        rollup = table.group_by(keys).aggregate([('transaction_amount', 'sum'),
+                                                ('transaction_amount', 'count', pc.CountOptions(mode = 'all'))])
+        return rollup.rename_columns([{'transaction_amount_sum': 'total_amount',
+                                        'transaction_amount_count': 'contribution_count'}.get(col, col) for col in rollup.column_names])
+
+    def combineRollups(self, rollups):
+        """
+        Combine partial rollups into one by summing the totals and counts of the rows with the same keys
+        """
+        table = pa.concat_tables(rollups)
+        keys = [col for col in table.column_names if col not in MEASURES]
+        rollup = table.group_by(keys).aggregate([(measure, 'sum') for measure in MEASURES])
+        return rollup.rename_columns([col[:-len('_sum')] if col in ['%s_sum' % x for x in MEASURES] else col
+                                        for col in rollup.column_names])
+
+    def rollupBatches(self, batches):
+        """
+        Reduce the transactions of a partition to a rollup out of core.  Each batch is reduced to a partial rollup and the
+        partials are combined whenever they hold more than combine_rows rows
+        ...
+        Parameters
+        ----------
+        batches: An iterator of the arrow RecordBatches of a single file_nm partition
+        ...
+        Returns
+        ----------
+         > An arrow Table with the rollup keys, total_amount and contribution_count, None if the partition has no rows
+        """
+        partials, partial_rows = [], 0
+        for batch in batches:
+            if batch.num_rows == 0:
+                continue
+            partials.append(self.rollupTable(pa.Table.from_batches([batch])))
+            partial_rows += partials[-1].num_rows
+            if partial_rows > self.combine_rows and len(partials) > 1:
+                partials = [self.combineRollups(partials)]
+                partial_rows = partials[0].num_rows
+
+        if len(partials) == 0:
+            return None
+        return self.combineRollups(partials)
+
+    def rollupViews(self, rollup, file):
+        """
+        Reduce the rollup of a file_nm partition to the view of each query dimension
+        ...
+        Parameters
+        ----------
+        rollup: The arrow Table of the partition rollup
+        file: The file_nm of the partition, its last part is the election cycle
+        ...
+        Returns
+        ----------
+         > A dictionary of the view name to an arrow Table with the view keys, total_amount and contribution_count
+        """
+        rollup = rollup.append_column('cycle', pa.array([file.split('-')[-1]] * rollup.num_rows, pa.string()))
+        views = {}
+        for view, keys in ROLLUP_VIEWS.items():
+            if all(key in rollup.column_names for key in keys):
+                views[view] = self.combineRollups([rollup.select(keys + MEASURES)])
+        return views
+
+    def writeRollup(self, rollup, file):
+        """
+        Replace the cached rollup of a file_nm partition and its views, they are removed if the partition has no rows
+        """
+        part_dirs = dict([(None, self.rollup_path.joinpath('file_nm=%s' % file))] +
+                        [(view, self.views_path.joinpath(view, 'file_nm=%s' % file)) for view in ROLLUP_VIEWS])
+        for part_dir in part_dirs.values():
+            shutil.rmtree(str(part_dir), ignore_errors = True)
+        if rollup is None:
+            return
+
+        tables = self.rollupViews(rollup, file)
+        tables[None] = rollup
+        for view, table in tables.items():
+            part_dirs[view].mkdir(parents = True)
+            pq.write_table(table, str(part_dirs[view].joinpath('part-0.parquet')))
+
+    def rollupFilter(self, files = None, years = None):
+        """
+        The filter expression of a list of file_nm partitions and a (start, end) tuple of transaction years, None if neither
+        is given
+        """
+        filters = []
+        if files is not None:
+            filters.append(('file_nm', 'in', files))
+        if years is not None and years[0] is not None:
+            filters.append(('transaction_year', '>=', years[0]))
+        if years is not None and years[1] is not None:
+            filters.append(('transaction_year', '<=', years[1]))
+        return pq.filters_to_expression(filters) if len(filters) > 0 else None
+
+    def readRollup(self, files = None, years = None, columns = None):
+        """
+        Read the cached rollups
+        ...
+        Parameters
+        ----------
+        files: A list of the file_nm partitions to include, all partitions if None
+        years: A (start, end) tuple of the transaction years to include, either end can be None
+        columns: A list of the columns to read, all columns if None
+        ...
+        Returns
+        ----------
+         > A DataFrame at the rollup grain with the file_nm and the election cycle
+        """
+        dataset = ds.dataset(str(self.rollup_path), format = 'parquet', partitioning = 'hive')
+        read_cols = None if columns is None else [col for col in dict.fromkeys(list(columns) + ['file_nm']) if col != 'cycle']
+        df = dataset.to_table(columns = read_cols, filter = self.rollupFilter(files, years)).to_pandas()
+        df['cycle'] = df['file_nm'].str.split('-').str[-1]
+        return df if columns is None else df[list(columns)]
+
+    def totalsBy(self, view, keys, files = None, years = None):
+        """
+        Sum the contribution totals and counts of a view by a list of its keys.  Only the keys and measures of the
+        matching partitions are read and they are summed in arrow
+        ...
+        Parameters
+        ----------
+        view: The name of the view (committee, month, zip or candidate)
+        keys: The keys of the view to sum by
+        files: A list of the file_nm partitions to include, all partitions if None
+        years: A (start, end) tuple of the transaction years to include, either end can be None
+        """
+        dataset = ds.dataset(str(self.views_path.joinpath(view)), format = 'parquet', partitioning = 'hive')
+        table = dataset.to_table(columns = keys + MEASURES, filter = self.rollupFilter(files, years))
+        totals = table.group_by(keys).aggregate([(measure, 'sum') for measure in MEASURES])
+        totals = totals.rename_columns([col[:-len('_sum')] if col in ['%s_sum' % x for x in MEASURES] else col
+                                        for col in totals.column_names])
+        return totals.select(keys + MEASURES).to_pandas()
+
+    def totalsByCommittee(self, files = None, years = None):
+        """
+        The contribution totals and counts per receiving committee and election cycle
+        """
+        return self.totalsBy('committee', ['cycle', 'filer_identification_number'], files = files, years = years)
+
+    def totalsByMonth(self, files = None, years = None):
+        """
+        The contribution totals and counts per month
+        """
+        return self.totalsBy('month', ['transaction_year', 'transaction_month'], files = files, years = years)
+
+    def totalsByZip(self, files = None, years = None):
+        """
+        The contribution totals and counts per state and five digit zip code
+        """
+        return self.totalsBy('zip', ['contributor_state', 'contributor_zip5'], files = files, years = years)
+
+    def totalsByFips(self, zip_lkp, files = None, years = None):
+        """
+        The contribution totals and counts per county
+        ...
+        Parameters
+        ----------
+        zip_lkp: A DataFrame with the zip and fips columns.  An optional ratio column splits zip codes that span counties
+        """
+        df = self.totalsByZip(files = files, years = years)
+        df = df.merge(zip_lkp.rename(columns = {'zip': 'contributor_zip5'}), on = 'contributor_zip5', how = 'inner')
+        if 'ratio' in df.columns:
+            df[MEASURES] = df[MEASURES].multiply(df['ratio'], axis = 0)
+        return df.groupby('fips', as_index = False)[MEASURES].sum()
+
+    def totalsByCandidate(self, files = None, years = None):
+        """
+        The contribution totals and counts per candidate and election cycle.  The committee to candidate contributions carry
+        the candidate, the individual contributions are linked through the candidate committee table of the same cycle.  A
+        committee linked to several candidates has its totals and counts split evenly between them, so every contribution
+        is counted once.
+        """
+        if self.views_path.joinpath('candidate').exists():
+            return self.totalsBy('candidate', ['cycle', 'candidate_identification'], files = files, years = years)
+
+        # The individual contributions are linked from the (small) committee totals
+        df = self.totalsByCommittee(files = files, years = years)
+        linkages = self.dimension_store.read('CANDIDATE_COMMITTEE', columns = ['candidate_identification', 'committee_identification', 'file_nm'])
+        linkages['cycle'] = linkages['file_nm'].str.split('-').str[-1]
+        linkages = linkages.drop(columns = 'file_nm').drop_duplicates()
+        linkages = linkages.rename(columns = {'committee_identification': 'filer_identification_number'})
+        linkages['ratio'] = 1 / linkages.groupby(['cycle', 'filer_identification_number'])['candidate_identification'].transform('size')
+        df = df.merge(linkages, on = ['cycle', 'filer_identification_number'], how = 'inner')
+        df[MEASURES] = df[MEASURES].multiply(df['ratio'], axis = 0)
+        return df.groupby(['cycle', 'candidate_identification'], as_index = False)[MEASURES].sum()
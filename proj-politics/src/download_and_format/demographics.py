@@ -6,10 +6,14 @@
 
 """
 #Imports
+import os
 import pandas as pd
 from os import listdir
 from os.path import isfile, join
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from download_and_format.processed_storage import ProcessedDataStore
+from download_and_format.geography import countyFIPS
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -32,19 +36,81 @@ AGE_CODES = {1:"0_to_4",2:"5_to_9",3:"10_to_14",4:"15_to_19",5:"20_to_24",
           6:"25_to_29",7:"30_to_34",8:"35_to_39",9:"40_to_44",10:"45_to_49",
           11:"50_to_54",12:"55_to_59",13:"60_to_64",14:"65_to_69",15:"70_to_74",
           16:"75_to_79",17:"80_to_84", 18:"85_to_Older", 0:'Total_Population'}
+# The voting age group each census age group is summed into, the census groups under 15 are dropped
+AGE_BUCKETS = {'15_to_19':'18_to_29', '20_to_24': '18_to_29', '25_to_29':'18_to_29',
+               '30_to_34':'30_to_49', '35_to_39': '30_to_49', '40_to_44': '30_to_49' , '45_to_49': '30_to_49',
+               '50_to_54': '50_to_64', '55_to_59': '50_to_64' , '60_to_64': '50_to_64', '80_to_84': '65+',
+               '65_to_69': '65+', '70_to_74': '65+' , '75_to_79': '65+', '85_to_Older': '65+',
+               'Total_Population': 'Total_Population'}
+# The columns read from the census files and their types, the population counts are floats so suppressed values (X) are nulls
+CENSUS_DTYPES = dict([(col, 'int64') for col in ['STATE','COUNTY','YEAR','AGEGRP']] +
+                     [(col, 'str') for col in ['STNAME','CTYNAME']] +
+                     [(col, 'float64') for col in ['TOT_POP','TOT_MALE','TOT_FEMALE']] +
+                     [('%s_%s' % (value, gender), 'float64') for value in CENSUS_FIELDS.values() for gender in ['MALE','FEMALE']])
 
 class DemographicDataFormatter(object):
 
-    def __init__(self, data_path):
+    def __init__(self, data_path, storage = None, max_workers = None, chunksize = 250000):
         '''
         The object that formats demographic data from the US Census bureau into a zip code based dataset
         ...
         Parameters
         ----------
         data_path: The path with the political data stored.
+        storage: The ProcessedDataStore the output is written to, a parquet store in the processed directory by default
+        max_workers: The number of census files (or groups of states) formatted at the same time, the number of cpus by default
+        chunksize: The number of rows of the national census file read at a time
         '''
         self.raw_demo_data = data_path.joinpath('raw','demographics')
         self.proc_data = data_path.joinpath('processed')
+        self.storage = storage if storage is not None else ProcessedDataStore(self.proc_data)
+        self.max_workers = max_workers
+        self.chunksize = chunksize
+
+    def readCensusFile(self, file_path, **kwargs):
+        '''
+        Read a census estimates file with only the columns the formatter uses and explicit types
+        ...
+        Parameters
+        ----------
+        file_path: The path of the file
+        kwargs: Passed to read_csv (i.e. the separator and compression of the file)
+        '''
+        return pd.read_csv(file_path,
+                        index_col = False,
+                        usecols = list(CENSUS_DTYPES),
+                        dtype = CENSUS_DTYPES,
+                        na_values = ['X'],
+                        encoding = 'latin-1',
+                        **kwargs)
+
+    def formatCensusFile(self, file_path, yr):
+        '''
+        Read and format a census file, this runs in the process pool
+        '''
+        return self.formatDemographicData(self.readCensusFile(file_path), yr)
+
+    def readStateChunks(self, file_path, **kwargs):
+        '''
+        Read a census file that is sorted by state in chunks, only yielding a chunk once the states in it are complete so the
+        state level aggregation of each chunk is correct
+        ...
+        Parameters
+        ----------
+        file_path: The path of the file
+        kwargs: Passed to read_csv
+        '''
+        carry = None
+        for chunk in self.readCensusFile(file_path, chunksize = self.chunksize, **kwargs):
+            if carry is not None:
+                chunk = pd.concat([carry, chunk])
+            complete = chunk['STATE'] != chunk['STATE'].iloc[-1]
+            if complete.any():
+                yield chunk[complete]
+            carry = chunk[~complete]
+
+        if carry is not None and len(carry) > 0:
+            yield carry
 
     def formatDemographicData(self, df, yr):
         '''
@@ -56,12 +122,9 @@ class DemographicDataFormatter(object):
         yr: The year the data is from
         '''
         # Reformat a few of the fields to match the geographic needs and reformat the Year column.
-        df.replace({'X':np.nan}, inplace = True)
-        df = df.apply(pd.to_numeric, errors='ignore')
-        pd.to_numeric(df['WA_MALE'])
-        df.insert(0, 'FIPS', (df['STATE']*1000 + df['COUNTY']).astype(str).str.pad(width = 5, side = 'left', fillchar = '0'))
+        df.insert(0, 'FIPS', countyFIPS(df['STATE'], df['COUNTY']).values)
         df['AGEGRP'] = df['AGEGRP'].replace(AGE_CODES)
-        df['YEAR'] = df['YEAR'].apply(lambda x: x + (yr - 3))
+        df['YEAR'] = df['YEAR'] + (yr - 3)
         df = df[(df['YEAR'] >= yr) & (~df['AGEGRP'].isin(['0_to_4','5_to_9','10_to_14'])) & (df['YEAR'] % 2 == 0)]
 
         # Get the total population to decompose each group into a percent
@@ -74,7 +137,7 @@ class DemographicDataFormatter(object):
         df_state = df[df.columns.difference(['FIPS'])].groupby(['STATE','AGEGRP','YEAR','STNAME']).sum()
         df_state['CTYNAME'] = 'State Level'
         df_state.reset_index(inplace = True)
-        df_state.insert(0, 'FIPS', (df_state['STATE']*1000).astype(str).str.pad(width = 5, side = 'left', fillchar = '0'))
+        df_state.insert(0, 'FIPS', countyFIPS(df_state['STATE'], 0).values)
         df = pd.concat([df, df_state[list(df)]])
 
         # Get Demographics as a percentage of age
@@ -98,56 +161,68 @@ class DemographicDataFormatter(object):
 
         return df[['YEAR','FIPS', 'CTYNAME', 'AGEGRP','STATE'] + out_cols]
 
+    def bucketAgeGroups(self, df):
+        '''
+        Sum the formatted census rows into the voting age groups and spread the groups into columns.  The rows are coded by
+        (YEAR, FIPS, STATE) and age group and added into a preallocated array in one pass, the 15 to 19 group only counts the
+        18 and 19 year olds (2/5 of it).
+        ...
+        Parameters
+        ----------
+        df: The formatted census rows
+        ...
+        Returns
+        ----------
+         > A DataFrame with a row per YEAR, FIPS and STATE and a column per demographic and age group
+        '''
+        value_cols = sorted(df.columns[5:])
+        buckets = sorted(set(AGE_BUCKETS.values()))
+        bucket_codes = df['AGEGRP'].map({age: buckets.index(bucket) for age, bucket in AGE_BUCKETS.items()}).values
+        row_codes, rows = pd.MultiIndex.from_frame(df[['YEAR','FIPS','STATE']]).factorize(sort = True)
+
+        values = np.nan_to_num(df[value_cols].to_numpy(dtype = 'float64'))
+        values *= np.where(df['AGEGRP'].values == '15_to_19', 2 / 5, 1.0)[:, None]
+
+        # One cell per row, age group and demographic, cells without any census rows stay null
+        cells = row_codes * len(buckets) + bucket_codes
+        out = np.zeros((len(rows) * len(buckets), len(value_cols)))
+        np.add.at(out, cells, values)
+        out[np.bincount(cells, minlength = len(out)) == 0] = np.nan
+
+        out = out.reshape(len(rows), len(buckets), len(value_cols)).transpose(0, 2, 1).reshape(len(rows), -1)
+        df_out = pd.DataFrame(out, columns = ['%s_%s' % (demo, age) for demo in value_cols for age in buckets])
+        df_out = df_out.dropna(how = 'all', axis = 1)
+        df_out.insert(0, 'YEAR', rows.get_level_values(0))
+        df_out.insert(1, 'FIPS', rows.get_level_values(1))
+        df_out.insert(2, 'STATE', rows.get_level_values(2))
+        df_out.columns = df_out.columns.str.replace('+', '_plus', regex = False).str.lower()
+        return df_out
+
     def consolidateDemographicData(self):
         """
         The function that iterates through the files and aggregates the demographic information into one file
 
         """
-        # Format all the history files and write them to the output
+        # Format the history files (one per state) and the national file in groups of whole states in the process pool.  At
+        # most max_workers groups of the national file are waiting on the pool at a time to bound the memory
         HIST_DEMO_PATH = self.raw_demo_data.joinpath('2009')
         demofiles = [f for f in listdir(HIST_DEMO_PATH) if isfile(join(HIST_DEMO_PATH, f))]
 
-        df_out = pd.DataFrame()
-        for file_name in demofiles:
-            df_tmp = pd.read_csv(HIST_DEMO_PATH.joinpath(file_name),
-                        encoding='latin-1')
-            df_format = self.formatDemographicData(df_tmp, 2000)
-            df_out = pd.concat([df_out, df_format])
+        with ProcessPoolExecutor(max_workers = self.max_workers) as executor:
+            futures = [executor.submit(self.formatCensusFile, HIST_DEMO_PATH.joinpath(file_name), 2000) for file_name in demofiles]
+            pending, max_pending = set(), self.max_workers or os.cpu_count() or 1
+            for df_tmp in self.readStateChunks(self.raw_demo_data.joinpath('2018','cc-est2018-alldata.csv.gz'),
+                                            compression = 'gzip', sep = '\t'):
+                if len(pending) >= max_pending:
+                    _, pending = wait(pending, return_when = FIRST_COMPLETED)
+                future = executor.submit(self.formatDemographicData, df_tmp, 2010)
+                futures.append(future)
+                pending.add(future)
+
+            df_demo = pd.concat([future.result() for future in futures])
+
+        # Aggregate the ages into the voting age groups and pivot them into columns
+        df_demo = self.bucketAgeGroups(df_demo)
 
-        #download the dataframes for the age fields and the census fields
-        df_tmp = pd.read_csv(self.raw_demo_data.joinpath('2018','cc-est2018-alldata.csv.gz'),
-                        index_col = False,
-                        compression = 'gzip',
-                        sep='\t',
-                        encoding='latin-1')
-
-        # Format the data and add it to the temp path
-        df_format = self.formatDemographicData(df_tmp, 2010)
-        df_demo = pd.concat([df_out, df_format])
-
-        # Format the Age Groups appropriately
-        for grp in list(df_demo)[5:]:
-            df_demo.loc[df_demo['AGEGRP'] == '15_to_19', grp] = df_demo[df_demo['AGEGRP'] == '15_to_19'][grp].astype(float) * 2 / 5
-
-        # Aggregate the ages into different groups and filter out people who are too young to vote.  Also filter odd numbered years
-        df_demo['AGEGRP'].replace({'15_to_19':'18_to_29', '20_to_24': '18_to_29', '25_to_29':'18_to_29',
-                                '30_to_34':'30_to_49', '35_to_39': '30_to_49', '40_to_44': '30_to_49' , '45_to_49': '30_to_49',
-                                '50_to_54': '50_to_64', '55_to_59': '50_to_64' , '60_to_64': '50_to_64', '80_to_84': '65+',
-                                '65_to_69': '65+', '70_to_74': '65+' , '75_to_79': '65+', '75_to_79': '65+', '85_to_Older': '65+'},
-                                inplace = True)
-        df_demo = df_demo.groupby(['YEAR','FIPS','AGEGRP'], as_index=False).sum()
-
-        # Create the final Feature dataset per year
-        df_demo = pd.pivot_table(df_demo, index = ['YEAR','FIPS', 'STATE'], columns = 'AGEGRP')
-        df_demo.columns = ['%s_%s' % (demo, age) for (demo, age) in df_demo.columns]
-        df_demo.reset_index(inplace = True)
-        df_demo.columns = df_demo.columns.str.replace('+', '_plus').str.lower()
-        
         # Write the demographic data to a file
-        df_demo.to_csv(self.proc_data.joinpath('demographics.tsv.gz'),
-                        compression = 'gzip',
-                        mode = 'w',
-                        sep='\t',
-                        index = False,
-                        encoding='utf-8',
-                        line_terminator = '\n')
+        self.storage.writeDataset(df_demo, 'demographics')
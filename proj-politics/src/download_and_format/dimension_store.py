@@ -0,0 +1,91 @@
+##!/usr/bin/env python3
+"""
+    A keyed upsert store for the non-transactional FEC tables (candidate master, committee master and the candidate to
+    committee linkages).  Every election cycle is its own file_nm partition, so ingesting a cycle only rewrites that cycle's
+    rows and reading the store returns one row per key.
+"""
+
+#Imports
+import os
+import shutil
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2019 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+#constants
+DIMENSION_KEYS = {"CANDIDATE_MASTER": ["candidate_identification", "file_nm"],
+                "COMMITTEE_MASTER": ["committee_identification", "file_nm"],
+                "CANDIDATE_COMMITTEE": ["candidate_identification", "committee_identification", "file_nm"]}
+
+class FECDimensionStore(object):
+
+    def __init__(self, proc_data):
+        '''
+        An object that upserts the FEC dimension tables into parquet datasets partitioned by file_nm
+        ...
+        Parameters
+        ----------
+        proc_data: The processed campaign finance directory
+        '''
+        self.proc_data = proc_data
+
+    def datasetPath(self, data_typ):
+        """
+        Get the path of the dataset for a dimension table
+        """
+        return self.proc_data.joinpath(data_typ.replace('_','-').lower())
+
+    def upsert(self, table, data_typ, file):
+        """
+        Replace the rows of one cycle with the latest version of each key.  Later rows win when a key repeats in the file.
+        ...
+        Parameters
+        ----------
+        table: An arrow Table with the formatted rows of the cycle
+        data_typ: The dimension table (i.e. CANDIDATE_MASTER)
+        file: The file name of the cycle (i.e. cn-2022)
+        """
+        keys = DIMENSION_KEYS[data_typ]
+        df = table.to_pandas()
+        df = df.drop_duplicates(subset = keys, keep = 'last').reset_index(drop = True)
+
+        # Write the partition next to the old one and swap it in so readers never see half a cycle.  The underscore keeps
+        # the staging directory out of the dataset discovery
+        part_dir = self.datasetPath(data_typ).joinpath('file_nm=%s' % file)
+        tmp_dir = part_dir.with_name('_%s.tmp' % part_dir.name)
+        shutil.rmtree(str(tmp_dir), ignore_errors = True)
+        tmp_dir.mkdir(parents = True)
+        pq.write_table(pa.Table.from_pandas(df.drop(columns = 'file_nm'), preserve_index = False),
+                    str(tmp_dir.joinpath('part-0.parquet')), compression = 'GZIP')
+        shutil.rmtree(str(part_dir), ignore_errors = True)
+        os.replace(tmp_dir, part_dir)
+        return len(df)
+
+    def read(self, data_typ, columns = None, files = None):
+        """
+        Read the deduplicated view of a dimension table
+        ...
+        Parameters
+        ----------
+        data_typ: The dimension table (i.e. CANDIDATE_MASTER)
+        columns: A list of columns to read, all columns if None
+        files: A list of the cycles (file_nm) to read, all cycles if None
+        ...
+        Returns
+        ----------
+         > A DataFrame
+        """
+        dataset = ds.dataset(str(self.datasetPath(data_typ)), format = 'parquet', partitioning = 'hive')
+        expression = pc.field('file_nm').isin(files) if files is not None else None
+        return dataset.to_table(columns = columns, filter = expression).to_pandas()
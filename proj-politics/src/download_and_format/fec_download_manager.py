@@ -0,0 +1,239 @@
+##!/usr/bin/env python3
+"""
+    An object that schedules the FEC bulk-data downloads.  Files are pulled down by a bounded pool of worker threads,
+    interrupted downloads are resumed with HTTP range requests, and a manifest keeps the ETag/Last-Modified of every
+    (dataset, cycle) pair so unchanged cycles are skipped on the next run.
+"""
+
+#Imports
+import json
+import os
+import shutil
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2019 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+#constants
+FEC_BULK_URL = "https://www.fec.gov/files/bulk-downloads"
+LINKS = {"CANDIDATE_COMMITTEE":"ccl",
+        "CANDIDATE_MASTER":"cn",
+        "CONTRIBUTION_COMMITTEE_CANDIDATE":"pas2",
+        "COMMITTEE_MASTER":"cm",
+        "INDIVIDUAL_SUMMARY":"indiv"}
+
+def cycleNames(data_typ, yr):
+    '''
+    Get the century, zero padded year, and file name used by the FEC for a dataset and election cycle
+    ...
+    Parameters
+    ----------
+    data_typ: The source of the data to download
+    yr: The two digit election cycle (i.e. 22 or 98)
+    '''
+    cent = 20 if yr <= 50 else 19
+    yr = str(yr).rjust(2, '0')
+    return cent, yr, '%s-%i%s' % (LINKS[data_typ], cent, yr)
+
+class FECDownloadManager(object):
+
+    def __init__(self, zip_data, base_url = FEC_BULK_URL, max_workers = 4, block_size = 1024 * 1024, timeout = 60):
+        '''
+        An object that downloads the FEC bulk zip files in parallel and records the completed downloads in a manifest
+        ...
+        Parameters
+        ----------
+        zip_data: The directory the zip files and the manifest are stored in
+        base_url: The root of the bulk downloads, pointed at a local server when testing
+        max_workers: The number of files downloaded at the same time
+        block_size: The number of bytes read from the connection at a time
+        timeout: The socket timeout for each request in seconds
+        '''
+        self.zip_data = zip_data
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.block_size = block_size
+        self.timeout = timeout
+        self.manifest_path = zip_data.joinpath('manifest.json')
+        self.lock = threading.Lock()
+
+        self.zip_data.mkdir(parents = True, exist_ok = True)
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+
+    def url(self, data_typ, yr):
+        """
+        Get the url of a dataset for an election cycle
+        """
+        cent, yr, _ = cycleNames(data_typ, yr)
+        return "%s/%i%s/%s%s.zip" % (self.base_url, cent, yr, LINKS[data_typ], yr)
+
+    def zipPath(self, data_typ, yr):
+        """
+        Get the local path of the downloaded zip file
+        """
+        return self.zip_data.joinpath('%s.zip' % cycleNames(data_typ, yr)[2])
+
+    def key(self, data_typ, yr):
+        """
+        The manifest key for a dataset and election cycle
+        """
+        return '%s|%s' % (data_typ, cycleNames(data_typ, yr)[1])
+
+    def saveManifest(self):
+        """
+        Write the manifest to disk.  The file is swapped in so an interrupted run never leaves half a manifest behind
+        """
+        with self.lock:
+            tmp_path = self.manifest_path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(self.manifest, f, indent = 2, sort_keys = True)
+            os.replace(tmp_path, self.manifest_path)
+
+    def isCompleted(self, data_typ, yr):
+        """
+        Whether the dataset and cycle has been downloaded and formatted since the file last changed
+        """
+        return self.manifest.get(self.key(data_typ, yr), {}).get('completed', False)
+
+    def markCompleted(self, data_typ, yr):
+        """
+        Record that the dataset and cycle has been formatted
+        """
+        with self.lock:
+            self.manifest.setdefault(self.key(data_typ, yr), {})['completed'] = True
+        self.saveManifest()
+
+    def remoteVersion(self, url):
+        """
+        Get the ETag, Last-Modified and size of a remote file with a HEAD request
+        ...
+        Returns
+        ----------
+         > A dictionary with the etag, last_modified and size of the file
+        """
+        request = urllib.request.Request(url, method = 'HEAD')
+        with urllib.request.urlopen(request, timeout = self.timeout) as response:
+            size = response.headers.get('Content-Length')
+            return {'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'size': int(size) if size is not None else None}
+
+    @staticmethod
+    def rangeValidator(remote):
+        """
+        The validator sent with If-Range when resuming a download.  If-Range needs a strong ETag, the Last-Modified date is
+        used when the server sends no ETag or a weak one
+        """
+        if remote['etag'] is not None and not remote['etag'].startswith('W/'):
+            return remote['etag']
+        return remote['last_modified']
+
+    def downloadFile(self, data_typ, yr, force = False):
+        """
+        Download a dataset for an election cycle, resuming a partial download if one exists.
+        ...
+        Parameters
+        ----------
+        data_typ: The source of the data to download
+        yr: The associated Year we want to download
+        force: Download the file even if the manifest says it has not changed
+        ...
+        Returns
+        ----------
+         > The path of the zip file and whether the file changed since the last download
+        """
+        url, zip_path, key = self.url(data_typ, yr), self.zipPath(data_typ, yr), self.key(data_typ, yr)
+        part_path = zip_path.with_suffix('.zip.part')
+        remote = self.remoteVersion(url)
+        entry = self.manifest.get(key, {})
+
+        # Skip the download when the validators match the copy on disk
+        unchanged = zip_path.exists() and (remote['etag'] is not None or remote['last_modified'] is not None) and \
+                    entry.get('etag') == remote['etag'] and entry.get('last_modified') == remote['last_modified']
+        if unchanged and not force:
+            return zip_path, False
+
+        # Resume the partial file only if it belongs to the same version of the remote file
+        headers = {}
+        validator = self.rangeValidator(remote)
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        same_version = validator is not None and entry.get('partial_validator') == validator
+        if offset > 0 and same_version:
+            headers['Range'] = 'bytes=%i-' % offset
+            headers['If-Range'] = validator
+        else:
+            offset = 0
+
+        with self.lock:
+            self.manifest[key] = {'url': url, 'partial_validator': validator, 'completed': False}
+        self.saveManifest()
+
+        request = urllib.request.Request(url, headers = headers)
+        try:
+            response = urllib.request.urlopen(request, timeout = self.timeout)
+        except urllib.error.HTTPError as e:
+            # The range is past the end of the file, start the download over
+            if e.code != 416:
+                raise
+            offset = 0
+            response = urllib.request.urlopen(urllib.request.Request(url), timeout = self.timeout)
+
+        with response:
+            # A 200 means the server ignored the range request and is sending the whole file
+            mode = 'ab' if response.status == 206 and offset > 0 else 'wb'
+            with open(part_path, mode) as out_file:
+                shutil.copyfileobj(response, out_file, self.block_size)
+
+        if remote['size'] is not None and part_path.stat().st_size != remote['size']:
+            raise IOError('Incomplete download of %s: expected %i bytes, got %i' % (url, remote['size'], part_path.stat().st_size))
+
+        os.replace(part_path, zip_path)
+        with self.lock:
+            self.manifest[key] = {'url': url,
+                                'etag': remote['etag'],
+                                'last_modified': remote['last_modified'],
+                                'size': remote['size'],
+                                'completed': False}
+        self.saveManifest()
+        return zip_path, True
+
+    def downloadAll(self, jobs, force = False):
+        """
+        Download a list of (dataset, cycle) pairs with a bounded pool of workers.  A failed download does not stop the others
+        and can be resumed by running again.
+        ...
+        Parameters
+        ----------
+        jobs: A list of (data_typ, yr) tuples
+        force: Download the files even if the manifest says they have not changed
+        ...
+        Returns
+        ----------
+         > A dictionary of (data_typ, yr) to (zip path, changed) and a dictionary of (data_typ, yr) to the raised exception
+        """
+        results, failures = {}, {}
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            futures = {executor.submit(self.downloadFile, data_typ, yr, force): (data_typ, yr) for data_typ, yr in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    results[job] = future.result()
+                    print('Downloaded %s data for the cycle %i' % job if results[job][1] else 'Skipping unchanged %s data for the cycle %i' % job)
+                except Exception as e:
+                    failures[job] = e
+                    print('Failed to download %s data for the cycle %i: %s' % (job[0], job[1], e))
+        return results, failures
@@ -0,0 +1,100 @@
+##!/usr/bin/env python3
+"""
+    The normalization stage for the raw FEC transaction files.  Each raw column is assigned a rule (text, zip, date, amount
+    or integer) and the rules are applied to whole arrow batches with the arrow compute kernels, so no python code runs per
+    row and the numeric columns stay numeric.
+"""
+
+#Imports
+import pyarrow as pa
+import pyarrow.compute as pc
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2019 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+#constants
+COLUMN_RULES = {"ZIP_CODE": "zip",
+                "TRANSACTION_DT": "date",
+                "TRANSACTION_AMT": "amount",
+                "FILE_NUM": "integer",
+                "SUB_ID": "integer",
+                "CAND_ELECTION_YR": "integer",
+                "FEC_ELECTION_YR": "integer",
+                "LINKAGE_ID": "integer"}
+TEXT_PATTERN = r'[^0-9a-zA-Z]+'
+NUMBER_PATTERN = r'^-?[0-9]*\.?[0-9]+$'
+DEFAULT_YEAR, DEFAULT_MONTH = 1901, 12
+
+def normalizeText(arr):
+    """
+    Replace every run of punctuation and whitespace with a dash
+    """
+    return pc.replace_substring_regex(arr, pattern = TEXT_PATTERN, replacement = '-')
+
+def normalizeZip(arr):
+    """
+    Format nine digit zip codes as zip+4 (i.e. 100011234 -> 10001-1234)
+    """
+    arr = normalizeText(arr)
+    zip_4 = pc.binary_join_element_wise(pc.utf8_slice_codeunits(arr, 0, 5), pc.utf8_slice_codeunits(arr, 5, 9), '-')
+    return pc.if_else(pc.equal(pc.utf8_length(arr), 9), zip_4, arr)
+
+def normalizeAmount(arr):
+    """
+    Coerce the transaction amounts to floats.  Letters are read as zeros like the original files and anything that still
+    isn't a number becomes null.
+    """
+    arr = pc.replace_substring_regex(pc.utf8_trim_whitespace(arr), pattern = '[a-zA-Z]', replacement = '0')
+    return pc.cast(pc.if_else(pc.match_substring_regex(arr, NUMBER_PATTERN), arr, None), pa.float64())
+
+def normalizeInteger(arr):
+    """
+    Coerce an identifier column to 64 bit integers, nulls for anything that isn't a number
+    """
+    arr = pc.utf8_trim_whitespace(arr)
+    return pc.cast(pc.if_else(pc.match_substring_regex(arr, r'^[0-9]+$'), arr, None), pa.int64())
+
+class FECNormalizer(object):
+
+    def __init__(self, col_names):
+        '''
+        An object that compiles the normalization rules for a raw FEC layout once and applies them to each batch
+        ...
+        Parameters
+        ----------
+        col_names: The raw column names of the file (i.e. CMTE_ID, TRANSACTION_DT)
+        '''
+        rules = {'text': normalizeText, 'zip': normalizeZip, 'amount': normalizeAmount, 'integer': normalizeInteger}
+        self.col_names = col_names
+        self.date_col = next((col for col in col_names if COLUMN_RULES.get(col) == 'date'), None)
+        self.steps = [(col, rules[COLUMN_RULES.get(col, 'text')]) for col in col_names if col != self.date_col]
+
+    def normalize(self, batch):
+        """
+        Normalize a batch of raw string columns
+        ...
+        Parameters
+        ----------
+        batch: An arrow RecordBatch (or Table) with the raw columns read as strings
+        ...
+        Returns
+        ----------
+         > A dictionary of the column name to the normalized arrow array.  A date column also produces the orig_ copy of the
+           raw value and the year and month
+        """
+        out = {col: fn(batch.column(col)) for col, fn in self.steps}
+        if self.date_col is not None:
+            raw_dt = batch.column(self.date_col)
+            dt = pc.strptime(raw_dt, format = '%m%d%Y', unit = 's', error_is_null = True)
+            out[self.date_col] = dt
+            out['orig_' + self.date_col] = raw_dt
+            out[self.date_col + '_YEAR'] = pc.fill_null(pc.year(dt), DEFAULT_YEAR)
+            out[self.date_col + '_MONTH'] = pc.fill_null(pc.month(dt), DEFAULT_MONTH)
+        return out
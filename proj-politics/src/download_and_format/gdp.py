@@ -5,7 +5,10 @@
 #Imports
 import warnings
 from pathlib import Path
+import numpy as np
 import pandas as pd
+from download_and_format.processed_storage import ProcessedDataStore
+from download_and_format.bea import readBEATable
 warnings.filterwarnings('ignore')
 
 __author__ = "Dylan Smith"
@@ -27,103 +30,98 @@ industries = ['All industry total','Accommodation and food services','Trade','Ut
 
 class GDPFormatter(object):
 
-    def __init__(self, data_path):
+    def __init__(self, data_path, storage = None, years = (2002, None), lag = 4):
         '''
-        
+        The object that formats the BEA county gdp tables into one row per county and election year
+        ...
+        Parameters
+        ----------
+        data_path: The path with the political data stored.
+        storage: The ProcessedDataStore the output is written to, a parquet store in the processed directory by default
+        years: A (start, end) tuple of the years to keep, either end can be None to take every year column of the file
+        lag: The number of years the gdp change is measured over
         '''
         self.raw_data = data_path.joinpath('raw','indicators')
         self.proc_data = data_path.joinpath('processed')
+        self.storage = storage if storage is not None else ProcessedDataStore(self.proc_data)
+        self.years = years
+        self.lag = lag
+
+    def yearColumns(self, df):
+        """
+        Get the election years of a BEA table in the configured year range
+        """
+        years = sorted(int(col) for col in df.columns if str(col).strip().isdigit())
+        return [yr for yr in years if yr % 2 == 0 and
+                (self.years[0] is None or yr >= self.years[0]) and (self.years[1] is None or yr <= self.years[1])]
 
-    def gdp_reformat(self, df, typ):
+    def gdp_reformat(self, df):
         """ 
         A function that reformats the gdp data to be consumed in the final output.
         ...
         Parameters
         ----------
-        df: The dataframe to 
-        typ: The type of the file to get extracted
+        df: The dataframe read from a BEA table with readBEATable
         ...
         Returns
         ----------
-         > A DataFrame
+         > A DataFrame of floats indexed by FIPS, LineCode and Description with a column per election year
         """
-        # Replace GeoFIPS with a string, drop unnecessary columns
-        df['GeoFIPS'] = df['GeoFIPS'].str.replace('"','').str.strip()
-        df['Description'] = df['Description'].str.strip()
-        df.rename(columns = {'GeoFIPS': 'FIPS'}, inplace = True)
-        df = df[df['FIPS'].astype(int) != 0]
-        df.drop(columns = ['TableName','Region','GeoName','IndustryClassification','Unit'],
-                inplace = True)
-
-        for yr in range(2002,2019):
-            df = df.replace({str(yr): {'(D)': None, '(NA)': None}})
-            df[str(yr)] = df[str(yr)].astype('float')
-
-        # Reprocess and format the data.  Pivot the data into different years
-        df = pd.melt(df, id_vars = ['FIPS','LineCode','Description'],
-                        value_vars = [str(YR) for YR in range(2002,2019)])
-        df.rename(columns = {'variable':'YR'}, inplace = True)
-        df.replace({'All industry total (percent change)': 'All industry total'},inplace = True)
-        df.insert(3,'UNIT',typ)
-        
-        return df
+        # Drop the national and footnote rows
+        df['Description'] = df['Description'].replace({'All industry total (percent change)': 'All industry total'})
+        df = df[df['GeoFIPS'].notnull() & (df['GeoFIPS'] != 0)]
+
+        # The year columns are already floats with the suppressed values as nulls
+        years = self.yearColumns(df)
+        df_values = df[[str(yr) for yr in years]].astype('float64')
+        df_values.columns = pd.Index(years, name = 'YR')
+        df_values.index = pd.MultiIndex.from_arrays([df['GeoFIPS'], df['LineCode'], df['Description']],
+                                                    names = ['FIPS','LineCode','Description'])
+        return df_values
+
+    def readGDPTable(self, file_nm):
+        """
+        Read a gzipped BEA table from the raw directory.  The dollar values don't fit in float32 so they are read as float64
+        """
+        return readBEATable(self.raw_data.joinpath(file_nm),
+                    columns = ['GeoFIPS','LineCode','Description'],
+                    compression = 'gzip',
+                    sep='\t')
 
     def processGDPData(self):
         """ 
-        A function that reformats the gdp data to be consumed in the final output.
+        A function that reformats the gdp data to be consumed in the final output.  The measures are calculated on the
+        wide tables (a row per county and industry, a column per year) and the result is reshaped once at the end.
         """
-        df_gdp = pd.read_csv(self.raw_data.joinpath('gdp_usd_all_areas.tsv.gz'),
-                    index_col = False,
-                    compression = 'gzip',
-                    sep='\t',
-                    encoding='latin-1')
-
-        df_gdp_chg = pd.read_csv(self.raw_data.joinpath('gdp_change_all_areas.tsv.gz'),
-                    index_col = False,
-                    compression = 'gzip',
-                    sep='\t',
-                    encoding='latin-1')
+        # Format the gdp data correctly and filter the extraneous industries out
+        df_usd = self.gdp_reformat(self.readGDPTable('gdp_usd_all_areas.tsv.gz'))
+        df_usd = df_usd[df_usd.index.get_level_values('Description').isin(industries)]
+        df_chg = self.gdp_reformat(self.readGDPTable('gdp_change_all_areas.tsv.gz'))
+        df_chg = df_chg[~df_chg.index.duplicated()].reindex(index = df_usd.index, columns = df_usd.columns)
 
-        # Format the gdp data correctly
-        df_gdp = self.gdp_reformat(df_gdp, 'USD')
-        df_gdp_chg = self.gdp_reformat(df_gdp_chg, 'PCT_CHG')
-
-        # Merge the two files for one output
-        df_gdp_out = df_gdp.merge(df_gdp_chg, on = ['FIPS','YR','Description','LineCode'], how = 'left')
-        df_gdp_out.drop(columns = ['UNIT_x','UNIT_y','LineCode'], inplace = True)
-        df_gdp_out.rename(columns = {'value_y': 'PCT_CHG','value_x':'USD'}, inplace = True)
-
-        # Filter the extraneous industries out of the df
-        df_gdp_out['YR'] = df_gdp_out['YR'].astype(int)
-        df_gdp_out = df_gdp_out[(df_gdp_out['YR'] % 2 == 0) &
-                                (df_gdp_out['Description'].isin(industries))]
-
-        # Get the breakdown of each industry within a county as well as normalize the total county output within the year
-        df_gdp_out['PCT_TOTL'] = df_gdp_out.groupby(['FIPS','YR'])['USD'].apply(lambda x: x * 100 / x.max())
+        # Get the breakdown of each industry within a county
+        df_pct_totl = df_usd * 100 / df_usd.groupby(level = 'FIPS').transform('max')
 
         # Normalize each counties total based upon the country + year
-        df_gdp_out.loc[df_gdp['Description'] == 'All industry total', 'USD'] = \
-        df_gdp_out[df_gdp_out['Description'] == 'All industry total'].groupby('YR')['USD'].apply(lambda x: (x - x.mean()) / x.std())
-
-        # Get the Four year ago USD output from each county and calculate the percent change
-        df_gdp_ago = df_gdp_out[['FIPS','Description','YR','USD']]
-        df_gdp_ago.rename(columns = {'USD':'FOUR_YR_PCT_CHG'}, inplace = True)
-        df_gdp_ago['YR'] = df_gdp_ago['YR'] + 4
-        df_gdp_out = df_gdp_out.merge(df_gdp_ago, on = ['FIPS','YR','Description'], how = 'left')
-        df_gdp_out['FOUR_YR_PCT_CHG'] = ((df_gdp_out['USD'] - df_gdp_out['FOUR_YR_PCT_CHG'] ) 
-                                                        / df_gdp_out['FOUR_YR_PCT_CHG'] * 100)
-
-        # Create the final Feature dataset per year
-        df_gdp_final = pd.pivot_table(df_gdp_out, index = ['YR','FIPS'], columns = 'Description')
+        total = df_usd.index.get_level_values('Description') == 'All industry total'
+        df_usd[total] = (df_usd[total] - df_usd[total].mean()) / df_usd[total].std()
+
+        # Get the output from lag years ago by shifting the year columns and calculate the percent change
+        df_ago = df_usd.reindex(columns = [yr - self.lag for yr in df_usd.columns])
+        df_ago.columns = df_usd.columns
+        df_four_yr = (df_usd - df_ago) / df_ago * 100
+
+        # Reshape to one row per year and county with a column per measure and industry
+        df_gdp_final = pd.concat({'FOUR_YR_PCT_CHG': df_four_yr, 'PCT_CHG': df_chg, 'PCT_TOTL': df_pct_totl, 'USD': df_usd},
+                                axis = 1, names = ['measure'])
+        df_gdp_final = df_gdp_final.droplevel('LineCode').stack('YR')
+        if df_gdp_final.index.duplicated().any():
+            df_gdp_final = df_gdp_final.groupby(level = ['FIPS','Description','YR']).mean()
+        df_gdp_final = df_gdp_final.unstack('Description').dropna(how = 'all').dropna(how = 'all', axis = 1)
+        df_gdp_final = df_gdp_final.reorder_levels(['YR','FIPS']).sort_index().sort_index(axis = 1)
         df_gdp_final.columns = ['%s_%s' % (ind, val) for (ind, val) in df_gdp_final.columns]
         df_gdp_final.reset_index(inplace = True)
         df_gdp_final.columns = df_gdp_final.columns.str.replace(' ', '_').str.replace(',','').str.lower()
 
         # Write the data to an outfile
-        df_gdp_final.to_csv(self.proc_data.joinpath('gdp.tsv.gz'),
-                        compression = 'gzip',
-                        mode = 'w',
-                        sep='\t',
-                        index = False,
-                        encoding='utf-8',
-                        line_terminator = '\n')
+        self.storage.writeDataset(df_gdp_final, 'gdp')
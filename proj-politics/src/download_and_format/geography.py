@@ -0,0 +1,319 @@
+##!/usr/bin/env python
+"""
+    The shared geography keys.  FIPS codes are held as nullable 32 bit integers (state * 1000 + county) and states as a
+    categorical of the postal codes with fixed categories, so every formatter produces join keys of the same compact dtype
+    instead of zero padded strings.  The canonical county table (FIPS, state and county names) is built once from the
+    census estimates and kept in the processed store, and the congressional district to county crosswalks are built once
+    from the census block files and memory mapped on later runs.
+"""
+
+#imports
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2020 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+# Constants
+STATES = [(1, 'AL', 'Alabama'), (2, 'AK', 'Alaska'), (4, 'AZ', 'Arizona'), (5, 'AR', 'Arkansas'), (6, 'CA', 'California'),
+          (8, 'CO', 'Colorado'), (9, 'CT', 'Connecticut'), (10, 'DE', 'Delaware'), (11, 'DC', 'District of Columbia'),
+          (12, 'FL', 'Florida'), (13, 'GA', 'Georgia'), (15, 'HI', 'Hawaii'), (16, 'ID', 'Idaho'), (17, 'IL', 'Illinois'),
+          (18, 'IN', 'Indiana'), (19, 'IA', 'Iowa'), (20, 'KS', 'Kansas'), (21, 'KY', 'Kentucky'), (22, 'LA', 'Louisiana'),
+          (23, 'ME', 'Maine'), (24, 'MD', 'Maryland'), (25, 'MA', 'Massachusetts'), (26, 'MI', 'Michigan'),
+          (27, 'MN', 'Minnesota'), (28, 'MS', 'Mississippi'), (29, 'MO', 'Missouri'), (30, 'MT', 'Montana'),
+          (31, 'NE', 'Nebraska'), (32, 'NV', 'Nevada'), (33, 'NH', 'New Hampshire'), (34, 'NJ', 'New Jersey'),
+          (35, 'NM', 'New Mexico'), (36, 'NY', 'New York'), (37, 'NC', 'North Carolina'), (38, 'ND', 'North Dakota'),
+          (39, 'OH', 'Ohio'), (40, 'OK', 'Oklahoma'), (41, 'OR', 'Oregon'), (42, 'PA', 'Pennsylvania'),
+          (44, 'RI', 'Rhode Island'), (45, 'SC', 'South Carolina'), (46, 'SD', 'South Dakota'), (47, 'TN', 'Tennessee'),
+          (48, 'TX', 'Texas'), (49, 'UT', 'Utah'), (50, 'VT', 'Vermont'), (51, 'VA', 'Virginia'), (53, 'WA', 'Washington'),
+          (54, 'WV', 'West Virginia'), (55, 'WI', 'Wisconsin'), (56, 'WY', 'Wyoming'), (72, 'PR', 'Puerto Rico')]
+FIPS_DTYPE = 'Int32'
+YEAR_DTYPE = 'int16'
+STATE_DTYPE = pd.CategoricalDtype([po for _, po, _ in STATES])
+STATE_LOOKUP = dict([(po, po) for _, po, _ in STATES] + [(name.upper(), po) for _, po, name in STATES])
+KEY_DTYPES = {'fips': FIPS_DTYPE, 'state': STATE_DTYPE, 'year': YEAR_DTYPE}
+# Historical counties, renamed counties and spellings used by the election results that aren't census county names
+COUNTY_ALIASES = [('SD', 'SHANNON', 46102), ('SD', 'WASHINGTON', 46102), ('SD', 'WASHABAUGH', 46071), ('SD', 'KINGSBURG', 46077),
+                  ('VA', 'CLIFTONFORGE', 51005), ('VA', 'SOUTHBOSTON', 30122), ('VA', 'NANSEMOND', 51800),
+                  ('NM', 'DONAANA', 35013), ('GA', 'MILTON', 13203)]
+
+def encodeFIPS(values):
+    """
+    Encode FIPS codes as integers.  Accepts zero padded or quoted strings (i.e. ' "01001"'), integers and floats, anything
+    that isn't a number becomes null
+    """
+    values = pd.Series(values)
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        values = values.astype(str).str.replace('"', '', regex = False).str.strip()
+    return pd.to_numeric(values, errors = 'coerce').round().astype(FIPS_DTYPE)
+
+def countyFIPS(state, county):
+    """
+    Build the FIPS code of a county from its state and county codes
+    """
+    return encodeFIPS(np.asarray(state) * 1000 + np.asarray(county))
+
+def stateFIPS(fips):
+    """
+    The state code of a FIPS code
+    """
+    return (pd.Series(fips) // 1000).astype(FIPS_DTYPE)
+
+def formatFIPS(fips):
+    """
+    Format FIPS codes as zero padded five character strings for display, nulls stay null
+    """
+    fips = pd.Series(fips)
+    return fips.astype('string').str.zfill(5).astype(object).where(fips.notnull(), None)
+
+def encodeState(values):
+    """
+    Encode states given as postal codes or names as the categorical of postal codes
+    """
+    return pd.Series(values).astype(str).str.strip().str.upper().map(STATE_LOOKUP).astype(STATE_DTYPE)
+
+def encodeYear(values):
+    """
+    Encode years as small integers
+    """
+    return pd.Series(values).astype(YEAR_DTYPE)
+
+def normalizeCountyName(names):
+    """
+    Normalize county names for matching: accents, the County and Parish suffixes, the /Washabaugh of Jackson county and
+    anything that isn't a letter or number are removed
+    ...
+    Returns
+    ----------
+     > A tuple of the normalized names and the normalized names without 'city'
+    """
+    names = pd.Series(names).fillna('').astype(str).str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+    names = names.str.upper().str.replace(r' (COUNTY|PARISH)\b', '', regex = True).str.replace('/WASHABAUGH', '', regex = False)
+    return (names.str.replace('[^0-9A-Z]', '', regex = True),
+            names.str.replace(' CITY', '', regex = False).str.replace('[^0-9A-Z]', '', regex = True))
+
+def encodeKeys(df, keys = None):
+    """
+    Cast the key columns of a DataFrame (i.e. as read back from storage) to their canonical dtypes in place
+    ...
+    Parameters
+    ----------
+    df: The DataFrame
+    keys: A dictionary of the key columns to their kind of key ('fips', 'state' or 'year'), only the fips column if None
+    """
+    encoders = {'fips': encodeFIPS, 'state': encodeState, 'year': encodeYear}
+    for col, kind in (keys if keys is not None else {'fips': 'fips'}).items():
+        if col in df.columns and df[col].dtype != KEY_DTYPES[kind]:
+            df[col] = encoders[kind](df[col]).values
+    return df
+
+class CountyLookup(object):
+
+    def __init__(self, data_path, storage):
+        '''
+        The canonical county table, built from the census county estimates and cached in the processed store
+        ...
+        Parameters
+        ----------
+        data_path: The path with the political data stored.
+        storage: The ProcessedDataStore the table is cached in
+        '''
+        self.census_path = data_path.joinpath('raw','demographics','2018','cc-est2018-alldata.csv.gz')
+        self.storage = storage
+
+    def buildTable(self):
+        """
+        Read the state and county names of every county from the census estimates
+        ...
+        Returns
+        ----------
+         > A DataFrame with the fips, state_fips, state_po, state_name and county_name columns
+        """
+        df = pd.read_csv(self.census_path,
+                        index_col = False,
+                        compression = 'gzip',
+                        sep = '\t',
+                        usecols = ['STATE','COUNTY','STNAME','CTYNAME'],
+                        dtype = {'STATE': 'int64', 'COUNTY': 'int64', 'STNAME': str, 'CTYNAME': str},
+                        encoding = 'latin-1').drop_duplicates()
+        return pd.DataFrame({'fips': countyFIPS(df['STATE'], df['COUNTY']).values,
+                            'state_fips': df['STATE'].astype(FIPS_DTYPE).values,
+                            'state_po': encodeState(df['STNAME']).values,
+                            'state_name': df['STNAME'].values,
+                            'county_name': df['CTYNAME'].values})
+
+    def table(self, rebuild = False):
+        """
+        Get the county table, building and caching it when it isn't in the store or the census file is newer than the cache
+        ...
+        Parameters
+        ----------
+        rebuild: Rebuild the table from the census file
+        """
+        cache_path = self.storage.datasetPath('counties')
+        if not rebuild and cache_path.exists() and \
+                (not self.census_path.exists() or cache_path.stat().st_mtime >= self.census_path.stat().st_mtime):
+            df = self.storage.readDataset('counties')
+            df['state_po'] = df['state_po'].astype(str).where(df['state_po'].notnull(), np.nan).astype(STATE_DTYPE)
+            return df
+
+        df = self.buildTable()
+        self.storage.writeDataset(df, 'counties')
+        return df
+
+class CountyNameIndex(object):
+
+    def __init__(self, counties, storage):
+        '''
+        An index from (state, normalized county name) to FIPS code used to resolve the areas of the election results.  It
+        holds the census county names, their names without 'city' and the historical counties and known aliases, and is
+        cached in the processed store next to the county table.
+        ...
+        Parameters
+        ----------
+        counties: The CountyLookup the index is built from
+        storage: The ProcessedDataStore the index is cached in
+        '''
+        self.counties = counties
+        self.storage = storage
+        self.lookup = None
+
+    def build(self):
+        """
+        Build the index entries.  A name without 'city' is only added when it doesn't collide with another name in the state
+        (i.e. Richmond city and Richmond County) and the aliases only fill names the census doesn't have
+        ...
+        Returns
+        ----------
+         > A DataFrame with the state_po, name_key, fips and source columns
+        """
+        df = self.counties.table()
+        full_keys, base_keys = normalizeCountyName(df['county_name'])
+        df_full = pd.DataFrame({'state_po': df['state_po'].astype(str).values, 'name_key': full_keys.values,
+                                'fips': df['fips'].values, 'source': 'census'})
+        df_base = pd.DataFrame({'state_po': df['state_po'].astype(str).values, 'name_key': base_keys.values,
+                                'fips': df['fips'].values, 'source': 'census_base'})
+        df_base = df_base.drop_duplicates(['state_po','name_key'], keep = False)
+        df_alias = pd.DataFrame([(po, name, fips, 'alias') for po, name, fips in COUNTY_ALIASES],
+                                columns = ['state_po','name_key','fips','source'])
+
+        df_index = pd.concat([df_full, df_base, df_alias], ignore_index = True)
+        df_index = df_index[df_index['state_po'] != 'nan'].drop_duplicates(['state_po','name_key'], keep = 'first')
+        df_index['fips'] = encodeFIPS(df_index['fips']).values
+        return df_index.reset_index(drop = True)
+
+    def load(self, rebuild = False):
+        """
+        Load the index into a dictionary, rebuilding the cached index when the county table is newer
+        """
+        counties_path = self.storage.datasetPath('counties')
+        cache_path = self.storage.datasetPath('county_index')
+        self.counties.table()
+        if not rebuild and cache_path.exists() and cache_path.stat().st_mtime >= counties_path.stat().st_mtime:
+            df_index = self.storage.readDataset('county_index')
+        else:
+            df_index = self.build()
+            self.storage.writeDataset(df_index, 'county_index')
+
+        self.lookup = dict(zip(zip(df_index['state_po'].astype(str), df_index['name_key']), df_index['fips']))
+        return self.lookup
+
+    def resolve(self, states, names):
+        """
+        Resolve the FIPS codes of a list of counties.  Each distinct (state, name) pair is looked up once
+        ...
+        Parameters
+        ----------
+        states: The states of the counties, as postal codes or names
+        names: The county names as written in the source
+        ...
+        Returns
+        ----------
+         > A tuple of the Int32 FIPS codes and the set of (state, name) pairs that couldn't be resolved
+        """
+        if self.lookup is None:
+            self.load()
+
+        df = pd.DataFrame({'state_po': encodeState(states).astype(str).values, 'name': pd.Series(names).values})
+        df_pairs = df.drop_duplicates().reset_index(drop = True)
+        full_keys, base_keys = normalizeCountyName(df_pairs['name'])
+        df_pairs['fips'] = [self.lookup.get((po, full), self.lookup.get((po, base)))
+                            for po, full, base in zip(df_pairs['state_po'], full_keys, base_keys)]
+        df_pairs['fips'] = encodeFIPS(df_pairs['fips']).values
+
+        fips = df.merge(df_pairs, on = ['state_po','name'], how = 'left')['fips']
+        missing = df_pairs[df_pairs['fips'].isnull()]
+        return fips.values, set(zip(missing['state_po'], missing['name']))
+
+class DistrictCrosswalk(object):
+
+    def __init__(self, data_path, plan = 'cd116', chunksize = 1000000):
+        '''
+        The congressional district to county crosswalk of a district plan, built from the census block assignment file of
+        the plan (i.e. lookup/cd116/National_CD116.txt) and cached as an arrow file in the processed crosswalks directory
+        ...
+        Parameters
+        ----------
+        data_path: The path with the political data stored.
+        plan: The district plan (i.e. cd116 or cd118)
+        chunksize: The number of blocks read at a time when the crosswalk is built
+        '''
+        self.plan = plan.lower()
+        self.block_path = data_path.joinpath('raw','lookup', self.plan, 'National_%s.txt' % self.plan.upper())
+        self.cache_path = data_path.joinpath('processed','crosswalks','%s.arrow' % self.plan)
+        self.chunksize = chunksize
+
+    def buildTable(self):
+        """
+        Count the blocks of each county in each district.  The block file holds no population so the weight of a district in
+        a split county is its share of the county's blocks
+        ...
+        Returns
+        ----------
+         > A DataFrame with the fips, state_fips, district, blocks and weight columns
+        """
+        counts = []
+        for df in pd.read_csv(self.block_path,
+                            index_col = False,
+                            usecols = ['BLOCKID', self.plan.upper()],
+                            dtype = str,
+                            encoding = 'latin-1',
+                            chunksize = self.chunksize):
+            counts.append(pd.DataFrame({'fips': encodeFIPS(df['BLOCKID'].str[:5]).values,
+                                        'district': pd.to_numeric(df[self.plan.upper()], errors = 'coerce').values})
+                            .value_counts(dropna = False))
+
+        # Blocks outside a numbered district (i.e. ZZ for water) aren't assigned
+        df = pd.concat(counts).groupby(level = [0, 1], dropna = False).sum().rename('blocks').reset_index()
+        df = df[df['fips'].notnull() & df['district'].notnull()]
+        df['district'] = df['district'].astype('int64')
+        df['weight'] = df['blocks'] / df.groupby('fips')['blocks'].transform('sum')
+        df.insert(1, 'state_fips', (df['fips'] // 1000).astype('int64'))
+        return df.sort_values(['fips','district']).reset_index(drop = True)
+
+    def table(self, rebuild = False):
+        """
+        Get the crosswalk, memory mapping the cached arrow file or building it when it is missing or the block file is newer
+        ...
+        Parameters
+        ----------
+        rebuild: Rebuild the crosswalk from the block file
+        """
+        if not rebuild and self.cache_path.exists() and \
+                (not self.block_path.exists() or self.cache_path.stat().st_mtime >= self.block_path.stat().st_mtime):
+            return pa.ipc.open_file(pa.memory_map(str(self.cache_path))).read_pandas()
+
+        df = self.buildTable()
+        self.cache_path.parent.mkdir(parents = True, exist_ok = True)
+        table = pa.Table.from_pandas(df, preserve_index = False)
+        with pa.OSFile(str(self.cache_path), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        return df
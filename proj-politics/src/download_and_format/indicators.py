@@ -8,6 +8,10 @@ import pandas as pd
 from os import listdir
 from os.path import isfile, join
 import numpy as np
+from download_and_format.processed_storage import ProcessedDataStore
+from download_and_format.geography import encodeFIPS, encodeState
+from download_and_format.bea import readBEATable
+from download_and_format.raw_cache import RawSourceCache
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -27,17 +31,20 @@ EMPLOY_SECTOR_REPLACE = {'AGRICULTURAL SERVICES, FORESTRY, AND FISHING':'FORESTR
 
 class IndicatorDataFormatter(object):
 
-    def __init__(self, data_path):
+    def __init__(self, data_path, storage = None):
         '''
         An object that formats the indicator data and stores processed data into the correct format
         ...
         Parameters
         ----------
         data_path: The path where all of the formatted political data is located.
+        storage: The ProcessedDataStore the output is written to, a parquet store in the processed directory by default
         '''
         self.raw_indi_path = data_path.joinpath('raw','indicators')
         self.raw_employ_path = data_path.joinpath('raw','employment')
         self.proc_data = data_path.joinpath('processed')
+        self.storage = storage if storage is not None else ProcessedDataStore(self.proc_data)
+        self.raw_cache = RawSourceCache(self.proc_data.joinpath('raw_cache'))
 
     def formatCultureData(self):
         """ 
@@ -46,7 +53,8 @@ class IndicatorDataFormatter(object):
         df_culture = pd.read_csv(self.raw_indi_path.joinpath('regions.csv'),
                             index_col = False,
                             encoding='latin-1',
-                            dtype = {'FIPS':np.str})
+                            dtype = {'FIPS':str})
+        df_culture['FIPS'] = encodeFIPS(df_culture['FIPS']).values
 
         df_county = pd.read_csv(self.raw_indi_path.joinpath('Rural_Atlas_Update22','County Classifications.tsv.gz'),
                         index_col = False,
@@ -55,7 +63,7 @@ class IndicatorDataFormatter(object):
         
         # Format the County file
         df_county.rename({'ï»¿FIPStxt':"FIPS"}, axis = 'columns', inplace = True)
-        df_county['FIPS'] = df_county['FIPS'].astype(str).str.pad(width = 5, side = 'left', fillchar = '0')
+        df_county['FIPS'] = encodeFIPS(df_county['FIPS']).values
 
         # Format the Rural Urban Continuum
         df_county = df_county[['FIPS'] + ['%s%s' % (col, yr) for yr in [2003,2013] for col in ['RuralUrbanContinuumCode','UrbanInfluenceCode','Metro','Nonmetro','Micropolitan']]]
@@ -75,112 +83,94 @@ class IndicatorDataFormatter(object):
 
         # Rename the column names
         df_cult_out.columns = df_cult_out.columns.str.lower()
-        df_cult_out.to_csv(self.proc_data.joinpath('culture.tsv.gz'),
-                            sep = '\t',
-                            encoding = 'utf-8',
-                            compression = 'gzip',
-                            index = False)
+        self.storage.writeDataset(df_cult_out, 'culture')
 
-    def outputCleanEmploymentValues(self, df_emp):
+    def outputCleanEmploymentValues(self, file_nm):
         """ 
-        A function that outputs each of the employment datasets for merging into later datasets
+        A function that reads one of the employment tables for merging into later datasets.  The job counts fit in float32
+        exactly so they are read as float32
         ...
         Parameters
         ----------
-        df_emp: The dataframe with the prior employment data
+        file_nm: The name of the CAEMP25 table in the raw employment directory
+        ...
+        Returns
+        ----------
+         > A DataFrame of job counts indexed by FIPS and Description with a column per year
         """
-        df_emp.rename(columns = {'GeoFIPS':'FIPS'}, inplace = True)
-        df_emp.drop(columns = ['GeoName','Region','TableName','IndustryClassification','Unit','LineCode'], inplace = True)
-        df_emp = df_emp[~df_emp['FIPS'].str.replace("\"",'').apply(pd.to_numeric, errors='coerce').isna()]
-        df_emp['FIPS'] = df_emp['FIPS'].str.replace('\"','').str.strip()
-        df_emp['Description'] = df_emp['Description'].str.strip().str.upper()
-        return df_emp
+        df_emp = readBEATable(self.raw_employ_path.joinpath(file_nm),
+                        columns = ['GeoFIPS','Description'],
+                        value_dtype = 'float32')
+        df_emp = df_emp[df_emp['GeoFIPS'].notnull()]
+        return df_emp.set_index([df_emp.pop('GeoFIPS').rename('FIPS'), df_emp.pop('Description').str.upper()])
 
     def formatEmploymentData(self):
         """
         A function that formats the employment data based on the files added to the raw directory
         """
-        # Format all the history files and write them to the output
-        df_empHist = pd.read_csv(self.raw_employ_path.joinpath('CAEMP25S__ALL_AREAS_1969_2000.csv'),
-                        index_col = False,
-                        encoding = 'latin-1',
-                        dtype = {'LineCode':np.str})
-
-        # Format all the history files and write them to the output
-        df_empCurr = pd.read_csv(self.raw_employ_path.joinpath('CAEMP25N__ALL_AREAS_2001_2018.csv'),
-                        index_col = False,
-                        encoding = 'latin-1',
-                        dtype = {'LineCode':np.str})
+        # Read the history (SIC) and current (NAICS) tables, the history sectors are renamed to the current ones and only
+        # the counties and sectors of the current table are kept
+        df_empCurr = self.outputCleanEmploymentValues('CAEMP25N__ALL_AREAS_2001_2018.csv')
+        df_empHist = self.outputCleanEmploymentValues('CAEMP25S__ALL_AREAS_1969_2000.csv')
+        df_empHist = df_empHist.rename(index = EMPLOY_SECTOR_REPLACE, level = 'Description')
+        df_empHist = df_empHist[~df_empHist.index.duplicated()].reindex(df_empCurr.index)
+
+        # Reshape to one row per county and year with a column per sector
+        df_employment = pd.concat([df_empCurr, df_empHist], axis = 1)
+        df_employment.columns = pd.Index(df_employment.columns.astype(int), name = 'YR')
+        df_employment = df_employment.stack('YR', dropna = False).unstack('Description').sort_index().sort_index(axis = 1)
+
+        # Get percentage of employment for each county for each year, divided in float32 like the counts were read
+        sectors = df_employment.columns != 'TOTAL EMPLOYMENT (NUMBER OF JOBS)'
+        df_employment.loc[:, sectors] = df_employment.loc[:, sectors].div(df_employment['TOTAL EMPLOYMENT (NUMBER OF JOBS)'], axis = 0)
+        df_employment.columns.name = None
+        employ_cols = list(df_employment.columns)
+        df_employment.reset_index(inplace = True)
 
         df_income = pd.read_csv(self.raw_indi_path.joinpath('Rural_Atlas_Update22', 'Income.tsv.gz'),
                     index_col = False,
                     compression = 'gzip',
                     sep='\t')
         # Read Files necessary for Unemployment Analysis
-        df_unemp = pd.read_excel(self.raw_indi_path.joinpath('Unemployment.xls'),
-                        index_col = False)
-
-        df_empHist = self.outputCleanEmploymentValues(df_emp = df_empHist)
-        df_empHist['Description'] = df_empHist['Description'].replace(EMPLOY_SECTOR_REPLACE)
-        df_empCurr = self.outputCleanEmploymentValues( df_emp = df_empCurr)
-
-        df_employment = df_empCurr.merge(df_empHist, how = 'left', on = ['FIPS','Description'])
-        # Reverse Pivot the years into rows and take care of formatting issues for the below pivot
-        df_employment = pd.melt(df_employment, id_vars = ['FIPS','Description'])
-        df_employment.rename(columns = {'variable':'YR'}, inplace = True)
-        df_employment['value'] = df_employment['value'].str.replace('\(NA\)','').str.replace('\(D\)','')
-        df_employment['value'] = df_employment['value'].apply(lambda x: float(x) if x != '' else np.nan)
-
-        # Pivot the table to get years as the rows and employment as the column values
-        df_employment = df_employment.pivot(index = ['FIPS','YR'], columns = 'Description')
-        df_employment.reset_index(inplace = True)
-        df_employment.columns = ['FIPS','YR'] + [y for (x,y) in df_employment.columns[2:]]
-        df_employment['YR'] = df_employment['YR'].astype(int)
-
-        # Get percentage of employment for each county for each year
-        for sector in list(df_employment)[2:]:
-            if sector == 'TOTAL EMPLOYMENT (NUMBER OF JOBS)':
-                continue
-            df_employment[sector] = df_employment[sector].astype(float) / df_employment['TOTAL EMPLOYMENT (NUMBER OF JOBS)'].astype(float)
+        df_unemp = self.raw_cache.readExcel(self.raw_indi_path.joinpath('Unemployment.xls'))
 
         # Select the desired columns the income values and rename to reflect the current status
         df_income.rename({'ï»¿FIPS':"FIPS"}, axis = 'columns', inplace = True)
         df_income = df_income[['FIPS','State','MedHHInc','PerCapitaInc','PovertyUnder18Pct','PovertyAllAgesPct',
                                 'Deep_Pov_All', 'Deep_Pov_Children' ]]
         df_income.columns = ['FIPS','State'] + ['Curr_%s' % col for col in df_income.columns[2:]]
-        df_income['FIPS'] = df_income['FIPS'].astype(str).str.pad(width = 5, side = 'left', fillchar = '0')
+        df_income['FIPS'] = encodeFIPS(df_income['FIPS']).values
 
         # Reverse Pivot the years into rows and take care of formatting issues for the below pivot
         df_unemp = df_unemp[['FIPS','State'] + ['Unemployment_rate_%s' % yr for yr in range(2007,2019)]]
         df_unemp = pd.melt(df_unemp, id_vars = ['FIPS','State'])
         df_unemp.rename(columns = {'value': 'Unemployment_Rate', 'variable':'YR'}, inplace = True)
         df_unemp['YR'] = df_unemp['YR'].str.replace('Unemployment_rate_','').astype(int)
-        df_unemp['FIPS'] = df_unemp['FIPS'].astype(str).str.pad(width = 5, side = 'left', fillchar = '0')
+        df_unemp['FIPS'] = encodeFIPS(df_unemp['FIPS']).values
 
         # Format the dataframes and merge them to form one output
+        df_unemp['State'] = encodeState(df_unemp['State']).values
+        df_income['State'] = encodeState(df_income['State']).values
         df_employ = df_unemp.merge(df_income, on = ['FIPS','State'], how = 'left').\
                             merge(df_employment, on = ['FIPS','YR'], how = 'left')
+        # Only the merged years are upcast, the stored employment columns stay float64
+        df_employ[employ_cols] = df_employ[employ_cols].astype('float64')
         # rename columns
         df_employ.columns = df_employ.columns.str.replace(' ', '_').str.replace(',','').str.replace('(','')\
                                             .str.replace(')','').str.replace('/','').str.lower()
 
         # Write to a file
-        df_employ.to_csv(self.proc_data.joinpath('employment.tsv.gz'),
-                            sep = '\t',
-                            encoding = 'utf-8',
-                            compression = 'gzip',
-                            index = False)
+        self.storage.writeDataset(df_employ, 'employment')
 
     def formatEducationData(self):
         """ 
         A function that formats and returns the education data in an output format
         """
-        df_edu = pd.read_excel(self.raw_indi_path.joinpath('Education.xls'),
-                    index_col = False)
+        df_edu = self.raw_cache.readExcel(self.raw_indi_path.joinpath('Education.xls'))
 
         # Format and select the appropriate columns
         df_edu = df_edu[['FIPS','State'] + [col for col in df_edu.columns if 'percent' in col.lower() or 'PCT_' in col]]
-        df_edu = df_edu[['FIPS','State'] + [col for col in df_edu.columns if 'percent' in col.lower() or 'PCT_' in col]]
+        df_edu['FIPS'] = encodeFIPS(df_edu['FIPS']).values
         df_edu.columns = df_edu.columns.str.replace('Percent of adults with less than a high school diploma, ', 'PCT_LESS_HS_')\
                             .str.replace('Percent of adults with a high school diploma only, ','PCT_HS_')\
                             .str.replace('Percent of adults completing some college \(1-3 years\),', 'PCT_SOME_BA_')\
@@ -189,21 +179,16 @@ class IndicatorDataFormatter(object):
                             .str.replace("Percent of adults with a bachelor's degree or higher,", 'PCT_EQ_MORE_BA_')\
                             .str.replace("13_17", '2010').str.replace(' ','')
 
-        # Pivot the formatting to the year level
-        df_edu_out = pd.DataFrame()
-        for yr in ['1970', '1980', '1990', '2000', '2010']:
-            df_yrs = df_edu[['FIPS','State']]
-            df_yrs["year"] = int(yr)
-            for edu_lvl in ['PCT_LESS_HS_%s','PCT_HS_%s','PCT_SOME_BA_%s','PCT_EQ_MORE_BA_%s']:
-                df_yrs[edu_lvl.replace('_%s','')] = df_edu[edu_lvl % yr]
-            df_edu_out = pd.concat([df_edu_out, df_yrs])
+        # Reshape to a row per county and year, the years are stacked in order like the counties within them
+        years, levels = [1970, 1980, 1990, 2000, 2010], ['PCT_LESS_HS','PCT_HS','PCT_SOME_BA','PCT_EQ_MORE_BA']
+        values = df_edu[['%s_%i' % (lvl, yr) for yr in years for lvl in levels]].to_numpy()
+        values = values.reshape(len(df_edu), len(years), len(levels)).transpose(1, 0, 2).reshape(-1, len(levels))
+        df_edu_out = df_edu[['FIPS','State']].iloc[np.tile(np.arange(len(df_edu)), len(years))]
+        df_edu_out['year'] = np.repeat(years, len(df_edu))
+        df_edu_out[levels] = values
         
         # Rename the column names
         df_edu_out.columns = df_edu_out.columns.str.lower()
         
         # Write the file out
-        df_edu_out.to_csv(self.proc_data.joinpath('education.tsv.gz'),
-                            sep = '\t',
-                            encoding = 'utf-8',
-                            compression = 'gzip',
-                            index = False)
+        self.storage.writeDataset(df_edu_out, 'education')
@@ -5,7 +5,12 @@
 """
 
 #imports
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 __author__ = "Dylan Smith"
@@ -18,21 +23,87 @@ __maintainer__ = "Dylan Smith"
 __email__ = "-"
 
 class ParquetReader(object):
-    """ 
+    """
     An object that splits up reading large partitioned parquet files to enable quicker scans.
 
     """
-    def __init__(self, parquet_path, partition_nm, n = 40):
+    def __init__(self, parquet_path, partition_nm, n = 40, columns = None, filters = None, prefetch = 2, as_arrow = False):
         """ Object that runs all the SQL commands in the projects
             ::param parquet_path: A Pathlib path where the parquet file is stored
+            ::param partition_nm: The name of the top level partition the groups are made from
             ::param n: The size of each group
+            ::param columns: A list of the columns to read, all columns if None
+            ::param filters: Row filters in the pyarrow list of tuples format, i.e. [('contributor_state', '=', 'NY')].  Filters on
+                             the partition columns skip whole directories, the others are checked against the row group statistics
+            ::param prefetch: The number of upcoming groups read ahead in background threads.  At most prefetch + 1 groups
+                              are held in memory
+            ::param as_arrow: Return arrow Tables instead of pandas DataFrames
         """
-        dirs = [x for x in parquet_path.iterdir() if x.is_dir()]
+        dirs = [x for x in parquet_path.iterdir() if x.is_dir() and x.name.startswith('%s=' % partition_nm)]
         self.partition_nm = partition_nm
         self.parquet_path = parquet_path
         self.grouped_pars = [dirs[i * n:(i + 1) * n] for i in range((len(dirs) + n - 1) // n )]
         self.ix = 0
         self.max_ix = len(self.grouped_pars)
+        self.columns = columns
+        self.as_arrow = as_arrow
+
+        self.dataset = ds.dataset(str(parquet_path), format = 'parquet', partitioning = 'hive')
+        self.filter = pq.filters_to_expression(filters) if filters else None
+        self.prefetch = max(prefetch, 0)
+        self.executor = ThreadPoolExecutor(max_workers = max(self.prefetch, 1))
+        self.pending = deque()
+
+    def groupExpression(self, group):
+        """ Build the filter expression for a group of partitions combined with the row filters
+            ::param group: A list of the partition directories in the group
+        """
+        partition_type = self.dataset.schema.field(self.partition_nm).type
+        values = pa.array([x.name.split("=", 1)[1] for x in group]).cast(partition_type)
+        expression = pc.field(self.partition_nm).isin(values)
+        if self.filter is not None:
+            expression = expression & self.filter
+        return expression
+
+    def readGroup(self, ix):
+        """ Read one group of partitions into an arrow table, only reading the requested columns and rows
+            ::param ix: The index of the group to read
+        """
+        return self.dataset.to_table(columns = self.columns, filter = self.groupExpression(self.grouped_pars[ix]))
+
+    def fillPrefetch(self):
+        """ Submit the upcoming groups to the thread pool until prefetch groups are being read ahead
+        """
+        while len(self.pending) < max(self.prefetch, 1) and self.ix < self.max_ix:
+            self.pending.append(self.executor.submit(self.readGroup, self.ix))
+            self.ix += 1
+
+    def batches(self, batch_size = 1 << 17):
+        """ Generator over all of the groups that streams arrow RecordBatches, a group is scanned batch by batch and is never
+            read into memory whole
+            ::param batch_size: The most rows in a batch
+        """
+        try:
+            for group in self.grouped_pars:
+                for batch in self.dataset.to_batches(columns = self.columns, filter = self.groupExpression(group), batch_size = batch_size):
+                    yield batch
+        finally:
+            self.close()
+
+    def close(self):
+        """ Stop reading ahead and shut down the thread pool.  Called once the groups run out, use the reader as a context
+            manager (or call close) when the iteration can stop early
+        """
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait = True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def __iter__(self):
         """ Function that allows the object to be an iterator
@@ -41,12 +112,17 @@ class ParquetReader(object):
 
     def __next__(self):
         """ As the iterator goes through each object, get the next group of partitions and read into a pandas dataset
-            returns: Returns a pandas dataset with the appropriate amount of objects
+            returns: Returns a pandas dataset (or an arrow table) with the appropriate amount of objects
         """
-        if self.ix < self.max_ix:
-            filter_list = [[(self.partition_nm, '=', x.name.split("=")[1])] for x in self.grouped_pars[self.ix]]
-            dataset = pq.ParquetDataset(self.parquet_path, filters=filter_list)
-            self.ix += 1
-            return dataset.read().to_pandas()
+        try:
+            self.fillPrefetch()
+            if len(self.pending) > 0:
+                table = self.pending.popleft().result()
+                self.fillPrefetch()
+                return table if self.as_arrow else table.to_pandas()
+        except BaseException:
+            self.close()
+            raise
 
+        self.close()
         raise StopIteration
@@ -0,0 +1,287 @@
+##!/usr/bin/env python
+"""
+    An object that reads and writes the processed politics datasets.  The formatters hand their final dataframe to the store
+    which writes it as a typed, year partitioned parquet (or arrow ipc) dataset so the consolidation step can load only the
+    columns and years it needs instead of re-parsing a gzipped tsv.
+"""
+
+#imports
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from download_and_format.geography import encodeKeys
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2020 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+# Constants
+BACKENDS = {'parquet': 'parquet', 'ipc': 'feather', 'tsv': 'tsv.gz'}
+YEAR_COLUMNS = {'mit_voting': 'year',
+                'cq_voting': 'raceyear',
+                'culture': 'year_join',
+                'gdp': 'yr',
+                'employment': 'yr',
+                'demographics': 'year',
+                'education': 'year',
+                'vdem_party': 'year',
+                'voting_demographic': 'year'}
+# The join keys of each dataset and their kind, they are stored and read back in the canonical dtypes of geography.py.  The
+# state of the demographics is the state FIPS code
+KEY_COLUMNS = {'mit_voting': {'fips': 'fips', 'state_po': 'state', 'year': 'year'},
+                'cq_voting': {'fips': 'fips', 'state': 'state', 'raceyear': 'year'},
+                'culture': {'fips': 'fips', 'state': 'state', 'year_join': 'year'},
+                'gdp': {'fips': 'fips', 'yr': 'year'},
+                'employment': {'fips': 'fips', 'state': 'state', 'yr': 'year'},
+                'demographics': {'fips': 'fips', 'state': 'fips', 'year': 'year'},
+                'education': {'fips': 'fips', 'state': 'state', 'year': 'year'},
+                'vdem_party': {'year': 'year'},
+                'voting_demographic': {'fips': 'fips', 'state_po': 'state', 'year': 'year'}}
+
+class ProcessedDataStore(object):
+
+    def __init__(self, proc_data, backend = 'parquet'):
+        '''
+        An object that stores the processed datasets in the selected backend and reads them back with column and year pruning
+        ...
+        Parameters
+        ----------
+        proc_data: The processed data directory
+        backend: The storage format (parquet, ipc or the legacy tsv)
+        '''
+        if backend not in BACKENDS:
+            raise ValueError('Unknown storage backend %s, expected one of %s' % (backend, ', '.join(BACKENDS)))
+        self.proc_data = proc_data
+        self.backend = backend
+
+    def datasetPath(self, name):
+        """
+        Get the path of a processed dataset for the current backend
+        ...
+        Parameters
+        ----------
+        name: The name of the dataset (i.e. gdp)
+        """
+        return self.proc_data.joinpath('%s.%s' % (name, BACKENDS[self.backend]))
+
+    @staticmethod
+    def encodeKeys(df, name):
+        """
+        Cast the fips, state and year keys of a dataset to their canonical dtypes, the caller's dataframe is left as is
+        ...
+        Parameters
+        ----------
+        df: The dataframe of the dataset
+        name: The name of the dataset
+        """
+        return encodeKeys(df.copy(deep = False), KEY_COLUMNS.get(name))
+
+    @staticmethod
+    def toArrowTable(df):
+        """
+        Convert a dataframe into an arrow table.  Object columns holding more than one python type (i.e. the district column
+        mixes integers and 'statewide') are stored as strings so the schema stays typed.
+        ...
+        Parameters
+        ----------
+        df: The dataframe to convert
+        """
+        df = df.reset_index(drop = True)
+        for col in df.columns[df.dtypes == 'object']:
+            if pd.api.types.infer_dtype(df[col], skipna = True) not in ['string', 'empty']:
+                df[col] = df[col].where(df[col].isnull(), df[col].astype(str))
+        return pa.Table.from_pandas(df, preserve_index = False)
+
+    def writeDataset(self, df, name):
+        """
+        Write a processed dataframe to the store, replacing any prior version of the dataset
+        ...
+        Parameters
+        ----------
+        df: The dataframe to write
+        name: The name of the dataset
+        """
+        out_path = self.datasetPath(name)
+        df = self.encodeKeys(df, name)
+        if self.backend == 'tsv':
+            df.to_csv(out_path,
+                    compression = 'gzip',
+                    mode = 'w',
+                    sep='\t',
+                    index = False,
+                    encoding='utf-8',
+                    line_terminator = '\n')
+            return
+
+        shutil.rmtree(str(out_path), ignore_errors = True)
+        partition_col = YEAR_COLUMNS.get(name)
+        ds.write_dataset(self.toArrowTable(df), str(out_path),
+                        format = BACKENDS[self.backend],
+                        partitioning = [partition_col] if partition_col in df.columns else None,
+                        partitioning_flavor = 'hive',
+                        existing_data_behavior = 'delete_matching')
+
+    def writeDatasetChunks(self, chunks, name):
+        """
+        Write a dataset that is produced in pieces without holding all of it in memory.  Each chunk is staged as its own
+        file, then the staged files are streamed into the partitioned dataset under one schema so a column that is empty in
+        one chunk and filled in another keeps its type.
+        ...
+        Parameters
+        ----------
+        chunks: An iterable of dataframes with the same columns
+        name: The name of the dataset
+        """
+        out_path = self.datasetPath(name)
+        if self.backend == 'tsv':
+            mode, header = 'w', True
+            for df in chunks:
+                self.encodeKeys(df, name).to_csv(out_path,
+                        compression = 'gzip',
+                        mode = mode,
+                        header = header,
+                        sep='\t',
+                        index = False,
+                        encoding='utf-8',
+                        line_terminator = '\n')
+                mode, header = 'a', False
+            return
+
+        stage_path = self.proc_data.joinpath('_%s.chunks' % name)
+        shutil.rmtree(str(stage_path), ignore_errors = True)
+        stage_path.mkdir(parents = True)
+        schemas = []
+        for i, df in enumerate(chunks):
+            table = self.toArrowTable(self.encodeKeys(df, name))
+            pq.write_table(table, str(stage_path.joinpath('chunk-%i.parquet' % i)))
+            schemas.append(table.schema)
+
+        if len(schemas) > 0:
+            staged = ds.dataset(str(stage_path), format = 'parquet', schema = self.unifySchemas(schemas))
+            shutil.rmtree(str(out_path), ignore_errors = True)
+            partition_col = YEAR_COLUMNS.get(name)
+            ds.write_dataset(staged.scanner(), str(out_path),
+                            format = BACKENDS[self.backend],
+                            partitioning = [partition_col] if partition_col in staged.schema.names else None,
+                            partitioning_flavor = 'hive',
+                            existing_data_behavior = 'delete_matching')
+        shutil.rmtree(str(stage_path), ignore_errors = True)
+
+    @staticmethod
+    def unifySchemas(schemas):
+        """
+        Combine the schemas of the chunks of a dataset.  A column that is all null in one chunk takes the type of the others,
+        numeric columns that disagree (i.e. an integer column that picked up a null) become floats, and anything else that
+        disagrees becomes a string.
+        """
+        fields = []
+        for field in schemas[0]:
+            types = set(schema.field(field.name).type for schema in schemas) - set([pa.null()])
+            if len(types) == 0:
+                dtype = pa.null()
+            elif len(types) == 1:
+                dtype = types.pop()
+            elif all(pa.types.is_integer(x) or pa.types.is_floating(x) for x in types):
+                dtype = pa.float64()
+            else:
+                dtype = pa.string()
+            fields.append(pa.field(field.name, dtype))
+        return pa.schema(fields)
+
+    def getColumns(self, name):
+        """
+        Get the column names of a stored dataset without reading any rows
+        ...
+        Parameters
+        ----------
+        name: The name of the dataset
+        """
+        if self.backend == 'tsv':
+            return list(pd.read_csv(self.datasetPath(name), compression = 'gzip', sep = '\t', nrows = 0))
+        return self.getDataset(name).schema.names
+
+    def getDataset(self, name):
+        """
+        Get the arrow dataset for a stored dataset
+        ...
+        Parameters
+        ----------
+        name: The name of the dataset
+        """
+        return ds.dataset(str(self.datasetPath(name)), format = BACKENDS[self.backend], partitioning = 'hive')
+
+    def readDataset(self, name, columns = None, years = None, filters = None):
+        """
+        Read a processed dataset, pushing the column selection and the row filters down to the file scan.  The geography
+        and year keys are returned in their canonical dtypes so the datasets can be joined on them directly
+        ...
+        Parameters
+        ----------
+        name: The name of the dataset
+        columns: A list of columns to read, all columns if None
+        years: A (start, end) tuple of years to keep, either end can be None
+        filters: Additional filters in the pyarrow list of tuples format, i.e. [('country_name', '=', 'United States of America')]
+        ...
+        Returns
+        ----------
+         > A DataFrame
+        """
+        filters = list(filters or [])
+        if years is not None:
+            year_col = YEAR_COLUMNS[name]
+            if years[0] is not None:
+                filters.append((year_col, '>=', years[0]))
+            if years[1] is not None:
+                filters.append((year_col, '<=', years[1]))
+
+        if self.backend == 'tsv':
+            # The filtered columns are read as well as the selected ones, the selection is applied after filtering
+            read_cols = None if columns is None else list(dict.fromkeys(list(columns) + [col for col, _, _ in filters]))
+            df = pd.read_csv(self.datasetPath(name),
+                            compression = 'gzip',
+                            sep = '\t',
+                            index_col = False,
+                            usecols = read_cols,
+                            encoding = 'utf-8',
+                            lineterminator = '\n')
+            df = self.encodeKeys(df, name)
+            for col, op, val in filters:
+                df = df[self.compare(df[col], op, val)]
+            if columns is not None:
+                df = df[list(columns)]
+            return df.reset_index(drop = True)
+
+        dataset = self.getDataset(name)
+        expression = pq.filters_to_expression(filters) if len(filters) > 0 else None
+        return self.encodeKeys(dataset.to_table(columns = columns, filter = expression).to_pandas(), name)
+
+    @staticmethod
+    def compare(series, op, val):
+        """
+        Evaluate a single filter tuple against a pandas series
+        """
+        if op in ['=', '==']:
+            return series == val
+        elif op == '!=':
+            return series != val
+        elif op == '<':
+            return series < val
+        elif op == '<=':
+            return series <= val
+        elif op == '>':
+            return series > val
+        elif op == '>=':
+            return series >= val
+        elif op == 'in':
+            return series.isin(val)
+        elif op == 'not in':
+            return ~series.isin(val)
+        raise ValueError('Unknown filter operation %s' % op)
@@ -0,0 +1,106 @@
+##!/usr/bin/env python
+"""
+    A cache of the raw inputs that are slow to parse (the excel workbooks of the indicators).  The first read of a source
+    converts it to a parquet file keyed on the hash of the source, later reads load the parquet file until the source
+    changes.
+"""
+
+#imports
+import hashlib
+import json
+import pandas as pd
+import pyarrow.parquet as pq
+from download_and_format.processed_storage import ProcessedDataStore
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2020 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+class RawSourceCache(object):
+
+    def __init__(self, cache_path):
+        '''
+        An object that converts raw source files to parquet once and reads the converted file back while the source is
+        unchanged.  The source hashes are kept in a manifest with the size and modified time of the source, so a source is
+        only hashed again when one of them changes
+        ...
+        Parameters
+        ----------
+        cache_path: The directory the converted files are stored in (i.e. processed/raw_cache)
+        '''
+        self.cache_path = cache_path
+        self.manifest_path = cache_path.joinpath('manifest.json')
+
+    def readManifest(self):
+        """
+        Read the source hashes, an empty manifest if there isn't one
+        """
+        if not self.manifest_path.exists():
+            return {}
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)
+
+    def sourceHash(self, source_path):
+        """
+        Get the sha256 of a source file, reusing the hash in the manifest when the size and modified time are unchanged
+        ...
+        Parameters
+        ----------
+        source_path: The path of the source file
+        """
+        manifest = self.readManifest()
+        stat = source_path.stat()
+        entry = manifest.get(str(source_path))
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+
+        sha = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        manifest[str(source_path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha.hexdigest()}
+
+        self.cache_path.mkdir(parents = True, exist_ok = True)
+        with open(self.manifest_path, 'w') as f:
+            json.dump(manifest, f, indent = 2)
+        return sha.hexdigest()
+
+    def read(self, source_path, reader, **kwargs):
+        """
+        Read a source file through the cache
+        ...
+        Parameters
+        ----------
+        source_path: The path of the source file
+        reader: The function that parses the source (i.e. pd.read_excel), called with the path and kwargs on a cache miss
+        kwargs: Passed to the reader, they are part of the cache key
+        ...
+        Returns
+        ----------
+         > A DataFrame
+        """
+        key = hashlib.sha256((self.sourceHash(source_path) + repr(sorted(kwargs.items()))).encode('utf-8')).hexdigest()[:16]
+        out_path = self.cache_path.joinpath('%s-%s.parquet' % (source_path.stem, key))
+        if out_path.exists():
+            return pd.read_parquet(out_path)
+
+        df = reader(source_path, **kwargs)
+        # Drop the conversions of prior versions of the source
+        for stale in self.cache_path.glob('%s-*.parquet' % source_path.stem):
+            stale.unlink()
+        df.columns = df.columns.astype(str)
+        pq.write_table(ProcessedDataStore.toArrowTable(df), str(out_path))
+        # Return the converted file so the first run sees the same types as the later ones
+        return pd.read_parquet(out_path)
+
+    def readExcel(self, source_path, **kwargs):
+        """
+        Read an excel workbook through the cache
+        """
+        return self.read(source_path, pd.read_excel, **kwargs)
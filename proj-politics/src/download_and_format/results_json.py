@@ -0,0 +1,193 @@
+##!/usr/bin/env python
+"""
+    A decoder for the county level presidential results published as a json document of races (data -> races -> candidates
+    and counties).  The document is read through a buffer refilled from the file and the races are decoded one at a time,
+    so neither the whole text nor the whole document as python objects is held in memory.  The results are gathered into
+    flat arrays, with the candidates of a race interned once, so the output frame is built once for the whole file.  The
+    decoder is shared by every cycle that is published in this layout.
+"""
+
+#imports
+import json
+import numpy as np
+import pandas as pd
+from download_and_format.geography import encodeFIPS
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2020 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+# Constants
+DECODER = json.JSONDecoder()
+WHITESPACE = ' \t\n\r'
+CHUNK_SIZE = 1 << 20
+
+class JSONStream(object):
+
+    def __init__(self, f, chunk_size = CHUNK_SIZE):
+        '''
+        A json document read through a buffer that is refilled from the file, only the value being decoded and a chunk
+        around it are held in memory
+        ...
+        Parameters
+        ----------
+        f: The text file of the document
+        chunk_size: The number of characters read from the file at a time
+        '''
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        Drop the consumed part of the buffer and read more of the file.  At least as much as is left in the buffer is read,
+        so a value larger than a chunk is buffered in a few reads
+        """
+        data = self.f.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        self.eof = len(data) == 0
+        return not self.eof
+
+    def peek(self):
+        """
+        The next character that isn't whitespace, None at the end of the document
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return None
+
+    def advance(self):
+        """
+        Step over the next character that isn't whitespace and return it
+        """
+        char = self.peek()
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """
+        Decode the next value.  A value cut off by the end of the buffer (or a number that may go on past it) is decoded
+        again once more of the file is read
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buffer, self.pos)
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+def findArray(stream, keys):
+    """
+    Find the start of an array nested in objects (i.e. ['data', 'races']) without decoding the values around it.  The values
+    of the keys that aren't on the path are decoded one at a time and dropped
+    ...
+    Parameters
+    ----------
+    stream: The JSONStream of the document, left after the opening bracket of the array
+    keys: The keys of the objects leading to the array
+    """
+    for key in keys:
+        if stream.advance() != '{':
+            raise ValueError('Expected an object holding %s' % key)
+        while True:
+            if stream.peek() == '}':
+                raise ValueError('The key %s is missing from the results document' % key)
+            name = stream.decode()
+            stream.advance()
+            if name == key:
+                break
+            stream.decode()
+            if stream.peek() == ',':
+                stream.advance()
+
+    if stream.advance() != '[':
+        raise ValueError('Expected an array at %s' % '.'.join(keys))
+
+def iterArray(stream, keys):
+    """
+    Iterate over the elements of an array nested in a json document, decoding one element at a time
+    ...
+    Parameters
+    ----------
+    stream: The JSONStream of the document
+    keys: The keys of the objects leading to the array
+    """
+    findArray(stream, keys)
+    while stream.peek() != ']':
+        yield stream.decode()
+        if stream.peek() == ',':
+            stream.advance()
+
+def readResultsJSON(file_path, year):
+    """
+    Read a county level results document into one row per county and candidate
+    ...
+    Parameters
+    ----------
+    file_path: The path of the json document
+    year: The election year
+    ...
+    Returns
+    ----------
+     > A DataFrame with the year, state_po, FIPS, county_name, office, DISTRICT, special, candidate, party, candidatevotes
+       and totalvotes columns
+    """
+    # The candidates are kept once per (name, party) and the results only hold their position in the table
+    cand_table, cand_codes = [], {}
+    race_state, race_office, race_rows = [], [], []
+    fips, county_name, totalvotes, results_per_county, candidates, votes = [], [], [], [], [], []
+    with open(file_path, 'r', encoding = 'utf-8') as f:
+        for race in iterArray(JSONStream(f), ['data', 'races']):
+            race_cands = {}
+            for person in race['candidates']:
+                cand = (person['name_display'], person['party_id'])
+                if cand not in cand_codes:
+                    cand_codes[cand] = len(cand_table)
+                    cand_table.append(cand)
+                race_cands[person['candidate_key']] = cand_codes[cand]
+
+            n_results = 0
+            for county in race['counties']:
+                fips.append(county['fips'])
+                county_name.append(county['name'])
+                totalvotes.append(county['votes'])
+                results_per_county.append(len(county['results']))
+                n_results += len(county['results'])
+                candidates.extend(race_cands[cand] for cand in county['results'])
+                votes.extend(county['results'].values())
+            race_state.append(race['state_id'])
+            race_office.append(race['office'])
+            race_rows.append(n_results)
+
+    # Repeat the county and race values for each of their results
+    per_county = np.array(results_per_county, dtype = np.int64)
+    candidates = np.array(candidates, dtype = np.int64)
+    return pd.DataFrame({'year': year,
+                        'state_po': np.repeat(np.array(race_state, dtype = object), race_rows),
+                        'FIPS': encodeFIPS(fips).repeat(per_county).values,
+                        'county_name': np.repeat(np.array(county_name, dtype = object), per_county),
+                        'office': np.repeat(np.array(race_office, dtype = object), race_rows),
+                        'DISTRICT': 'statewide',
+                        'special': 'False',
+                        'candidate': np.array([name for name, _ in cand_table], dtype = object)[candidates],
+                        'party': np.array([party for _, party in cand_table], dtype = object)[candidates],
+                        'candidatevotes': pd.to_numeric(pd.Series(votes, dtype = object)).values,
+                        'totalvotes': pd.to_numeric(pd.Series(totalvotes, dtype = object)).repeat(per_county).values})
@@ -0,0 +1,196 @@
+##!/usr/bin/env python
+"""
+    A dependency aware runner for the formatting stages.  Each stage declares the files it reads and writes, the stages are
+    ordered by matching the inputs of one stage to the outputs of another, independent stages run at the same time in a
+    process pool (or on a thread when the stage runs a pool of its own), and a stage is skipped when the content hashes of
+    its inputs haven't changed since it last succeeded.
+"""
+
+#Imports
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2020 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+class Stage(object):
+
+    def __init__(self, name, func, inputs = None, outputs = None, in_process = False):
+        '''
+        A stage of the pipeline
+        ...
+        Parameters
+        ----------
+        name: The name of the stage (i.e. demographic)
+        func: A module level function that runs the stage, it has to be picklable to run in the process pool
+        inputs: A list of the files and directories the stage reads.  None means the inputs can't be hashed (i.e. a web
+                download) and the stage always runs
+        outputs: A list of the files and directories the stage writes
+        in_process: Run the stage on a thread of the runner instead of in the process pool, for stages that start a process
+                    pool of their own so the pools aren't nested
+        '''
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.outputs = outputs or []
+        self.in_process = in_process
+
+class StageRunner(object):
+
+    def __init__(self, stages, state_path, max_workers = None):
+        '''
+        An object that runs a list of stages in dependency order
+        ...
+        Parameters
+        ----------
+        stages: A list of Stage objects
+        state_path: The json file the input hashes of the successful runs are kept in
+        max_workers: The size of the process pool, the number of cpus by default
+        '''
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.dependencies = {stage.name: self.upstream(stage) for stage in stages}
+
+        if self.state_path.exists():
+            with open(self.state_path, 'r') as f:
+                self.state = json.load(f)
+        else:
+            self.state = {'files': {}, 'stages': {}}
+
+    def upstream(self, stage):
+        """
+        The stages that write one of the inputs of a stage
+        """
+        inputs = set(str(x) for x in stage.inputs or [])
+        return set(other.name for other in self.stages.values()
+                    if other.name != stage.name and inputs.intersection(str(x) for x in other.outputs))
+
+    def fileHash(self, path):
+        """
+        The sha256 of a file.  The hash is reused while the size and modification time of the file are unchanged
+        """
+        stat = path.stat()
+        cached = self.state['files'].get(str(path))
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        self.state['files'][str(path)] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def inputHash(self, stage):
+        """
+        A hash over the contents of every input file of a stage, None if the stage has to run
+        """
+        if stage.inputs is None:
+            return None
+
+        digest = hashlib.sha256()
+        for path in sorted(stage.inputs):
+            files = sorted(x for x in path.rglob('*') if x.is_file()) if path.is_dir() else [path]
+            for file in files:
+                if not file.exists():
+                    return None
+                digest.update(str(file).encode('utf-8'))
+                digest.update(self.fileHash(file).encode('utf-8'))
+        return digest.hexdigest()
+
+    def isFresh(self, stage, input_hash):
+        """
+        Whether a stage can be skipped: its inputs hash to the value of its last successful run and its outputs exist
+        """
+        return input_hash is not None and self.state['stages'].get(stage.name) == input_hash and \
+                all(path.exists() for path in stage.outputs)
+
+    def saveState(self):
+        """
+        Write the input hashes to the state file
+        """
+        tmp_path = self.state_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent = 2, sort_keys = True)
+        os.replace(tmp_path, self.state_path)
+
+    def run(self, targets = None, force = False):
+        """
+        Run the stages.  A stage starts once all of its upstream stages have finished, and the stages downstream of a failed
+        stage are not run.
+        ...
+        Parameters
+        ----------
+        targets: A list of the stages to run along with everything upstream of them, all stages if None
+        force: Run the stages even if their inputs haven't changed
+        ...
+        Returns
+        ----------
+         > A dictionary of the stage name to its result (ran, skipped, failed or blocked)
+        """
+        selected = set(targets or self.stages)
+        pending = list(selected)
+        while len(pending) > 0:
+            for name in self.dependencies[pending.pop()]:
+                if name not in selected:
+                    selected.add(name)
+                    pending.append(name)
+
+        results, running, hashes = {}, {}, {}
+        with ProcessPoolExecutor(max_workers = self.max_workers) as executor, ThreadPoolExecutor() as threads:
+            while len(results) < len(selected):
+                progress = len(results)
+                for name in sorted(selected):
+                    if name in results or name in running.values():
+                        continue
+                    upstream = self.dependencies[name] & selected
+                    if any(results.get(x) in ['failed', 'blocked'] for x in upstream):
+                        print('Not running %s, an upstream stage failed' % name)
+                        results[name] = 'blocked'
+                        continue
+                    elif not all(x in results for x in upstream):
+                        continue
+
+                    # Hash the inputs once the upstream stages have written them
+                    stage = self.stages[name]
+                    input_hash = self.inputHash(stage)
+                    if not force and self.isFresh(stage, input_hash):
+                        print('Skipping %s, its inputs have not changed' % name)
+                        results[name] = 'skipped'
+                        continue
+
+                    print('Running %s' % name)
+                    hashes[name] = input_hash
+                    running[(threads if stage.in_process else executor).submit(stage.func)] = name
+
+                if len(running) == 0:
+                    if len(results) == progress:
+                        raise ValueError('The stages %s depend on each other' % ', '.join(sorted(selected - set(results))))
+                    continue
+
+                done, _ = wait(list(running), return_when = FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        results[name] = 'ran'
+                        if hashes[name] is not None:
+                            self.state['stages'][name] = hashes[name]
+                    except Exception as e:
+                        print('Stage %s failed: %s' % (name, e))
+                        results[name] = 'failed'
+                        self.state['stages'].pop(name, None)
+                    self.saveState()
+
+        self.saveState()
+        return results
@@ -0,0 +1,407 @@
+##!/usr/bin/env python
+"""
+    Generates synthetic raw politics data in the layouts the formatters read (the BEA gdp tsvs, the census cc-est files, the
+    MIT and CQ election results, the V-Dem party file, the indicator tables and the FEC bulk zips of pipe delimited files) so the formatters can be run and
+    timed at any scale without the production downloads.
+"""
+
+#imports
+import io
+import json
+import zipfile
+import numpy as np
+import pandas as pd
+from download_and_format.gdp import industries
+from download_and_format.vdem import RENAME_COLS
+from download_and_format.campaign_finance import HEADER_RENAMES
+from download_and_format.fec_download_manager import FECDownloadManager
+from download_and_format.raw_cache import RawSourceCache
+
+__author__ = "Dylan Smith"
+__copyright__ = "Copyright (C) 2020 Dylan Smith"
+__credits__ = ["Dylan Smith"]
+
+__license__ = "Personal Use"
+__version__ = "1.0"
+__maintainer__ = "Dylan Smith"
+__email__ = "-"
+__status__ = "Development"
+
+# Constants
+STATES = [(1, 'AL', 'Alabama'), (4, 'AZ', 'Arizona'), (6, 'CA', 'California'), (8, 'CO', 'Colorado'), (12, 'FL', 'Florida'),
+          (13, 'GA', 'Georgia'), (17, 'IL', 'Illinois'), (18, 'IN', 'Indiana'), (21, 'KY', 'Kentucky'), (26, 'MI', 'Michigan'),
+          (27, 'MN', 'Minnesota'), (29, 'MO', 'Missouri'), (36, 'NY', 'New York'), (37, 'NC', 'North Carolina'),
+          (39, 'OH', 'Ohio'), (42, 'PA', 'Pennsylvania'), (47, 'TN', 'Tennessee'), (48, 'TX', 'Texas'), (51, 'VA', 'Virginia'),
+          (55, 'WI', 'Wisconsin')]
+CENSUS_RACES = ['WA', 'BA', 'IA', 'AA', 'NA', 'TOM', 'H']
+CANDIDATES = [('DEM', 'democrat'), ('REP', 'republican'), ('LIB', 'libertarian')]
+CQ_OFFICES = {'gov': 'Governor', 'hr': 'House', 'sen': 'Senate', 'pres': 'President'}
+VDEM_PARTIES = ['Democratic Party', 'Republican Party', 'Libertarian Party', 'Green Party', 'Reform Party']
+FEC_DATASETS = ['CANDIDATE_MASTER', 'CANDIDATE_COMMITTEE', 'COMMITTEE_MASTER', 'CONTRIBUTION_COMMITTEE_CANDIDATE', 'INDIVIDUAL_SUMMARY']
+# The member of each FEC bulk zip
+FEC_MEMBERS = {'CANDIDATE_MASTER': 'cn.txt', 'CANDIDATE_COMMITTEE': 'ccl.txt', 'COMMITTEE_MASTER': 'cm.txt',
+               'CONTRIBUTION_COMMITTEE_CANDIDATE': 'itpas2.txt', 'INDIVIDUAL_SUMMARY': 'itcont.txt'}
+
+class SyntheticDataGenerator(object):
+
+    def __init__(self, data_path, counties = 100, fec_rows = 100000, seed = 0):
+        '''
+        An object that writes synthetic raw inputs for the formatters into a politics data directory
+        ...
+        Parameters
+        ----------
+        data_path: The directory the raw and processed folders are created in
+        counties: The number of counties, spread evenly over the states
+        fec_rows: The number of individual contributions, the other FEC files are sized from it
+        seed: The seed of the random number generator
+        '''
+        self.data_path = data_path
+        self.raw_data = data_path.joinpath('raw')
+        self.fec_rows = fec_rows
+        self.rng = np.random.default_rng(seed)
+
+        per_state = max(counties // len(STATES), 1)
+        self.counties = pd.DataFrame([{'STATE': st_fips, 'COUNTY': 2 * i + 1, 'state_po': po, 'STNAME': name,
+                                        'CTYNAME': 'Name%03d County' % i, 'district': i % 4 + 1}
+                                        for st_fips, po, name in STATES for i in range(per_state)])
+        self.counties['FIPS'] = (self.counties['STATE'] * 1000 + self.counties['COUNTY']).astype(str).str.zfill(5)
+
+    def writeAll(self):
+        """
+        Write every synthetic input
+        ...
+        Returns
+        ----------
+         > A dictionary of the input name to the number of rows written
+        """
+        rows = {}
+        rows['gdp'] = self.writeGDPData()
+        rows['demographic'] = self.writeCensusData()
+        rows['mit_voting'] = self.writeMITData()
+        rows['cq_voting'] = self.writeCQData()
+        rows['vdem'] = self.writeVDemData()
+        rows['indicator'] = self.writeIndicatorData()
+        rows['campaign'] = self.writeFECData()
+        return rows
+
+    def writeTSV(self, df, path, sep = '\t', encoding = 'latin-1'):
+        """
+        Write a gzipped delimited file, creating its directory
+        """
+        path.parent.mkdir(parents = True, exist_ok = True)
+        df.to_csv(path, sep = sep, index = False, compression = 'gzip' if path.suffix == '.gz' else None, encoding = encoding)
+        return len(df)
+
+    def writeGDPData(self):
+        """
+        The BEA county gdp tables, one row per county and industry with a column per year.  A share of the values are
+        suppressed with (D) like the published tables.
+        """
+        geo = pd.concat([pd.DataFrame({'FIPS': ['00000'], 'GeoName': ['United States']}),
+                        pd.DataFrame({'FIPS': self.counties['FIPS'], 'GeoName': self.counties['CTYNAME']})])
+        # The change table names its total line 'All industry total (percent change)'
+        lines = [x for x in industries if x != 'All industry total (percent change)']
+        rows = 0
+        for file_nm, desc_total in [('gdp_usd_all_areas.tsv.gz', 'All industry total'),
+                                    ('gdp_change_all_areas.tsv.gz', 'All industry total (percent change)')]:
+            df = pd.DataFrame({'GeoFIPS': np.repeat(geo['FIPS'].values, len(lines)),
+                                'GeoName': np.repeat(geo['GeoName'].values, len(lines)),
+                                'Region': 5,
+                                'TableName': 'CAGDP2',
+                                'LineCode': np.tile(np.arange(1, len(lines) + 1), len(geo)),
+                                'IndustryClassification': '...',
+                                'Description': np.tile([desc_total if x == 'All industry total' else x for x in lines], len(geo)),
+                                'Unit': 'Thousands of dollars'})
+            df['GeoFIPS'] = ' "' + df['GeoFIPS'] + '"'
+            for yr in range(2001, 2019):
+                values = pd.Series(self.rng.gamma(2.0, 50000.0, len(df)).round(1).astype(str))
+                df[str(yr)] = values.where(self.rng.random(len(df)) > 0.05, '(D)')
+            rows += self.writeTSV(df, self.raw_data.joinpath('indicators', file_nm))
+        return rows
+
+    def censusFrame(self, years):
+        """
+        A county by year by age group population frame in the cc-est layout
+        """
+        n_age = 19
+        df = pd.DataFrame({col: np.repeat(self.counties[col].values, len(years) * n_age)
+                            for col in ['STATE', 'COUNTY', 'STNAME', 'CTYNAME']})
+        df.insert(0, 'SUMLEV', 50)
+        df['YEAR'] = np.tile(np.repeat(years, n_age), len(self.counties))
+        df['AGEGRP'] = np.tile(np.arange(n_age), len(self.counties) * len(years))
+
+        for gender in ['MALE', 'FEMALE']:
+            df['TOT_%s' % gender] = self.rng.integers(500, 20000, len(df))
+            for race in CENSUS_RACES:
+                df['%s_%s' % (race, gender)] = (df['TOT_%s' % gender] * self.rng.uniform(0.01, 0.3, len(df))).astype(int)
+        df.insert(7, 'TOT_POP', df['TOT_MALE'] + df['TOT_FEMALE'])
+
+        # The total population rows (AGEGRP 0) hold the sum of the age groups
+        group = df.index // n_age
+        totals = df[df['AGEGRP'] != 0].groupby(group[df['AGEGRP'] != 0]).sum(numeric_only = True)
+        value_cols = [col for col in df.columns if col not in ['SUMLEV', 'STATE', 'COUNTY', 'STNAME', 'CTYNAME', 'YEAR', 'AGEGRP']]
+        df.loc[df['AGEGRP'] == 0, value_cols] = totals[value_cols].values
+        return df
+
+    def writeCensusData(self):
+        """
+        The census county population estimates.  The intercensal files are comma delimited csvs, one per state, and the
+        2018 vintage is a single tab delimited gzip
+        """
+        rows = 0
+        df_hist = self.censusFrame(np.arange(1, 14))
+        hist_path = self.raw_data.joinpath('demographics', '2009')
+        hist_path.mkdir(parents = True, exist_ok = True)
+        for st_fips, df in df_hist.groupby('STATE'):
+            df.to_csv(hist_path.joinpath('co-est00int-alldata-%02d.csv' % st_fips), index = False, encoding = 'latin-1')
+            rows += len(df)
+
+        df_2018 = self.censusFrame(np.arange(1, 12))
+        rows += self.writeTSV(df_2018, self.raw_data.joinpath('demographics', '2018', 'cc-est2018-alldata.csv.gz'))
+        return rows
+
+    def electionFrame(self, keys, years):
+        """
+        Cross a frame of race keys with the years and candidates and draw the vote counts
+        """
+        df = keys.assign(_k = 1).merge(pd.DataFrame({'year': years, '_k': 1}), on = '_k')
+        df = df.merge(pd.DataFrame({'party': [x[1] for x in CANDIDATES], '_k': 1}), on = '_k').drop(columns = '_k')
+        df['candidate'] = 'Candidate ' + df['party'].str.upper() + ' ' + df['year'].astype(str)
+        df['candidatevotes'] = self.rng.integers(100, 100000, len(df))
+        df['totalvotes'] = df.groupby([col for col in df.columns if col not in ['party', 'candidate', 'candidatevotes']],
+                                    sort = False)['candidatevotes'].transform('sum')
+        df['special'] = False
+        df['writein'] = False
+        return df
+
+    def writeMITData(self):
+        """
+        The MIT election lab house, senate and presidential results, the 2020 presidential json and the congressional
+        district to census block lookup the house results are mapped to counties with
+        """
+        states = pd.DataFrame(STATES, columns = ['state_fips', 'state_po', 'state'])
+        rows = 0
+
+        districts = self.counties[['STATE', 'district']].drop_duplicates().rename(columns = {'STATE': 'state_fips'})
+        df_house = self.electionFrame(districts.merge(states, on = 'state_fips'), np.arange(2000, 2019, 2))
+        df_house['office'] = 'US House'
+        rows += self.writeTSV(df_house, self.raw_data.joinpath('voting', 'mit', 'House', 'election_results.tsv.gz'))
+
+        df_senate = self.electionFrame(states.assign(district = 'statewide'), np.arange(2000, 2019, 2))
+        df_senate['office'] = 'US Senate'
+        rows += self.writeTSV(df_senate, self.raw_data.joinpath('voting', 'mit', 'Senate', 'election_results.tsv.gz'))
+
+        counties = self.counties[['state_po', 'STNAME', 'CTYNAME', 'FIPS']].rename(columns = {'STNAME': 'state', 'CTYNAME': 'county'})
+        df_pres = self.electionFrame(counties, np.arange(2000, 2017, 4)).drop(columns = ['special', 'writein'])
+        df_pres['FIPS'] = df_pres['FIPS'].astype(int)
+        df_pres['office'] = 'President'
+        rows += self.writeTSV(df_pres, self.raw_data.joinpath('voting', 'mit', 'President', 'election_results.tsv.gz'))
+
+        # The 2020 results are a json document of races with the candidates and the results per county
+        races = []
+        for po, df in self.counties.groupby('state_po'):
+            candidates = [{'candidate_key': key.lower(), 'name_display': 'Candidate %s 2020' % key, 'party_id': party}
+                          for key, party in CANDIDATES]
+            counties = []
+            for fips, name in zip(df['FIPS'], df['CTYNAME']):
+                results = {x['candidate_key']: int(v) for x, v in zip(candidates, self.rng.integers(100, 100000, len(candidates)))}
+                counties.append({'fips': fips, 'name': name, 'votes': sum(results.values()), 'results': results})
+            races.append({'state_id': po, 'office': 'President', 'candidates': candidates, 'counties': counties})
+            rows += len(counties) * len(candidates)
+        with open(self.raw_data.joinpath('voting', 'mit', 'President', '2020_results.json'), 'w') as f:
+            json.dump({'data': {'races': races}}, f)
+
+        # Every county is split into a few census blocks of its congressional district
+        blocks = self.counties.loc[self.counties.index.repeat(3), ['FIPS', 'district']].reset_index(drop = True)
+        df_lkup = pd.DataFrame({'BLOCKID': blocks['FIPS'] + (blocks.index % 3).astype(str).str.zfill(10),
+                                'CD116': blocks['district']})
+        lkup_path = self.raw_data.joinpath('lookup', 'cd116')
+        lkup_path.mkdir(parents = True, exist_ok = True)
+        df_lkup.to_csv(lkup_path.joinpath('National_CD116.txt'), index = False, encoding = 'latin-1')
+        return rows
+
+    def writeCQData(self):
+        """
+        The CQ county level results, a csv per office and year.  A share of the races are unopposed
+        """
+        rows = 0
+        for office, office_nm in CQ_OFFICES.items():
+            years = np.arange(2000, 2019, 4 if office == 'pres' else 2)
+            office_path = self.raw_data.joinpath('voting', 'cq', office)
+            office_path.mkdir(parents = True, exist_ok = True)
+            for yr in years:
+                n = len(self.counties)
+                rep, dem = self.rng.integers(100, 100000, n), self.rng.integers(100, 100000, n)
+                df = pd.DataFrame({'RaceDate': '%i1102' % yr,
+                                    'State': self.counties['STNAME'],
+                                    'Area': self.counties['CTYNAME'].str.replace(' County', ''),
+                                    'AreaType': 'County',
+                                    'Office': office_nm,
+                                    'RaceType': 'General',
+                                    'RepCandidate': 'Candidate REP %i' % yr,
+                                    'RepVotes': rep.astype(str),
+                                    'DemCandidate': 'Candidate DEM %i' % yr,
+                                    'DemVotes': dem.astype(str),
+                                    'ThirdParty': 'Libertarian|Green',
+                                    'ThirdVotes': self.rng.integers(0, 5000, n),
+                                    'OtherVotes': self.rng.integers(0, 500, n),
+                                    'TotalVotes': rep + dem,
+                                    'RepVotesMajorPercent': (rep / (rep + dem) * 100).round(2),
+                                    'DemVotesMajorPercent': (dem / (rep + dem) * 100).round(2),
+                                    'TitleNotes': '',
+                                    'OtherNotes': ''})
+                df.loc[self.rng.random(n) < 0.02, 'RepVotes'] = 'Unopposed'
+                df.to_csv(office_path.joinpath('%s_%i.csv' % (office, yr)), index = False, encoding = 'latin-1')
+                rows += len(df)
+        return rows
+
+    def writeVDemData(self):
+        """
+        The V-Dem party dataset, one row per party and year with the party measures
+        """
+        countries = ['United States of America', 'Canada', 'United Kingdom', 'Germany']
+        years = np.arange(1970, 2020)
+        df = pd.DataFrame({'country_name': np.repeat(countries, len(VDEM_PARTIES) * len(years)),
+                            'v2paenname': np.tile(np.repeat(VDEM_PARTIES, len(years)), len(countries)),
+                            'year': np.tile(years, len(countries) * len(VDEM_PARTIES))})
+        for col in RENAME_COLS:
+            if col not in df.columns:
+                df[col] = self.rng.normal(0, 1, len(df)).round(3)
+        for col in ['ep_type_populism', 'ep_type_populist_values']:
+            df[col] = self.rng.integers(1, 5, len(df))
+        path = self.raw_data.joinpath('v-dem', 'V-Dem-CPD-Party-V1.csv')
+        path.parent.mkdir(parents = True, exist_ok = True)
+        df.to_csv(path, index = False, encoding = 'utf-8')
+        return len(df)
+
+    def fecFrame(self, data_typ, n):
+        """
+        A frame of n raw rows in the column order of an FEC bulk file
+        """
+        committees = np.array(['C%08d' % i for i in range(max(n // 500, 10))])
+        candidates = np.array(['H0%s%05d' % (po, i) for po in self.counties['state_po'].unique() for i in range(5)])
+        df = pd.DataFrame({col: '' for col in HEADER_RENAMES[data_typ]}, index = range(n))
+        fills = {'CMTE_ID': lambda: self.rng.choice(committees, n),
+                'CAND_ID': lambda: self.rng.choice(candidates, n),
+                'NAME': lambda: pd.Series(self.rng.integers(0, 50000, n)).map('SMITH, PERSON %i'.__mod__),
+                'CAND_NAME': lambda: pd.Series(self.rng.integers(0, 50000, n)).map('SMITH, CANDIDATE %i'.__mod__),
+                'CMTE_NM': lambda: pd.Series(self.rng.integers(0, 50000, n)).map('COMMITTEE TO ELECT %i'.__mod__),
+                'CITY': lambda: 'SPRINGFIELD',
+                'STATE': lambda: self.rng.choice(self.counties['state_po'].values, n),
+                'ZIP_CODE': lambda: pd.Series(self.rng.integers(10000, 99999, n)).astype(str) +
+                                    pd.Series(self.rng.integers(0, 9999, n)).astype(str).str.zfill(4),
+                'TRANSACTION_DT': lambda: pd.Series(self.rng.integers(1, 13, n)).astype(str).str.zfill(2) +
+                                        pd.Series(self.rng.integers(1, 29, n)).astype(str).str.zfill(2) +
+                                        pd.Series(self.rng.integers(2019, 2021, n)).astype(str),
+                'TRANSACTION_AMT': lambda: self.rng.integers(-100, 5000, n),
+                'TRANSACTION_TP': lambda: '15',
+                'ENTITY_TP': lambda: 'IND',
+                'SUB_ID': lambda: np.arange(n) + 4000000000000000000,
+                'FILE_NUM': lambda: self.rng.integers(1000000, 1500000, n),
+                'LINKAGE_ID': lambda: np.arange(n),
+                'CAND_ELECTION_YR': lambda: 2020,
+                'FEC_ELECTION_YR': lambda: 2020,
+                'CAND_PTY_AFFILIATION': lambda: self.rng.choice([x[0] for x in CANDIDATES], n)}
+        for col in df.columns:
+            if col in fills:
+                df[col] = fills[col]()
+        return df
+
+    def writeFECData(self, yr = 20):
+        """
+        The FEC bulk files of a cycle as the zips of pipe delimited files the download manager would have downloaded, at the
+        paths of the download manager so the campaign finance formatter streams them like a download
+        """
+        sizes = {'INDIVIDUAL_SUMMARY': self.fec_rows, 'CONTRIBUTION_COMMITTEE_CANDIDATE': max(self.fec_rows // 20, 1)}
+        download_manager = FECDownloadManager(self.raw_data.joinpath('campaign-finance', 'zip'))
+        rows = 0
+        for data_typ in FEC_DATASETS:
+            n = sizes.get(data_typ, max(self.fec_rows // 200, 10))
+            with zipfile.ZipFile(download_manager.zipPath(data_typ, yr), 'w', compression = zipfile.ZIP_DEFLATED) as z:
+                with io.TextIOWrapper(z.open(FEC_MEMBERS[data_typ], 'w'), encoding = 'latin-1') as f:
+                    self.fecFrame(data_typ, n).to_csv(f, sep = '|', header = False, index = False)
+            rows += n
+        return rows
+
+    def writeIndicatorData(self):
+        """
+        The indicator inputs: the culture regions, the rural atlas county classifications and income tables, the BEA
+        CAEMP25 employment tables and the unemployment and education workbooks.  There is no excel writer here, so the
+        workbooks are written as csv text and converted into the RawSourceCache the formatter reads them through, like a
+        workbook that was read by a prior run
+        ...
+        Returns
+        ----------
+         > The number of rows written
+        """
+        indi_path = self.raw_data.joinpath('indicators')
+        atlas_path = indi_path.joinpath('Rural_Atlas_Update22')
+        atlas_path.mkdir(parents = True, exist_ok = True)
+        n, rows = len(self.counties), 0
+
+        df_regions = pd.DataFrame({'FIPS': self.counties['FIPS'],
+                                    'State': self.counties['state_po'],
+                                    'REGION': self.rng.integers(1, 12, n)})
+        df_regions['DESCRIPTION'] = 'Region ' + df_regions['REGION'].astype(str)
+        df_regions.to_csv(indi_path.joinpath('regions.csv'), index = False, encoding = 'latin-1')
+        rows += n
+
+        # The rural atlas headers start with a byte order mark that was decoded as latin-1 before the files were saved
+        df_county = pd.DataFrame({'ï»¿FIPStxt': self.counties['FIPS'].astype(int), 'State': self.counties['state_po']})
+        for yr in [2003, 2013]:
+            for col in ['RuralUrbanContinuumCode', 'UrbanInfluenceCode', 'Metro', 'Nonmetro', 'Micropolitan']:
+                df_county['%s%i' % (col, yr)] = self.rng.integers(0, 10, n)
+        rows += self.writeTSV(df_county, atlas_path.joinpath('County Classifications.tsv.gz'), encoding = 'utf-8')
+
+        df_income = pd.DataFrame({'ï»¿FIPS': self.counties['FIPS'].astype(int), 'State': self.counties['state_po']})
+        for col in ['MedHHInc', 'PerCapitaInc', 'PovertyUnder18Pct', 'PovertyAllAgesPct', 'Deep_Pov_All', 'Deep_Pov_Children']:
+            df_income[col] = self.rng.uniform(10, 80000, n).round(1)
+        rows += self.writeTSV(df_income, atlas_path.joinpath('Income.tsv.gz'), encoding = 'utf-8')
+
+        # The history table uses the SIC sector names the formatter maps onto the NAICS ones
+        sectors = ['Total employment (number of jobs)', 'Farm employment', 'Manufacturing', 'Retail trade',
+                    'Government and government enterprises']
+        for file_nm, years, renamed in [('CAEMP25N__ALL_AREAS_2001_2018.csv', range(2001, 2019),
+                                            ['Forestry, fishing, and related activities', 'Finance and insurance']),
+                                        ('CAEMP25S__ALL_AREAS_1969_2000.csv', range(1969, 2001),
+                                            ['Agricultural services, forestry, and fishing', 'Finance, insurance, and real estate'])]:
+            lines = sectors + renamed
+            df = pd.DataFrame({'GeoFIPS': np.repeat(' "' + self.counties['FIPS'].values + '"', len(lines)),
+                                'GeoName': np.repeat(self.counties['CTYNAME'].values, len(lines)),
+                                'Region': 5,
+                                'TableName': 'CAEMP25',
+                                'LineCode': np.tile(np.arange(1, len(lines) + 1) * 10, n),
+                                'IndustryClassification': '...',
+                                'Description': np.tile(lines, n),
+                                'Unit': 'Number of jobs'})
+            for yr in years:
+                values = pd.Series(self.rng.integers(10, 50000, len(df)).astype(str))
+                df[str(yr)] = values.where(self.rng.random(len(df)) > 0.05, '(D)')
+            path = self.raw_data.joinpath('employment', file_nm)
+            path.parent.mkdir(parents = True, exist_ok = True)
+            df.to_csv(path, index = False, encoding = 'latin-1')
+            rows += len(df)
+
+        df_unemp = pd.DataFrame({'FIPS': self.counties['FIPS'].astype(int), 'State': self.counties['state_po']})
+        for yr in range(2007, 2019):
+            df_unemp['Unemployment_rate_%i' % yr] = self.rng.uniform(2, 12, n).round(1)
+
+        # The education workbook names the levels differently before and after 1990, the latest years are coded columns
+        df_edu = pd.DataFrame({'FIPS': self.counties['FIPS'].astype(int), 'State': self.counties['state_po']})
+        levels = {1970: ['with less than a high school diploma', 'with a high school diploma only',
+                        'completing some college (1-3 years)', 'completing four years of college or higher'],
+                  1990: ['with less than a high school diploma', 'with a high school diploma only',
+                        "completing some college or associate's degree", "with a bachelor's degree or higher"]}
+        for yr in [1970, 1980, 1990, 2000]:
+            for level in levels[1970 if yr < 1990 else 1990]:
+                df_edu['Percent of adults %s, %i' % (level, yr)] = self.rng.uniform(5, 45, n).round(1)
+        for level in ['PCT_LESS_HS', 'PCT_HS', 'PCT_SOME_BA', 'PCT_EQ_MORE_BA']:
+            df_edu['%s_13_17' % level] = self.rng.uniform(5, 45, n).round(1)
+
+        cache = RawSourceCache(self.data_path.joinpath('processed', 'raw_cache'))
+        for file_nm, df in [('Unemployment.xls', df_unemp), ('Education.xls', df_edu)]:
+            path = indi_path.joinpath(file_nm)
+            df.to_csv(path, index = False, encoding = 'utf-8')
+            cache.read(path, lambda source_path: pd.read_csv(source_path, encoding = 'utf-8'))
+            rows += n
+        return rows
@@ -4,6 +4,7 @@
 """
 #Imports
 import pandas as pd
+from download_and_format.processed_storage import ProcessedDataStore
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -98,17 +99,19 @@ ORDINAL_REPLACE = {'populism_type': {1: 'strongly_pluralist',
 
 class VDemFormatter(object):
 
-    def __init__(self, data_path):
+    def __init__(self, data_path, storage = None):
         """
         An object that ingests different V Dem data and outputs it to the proper format
         ...
         Parameters
         ----------
         data_path: The datapath for the project
+        storage: The ProcessedDataStore the output is written to, a parquet store in the processed directory by default
         
         """
         self.raw_data = data_path.joinpath('raw','v-dem')
         self.proc_data = data_path.joinpath('processed')
+        self.storage = storage if storage is not None else ProcessedDataStore(self.proc_data)
 
     def formatPartyData(self):
         '''
@@ -131,9 +134,5 @@ class VDemFormatter(object):
         #df_pol_out['party_name_short'] = df_pol_out['party_name_short'].str.replace("|",'')
         df_pol_out['party'] = df_pol_out['party'].apply(lambda x: x.split(' ')[0].lower())
         
-        # Write the file to a compressed tsv
-        df_pol_out.to_csv(self.proc_data.joinpath('vdem_party.tsv.gz'),
-                            sep = '\t',
-                            encoding = 'utf-8',
-                            compression = 'gzip',
-                            index = False)
+        # Write the file to the processed store
+        self.storage.writeDataset(df_pol_out, 'vdem_party')
@@ -4,10 +4,13 @@
 #Imports
 import pandas as pd
 import numpy as np
-import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from os import listdir
 from os.path import isfile, join
+from download_and_format.processed_storage import ProcessedDataStore
+from download_and_format.results_json import readResultsJSON
+from download_and_format.geography import CountyLookup, CountyNameIndex, DistrictCrosswalk, encodeFIPS, countyFIPS
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -26,18 +29,50 @@ party_abbrev = {'REP': 'republican', 'DEM': 'democrat', 'IPD':'independent','LIB
 office = {'house': 'US House','senate': 'US Senate', 'president':'President'}
 pollOut = ['year', 'state_po','FIPS', 'office', 'DISTRICT',
            'special', 'candidate', 'party', 'candidatevotes', 'totalvotes']
+# The CQ offices in the order their results are combined
+cq_offices = ['sen', 'gov', 'hr', 'pres']
+# The declared schema of the CQ files by lower case column name.  The vote and percent columns hold 'Unopposed' so they are
+# read as text and converted to floats once the files are combined, columns outside the schema keep the inferred type
+cq_text_cols = ['racedate', 'state', 'area', 'areatype', 'office', 'racetype', 'repcandidate', 'repstatus', 'demcandidate',
+                'demstatus', 'thirdparty', 'thirdcandidate', 'thirdstatus', 'pluralityparty', 'racenotes', 'titlenotes', 'othernotes']
+cq_integer_cols = ['district', 'fips', 'areaid']
+
+def cqDtype(column):
+    """
+    The declared dtype of a CQ column, None for the columns outside the schema
+    """
+    column = column.lower()
+    if 'percent' in column or 'votes' in column:
+        return str
+    elif column in cq_integer_cols:
+        return 'Int64'
+    elif column in cq_text_cols:
+        return str
+    return None
 
 class VotingDataFormatter(object):
 
-    def __init__(self, data_path):
+    def __init__(self, data_path, storage = None, max_workers = None):
         '''
-        
+        The object that formats the MIT and CQ election results
+        ...
+        Parameters
+        ----------
+        data_path: The path with the political data stored.
+        storage: The ProcessedDataStore the output is written to, a parquet store in the processed directory by default
+        max_workers: The number of CQ files read at the same time, the number of cpus by default
         '''
         self.mit_raw_data = data_path.joinpath('raw','voting','mit')
         self.cq_raw_data = data_path.joinpath('raw','voting','cq')
         self.demo_path = data_path.joinpath('raw','demographics')
         self.proc_data = data_path.joinpath('processed')
+        self.storage = storage if storage is not None else ProcessedDataStore(self.proc_data)
         self.lkup_data = data_path.joinpath('raw','lookup')
+        self.counties = CountyLookup(data_path, self.storage)
+        self.county_index = CountyNameIndex(self.counties, self.storage)
+        self.crosswalk = DistrictCrosswalk(data_path, 'cd116')
+        self.unresolved_areas = set()
+        self.max_workers = max_workers
 
     def formatMITPollingData(self):
         '''
@@ -57,56 +92,34 @@ class VotingDataFormatter(object):
         df_polling.columns = df_polling.columns.str.lower()
 
         # Write the file
-        df_polling.to_csv(self.proc_data.joinpath('mit_voting.tsv.gz'),
-                            compression = 'gzip',
-                            mode = 'w',
-                            sep='\t',
-                            index = False,
-                            encoding='utf-8',
-                            line_terminator = '\n')
+        self.storage.writeDataset(df_polling, 'mit_voting')
 
     def formatCQVotes(self):
         '''
         The function that formats all of the CQ voting results (From Governers races, House, Senate and Presidential results).  This writes to the processed file directory
         '''
-        print('Getting FIPS Codes')
-        df_cnty = self.getFIPSLkp()
-        
-        print('Formatting Gov Data')
-        df_gov = self.formatCQVoteData('gov')
-        col_out = list(df_gov)
-        
-        print('Formatting House Data')
-        df_hr = self.formatCQVoteData('hr')
-        
-        print('Formatting Senate Data')
-        df_senate = self.formatCQVoteData('sen')
-        df_senate = df_senate[col_out]
-        
-        print('Formatting Historical Presidential Data')
-        df_pres = self.formatCQVoteData('pres')
-        df_pres = df_pres[col_out]
-        df_output = pd.concat([df_senate, df_gov, df_hr, df_pres])
-
-        print('Reformatting the data')
-        df_output = df_output.merge(df_cnty, on = ['state','area_join'], how = 'left')
-        for cty_fips, aj in [(46102,'SHANNON'),(51005,'CLIFTONFORGE'),(30122,'SOUTHBOSTON'),(35013,'DONAANA'),(46071,'WASHABAUGH'),(46102,'WASHINGTON'),(46077,'KINGSBURG'),(51800,'NANSEMOND'),(13203,'MILTON')]:
-            if aj == 'MILTON':
-                df_output.loc[(df_output['area_join'] == aj) & (df_output['state'] == 'Georgia'),'fips'] = cty_fips
-            else:
-                df_output.loc[(df_output['area_join'] == aj) & df_output['fips'].isnull(),'fips'] = cty_fips
-
-        # Drop the column
-        df_output.drop(['area_join'], axis = 1, inplace = True)
+        print('Reading the CQ files')
+        with ProcessPoolExecutor(max_workers = self.max_workers) as executor:
+            futures = dict((office, [executor.submit(self.readCQFile, path, office) for path in self.getCQFiles(office)])
+                            for office in cq_offices)
+            offices = dict((office, pd.concat([future.result() for future in futures[office]], ignore_index = True))
+                            for office in cq_offices)
+
+        # The senate and presidential results only keep the columns of the governor results
+        print('Formatting the CQ data')
+        col_out = list(offices['gov'])
+        df_output = pd.concat([offices['sen'][col_out], offices['gov'], offices['hr'], offices['pres'][col_out]], ignore_index = True)
+        df_output = self.cleanCQVoteData(df_output)
+
+        print('Resolving the county FIPS codes')
+        df_output['fips'], self.unresolved_areas = self.county_index.resolve(df_output['state'], df_output['area'])
+        if len(self.unresolved_areas) > 0:
+            print('%i areas could not be resolved to a county:' % len(self.unresolved_areas))
+            for state, area in sorted(self.unresolved_areas, key = str)[:25]:
+                print('  %s, %s' % (area, state))
 
         # Write the cq voting data to file
-        df_output.to_csv(self.proc_data.joinpath('cq_voting.tsv.gz'),
-                            compression = 'gzip',
-                            mode = 'w',
-                            sep='\t',
-                            index = False,
-                            encoding='utf-8',
-                            line_terminator = '\n')
+        self.storage.writeDataset(df_output, 'cq_voting')
 
 
     def formatMITHouse(self):
@@ -124,16 +137,7 @@ class VotingDataFormatter(object):
                         encoding='latin-1')
 
         # Map the district to the counties
-        df_lkup = pd.read_csv(self.lkup_data.joinpath('cd116','National_CD116.txt'),
-                        index_col = False,
-                        encoding='latin-1',
-                        dtype = {'BLOCKID':np.str})
-        
-        # Format the file and get rid of all files
-        df_lkup['BLOCKID'] = df_lkup['BLOCKID'].str[:5]
-        df_lkup.drop_duplicates(inplace = True)
-        df_lkup['state_fips'] = df_lkup['BLOCKID'].astype(int) // 1000
-        df_lkup.rename(columns={'BLOCKID':'FIPS','CD116': 'DISTRICT'}, inplace = True)
+        df_lkup = self.crosswalk.table()[['fips','state_fips','district']].rename(columns={'fips':'FIPS','district': 'DISTRICT'})
         df = df[(df['writein'] == False) & (df['party'] != 'NA')]
         df.rename(columns = {'district':'DISTRICT'}, inplace = True)
 
@@ -156,7 +160,7 @@ class VotingDataFormatter(object):
         df = df[(df['writein'] == False) & (df['party'] != 'NA')]
         df.rename(columns = {'district':'DISTRICT'}, inplace = True)
 
-        df['state_fips'] = (df['state_fips']*1000).astype(str).str.pad(width = 5, side = 'left', fillchar = '0')
+        df['state_fips'] = countyFIPS(df['state_fips'], 0).values
         df.rename(columns = {'state_fips':'FIPS'}, inplace = True)
         return df[pollOut]
 
@@ -175,7 +179,7 @@ class VotingDataFormatter(object):
                         encoding='latin-1')
 
         df = df[df['FIPS'].notnull()]
-        df['FIPS'] = df['FIPS'].astype(int).astype(str).str.pad(width = 5, side = 'left', fillchar = '0')
+        df['FIPS'] = encodeFIPS(df['FIPS']).values
         df.insert(4, 'DISTRICT', 0)
         df.insert(5, 'special', False)
         return df[pollOut]
@@ -188,81 +192,60 @@ class VotingDataFormatter(object):
         ---------
          > A DataFrame with 2020 data
         """
-        with open(self.mit_raw_data.joinpath('President','2020_results.json')) as f:
-            data = json.load(f)
-        df_2020 = pd.DataFrame()
-        for race in data['data']['races']:
-            candidates = {}
-            for person in race['candidates']:
-                candidates[person['candidate_key']] =  {'name': person['name_display'],
-                                    'party': person['party_id']}
-            state = race['state_id']
-            office = race['office']
-            county_data = []
-            for county in race['counties']:
-                fips, name, total_votes =  county['fips'], county['name'], county['votes']
-                for cand, votes in county['results'].items():
-                    results = {'FIPS': fips, 'county_name': name, 'totalvotes': total_votes, 'DISTRICT': 'statewide',
-                            'office': office, 'candidatevotes': votes,'year' : 2020, 'special': 'False',
-                            'state_po': state, 'candidate': candidates[cand]['name'], 'party': candidates[cand]['party']}
-                    county_data.append(results)
-            df = pd.DataFrame(county_data)
-            df_2020 = pd.concat([df_2020, df[pollOut]])
+        return self.formatResultsJSON('2020_results.json', 2020)
 
-        return df_2020
-    
-    def formatCQVoteData(self, office):
+    def formatResultsJSON(self, file_nm, year):
         """ 
-        A function that gets the historical house data and formats it correctly for consolidation with the other data
+        A function that gets the county level presidential results of a cycle published as a json document of races
         ...
         Parameters
         ----------
-        office: The office to get the file from
-        ...
-        Returns
-        ----------
-          > a dataframe with the correct format for output
+        file_nm: The name of the results document in the MIT President directory (i.e. 2020_results.json)
+        year: The election year
         """
-        HIST_PATH = self.cq_raw_data.joinpath(office)
-        vote_files = [f for f in listdir(HIST_PATH) if isfile(join(HIST_PATH, f))]
-
-        df_out = pd.DataFrame()
-        for file in vote_files:
-            df = pd.read_csv(HIST_PATH.joinpath(file),
-                            index_col = False,
-                            encoding='latin-1')
-            df.columns = df.columns.str.lower()
-            df.replace({r'\|':',', '\r':'\n'}, regex = True, inplace = True)
-            df.rename(columns = {'racedate':'raceyear'}, inplace = True)
-            df['raceyear'] = df['raceyear'].astype(str).apply(lambda x: x[:4] if len(x) > 4 else x)
-            if office == 'hr':
-                df['titlenotes'] = ''
-                df['othernotes'] = ''
+        return readResultsJSON(self.mit_raw_data.joinpath('President', file_nm), year)[pollOut]
 
-            for column in list(df):
-                if 'percent' in column.lower() or 'votes' in column.lower():
-                    df[column] = df[column].astype(str).str.replace('Unopposed', '0').astype(float)
-
-            df_out = pd.concat([df_out, df])
-        df_out['area_join'] = df_out['area'].str.upper().str.replace(' CITY','').str.replace(' ','')\
-                                            .str.replace('.','').str.replace('\'','').str.replace('/WASHABAUGH','')
-        return df_out
+    def getCQFiles(self, office):
+        """
+        The paths of the CQ result files of an office
+        """
+        HIST_PATH = self.cq_raw_data.joinpath(office)
+        return [HIST_PATH.joinpath(f) for f in sorted(listdir(HIST_PATH)) if isfile(join(HIST_PATH, f))]
 
-    def getFIPSLkp(self):
-        """ 
-        Get the FIPS lookup per zip code.
+    def readCQFile(self, file_path, office):
+        """
+        Read a CQ result file with the declared dtypes and lower case column names, this runs in the process pool
+        ...
+        Parameters
+        ----------
+        file_path: The path of the file
+        office: The office of the results
         """
-        df_tmp = pd.read_csv(self.demo_path.joinpath('2018','cc-est2018-alldata.csv.gz'),
+        header = pd.read_csv(file_path, index_col = False, nrows = 0, encoding = 'latin-1').columns
+        dtypes = dict((col, cqDtype(col)) for col in header if cqDtype(col) is not None)
+        df = pd.read_csv(file_path,
                         index_col = False,
-                        compression = 'gzip',
-                        sep='\t',
+                        dtype = dtypes,
                         encoding='latin-1')
-
-        df = df_tmp[['STATE','STNAME','COUNTY', 'CTYNAME']].drop_duplicates()
-        df.insert(0, 'fips', (df['STATE']*1000 + df['COUNTY']).astype(str).str.pad(width = 5, side = 'left', fillchar = '0'))
-        df['CTYNAME'] = df['CTYNAME'].replace({' County':''}, regex = True)
-        df['CTYNAME'] = df['CTYNAME'].str.upper()
-        df.rename(columns = {'CTYNAME':'area','STNAME':'state'}, inplace = True)
-        df['area_join'] = df['area'].str.upper().str.replace(' CITY','').str.replace(' PARISH','')\
-                                    .str.replace(' ','').str.replace('.','').str.replace('\'','').str.replace('/WASHABAUGH','')
-        return df[['fips','area_join','state']]
\ No newline at end of file
+        df.columns = df.columns.str.lower()
+        df.rename(columns = {'racedate':'raceyear'}, inplace = True)
+        if office == 'hr':
+            df['titlenotes'] = ''
+            df['othernotes'] = ''
+        return df
+
+    def cleanCQVoteData(self, df):
+        """
+        Clean the combined CQ results: the separators in the text are replaced, the race dates are cut to the year and the
+        vote and percent columns are converted to floats with unopposed races as 0
+        ...
+        Parameters
+        ----------
+        df: The combined CQ results
+        """
+        numeric = [col for col in df.columns if 'percent' in col or 'votes' in col]
+        text = [col for col in df.columns if col not in numeric and col != 'raceyear' and df[col].dtype == object]
+        df[text] = df[text].replace({r'\|':',', '\r':'\n'}, regex = True)
+        df['raceyear'] = df['raceyear'].astype(str).str[:4]
+        df[numeric] = df[numeric].apply(lambda col: col.str.replace('Unopposed', '0', regex = False)).astype(float)
+        return df
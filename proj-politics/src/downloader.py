@@ -7,7 +7,7 @@
 from pathlib import Path
 import pandas as pd
 import sys
-from download_and_format import FECBulkDownloader, IndicatorDataFormatter, DemographicDataFormatter, GDPFormatter, VotingDataFormatter, VDemFormatter
+from download_and_format import FECBulkDownloader, FECDownloadManager, IndicatorDataFormatter, DemographicDataFormatter, GDPFormatter, VotingDataFormatter, VDemFormatter, ProcessedDataStore, ContributionAggregator, Stage, StageRunner
 
 __author__ = "Dylan Smith"
 __copyright__ = "Copyright (C) 2019 Dylan Smith"
@@ -22,44 +22,96 @@ __status__ = "Development"
 #constants
 PROJ = Path(__file__).resolve().parent.parent.parent
 DATA_PATH = PROJ.joinpath('data','politics')
+STORAGE_BACKEND = 'parquet'
+STORE = ProcessedDataStore(DATA_PATH.joinpath('processed'), backend = STORAGE_BACKEND)
 
-def downloadCampaignFinanceData(full_load = False):
+def campaignFinanceJobs(full_load = False):
     '''
-    To download campaign finance data from the FEC, either update the current election cycle or download all files
+    Get the (dataset, cycle) pairs to download from the FEC
     ...
     Parameters
     ----------
     full_load: Whether to download all files or just update the current files
     '''
-    # Instantiate FEC Downloader
-    fec_downloader = FECBulkDownloader(proj_data= DATA_PATH)
+    jobs = []
     for dataset in ['CANDIDATE_MASTER','CANDIDATE_COMMITTEE','COMMITTEE_MASTER','CONTRIBUTION_COMMITTEE_CANDIDATE','INDIVIDUAL_SUMMARY']:
         if full_load:
-            # Get data for 1970 to 1998
+            # Get data for 1980 to 1998, pass datasets that don't have data in this time frame
             for yr in range(80, 99, 2):
-                # Pass datasets that don't have data in this time frame
                 if dataset in ['CANDIDATE_COMMITTEE']:
                     break
                 elif dataset == 'CONTRIBUTION_COMMITTEE_CANDIDATE' and yr < 82:
                     continue
-
-                print('Downloading %s data for the cycle %i' % (dataset, yr))
-                fec_downloader.downloadAndFormatFECBulkData(dataset, yr)
+                jobs.append((dataset, yr))
 
             # Get data for 2000 to 2022
-            for yr in range(0, 23, 2):
-                print('Downloading %s data for the cycle %i' % (dataset, yr))
-                fec_downloader.downloadAndFormatFECBulkData(dataset, yr, download_data= True)
-            break
+            jobs += [(dataset, yr) for yr in range(0, 23, 2)]
         else:
             # get data for the current cycle
-            fec_downloader.downloadAndFormatFECBulkData(dataset, 22)
+            jobs.append((dataset, 22))
+    return jobs
+
+def downloadCampaignFinanceFiles(full_load = False):
+    '''
+    Download the FEC bulk files in parallel.  The download manager skips the files that haven't changed on the FEC site and
+    resumes the partial downloads of a prior run.
+    ...
+    Parameters
+    ----------
+    full_load: Whether to download all files or just update the current files
+    '''
+    fec_downloader = FECBulkDownloader(proj_data= DATA_PATH)
+    _, failures = fec_downloader.download_manager.downloadAll(campaignFinanceJobs(full_load = full_load))
+    if len(failures) > 0:
+        print('%i downloads failed, rerun to resume: %s' % (len(failures), ', '.join('%s %i' % job for job in failures)))
+
+def formatCampaignFinanceData(full_load = False):
+    '''
+    Format the downloaded FEC bulk files one at a time, skipping the files that have been formatted since they were last
+    downloaded, and refresh the contribution rollups
+    ...
+    Parameters
+    ----------
+    full_load: Whether to format all files or just the current files
+    '''
+    fec_downloader = FECBulkDownloader(proj_data= DATA_PATH)
+    download_manager = fec_downloader.download_manager
+    for dataset, yr in campaignFinanceJobs(full_load = full_load):
+        zip_path = download_manager.zipPath(dataset, yr)
+        if not zip_path.exists():
+            print('%s data for the cycle %i has not been downloaded' % (dataset, yr))
+            continue
+        elif download_manager.isCompleted(dataset, yr):
+            print('%s data for the cycle %i is up to date' % (dataset, yr))
+            continue
+
+        print('Formatting %s data for the cycle %i' % (dataset, yr))
+        fec_downloader.downloadAndFormatFECBulkData(dataset, yr, download_data= True, zip_path= zip_path)
+        download_manager.markCompleted(dataset, yr)
+
+    # Refresh the contribution rollups for any file_nm partitions that were rewritten
+    for dataset in ['individual-summary', 'contribution-committee-candidate']:
+        if fec_downloader.proc_data.joinpath(dataset).exists():
+            ContributionAggregator(fec_downloader.proc_data, dataset = dataset).refresh()
+
+def downloadCampaignFinanceData(full_load = False):
+    '''
+    To download campaign finance data from the FEC, either update the current election cycle or download all files.  The
+    files are downloaded in parallel first and then formatted one at a time, skipping the cycles that haven't changed since
+    they were last formatted.  Rerunning after a failure picks up where the prior run stopped.
+    ...
+    Parameters
+    ----------
+    full_load: Whether to download all files or just update the current files
+    '''
+    downloadCampaignFinanceFiles(full_load = full_load)
+    formatCampaignFinanceData(full_load = full_load)
 
 def formatIndicatorAndEmploymentData():
     '''
     A function that formats the indicator data (Employment, Culture, and Education)
     '''
-    indicator_formater = IndicatorDataFormatter(data_path= DATA_PATH)
+    indicator_formater = IndicatorDataFormatter(data_path= DATA_PATH, storage= STORE)
     print('Formatting Culture Data')
     indicator_formater.formatCultureData()
     print('Finished formatting Culture Data, now formatting Employment Data')
@@ -73,7 +125,7 @@ def formatDemographicData():
     A function that formats the demographic data from the US Census Bureau.
     """
     print('Formatting Demographic Data from the US Census Bureau')
-    demo_formatter = DemographicDataFormatter(data_path= DATA_PATH)
+    demo_formatter = DemographicDataFormatter(data_path= DATA_PATH, storage= STORE)
     demo_formatter.consolidateDemographicData()
     print('Demographic data has been formatted')
 
@@ -82,7 +134,7 @@ def formatGDPData():
     Format the GDP data output
     """
     print('Formatting GDP Data')
-    gdp_formatter = GDPFormatter(data_path= DATA_PATH)
+    gdp_formatter = GDPFormatter(data_path= DATA_PATH, storage= STORE)
     gdp_formatter.processGDPData()
     print('Demographic data has been formatted')
 
@@ -90,7 +142,7 @@ def formatVotingData():
     '''
     Format the MIT and CQ Voting Data
     '''
-    voting_formatter = VotingDataFormatter(data_path= DATA_PATH)
+    voting_formatter = VotingDataFormatter(data_path= DATA_PATH, storage= STORE)
     print('Formatting MIT Data')
     voting_formatter.formatMITPollingData()
     print('Formatted MIT data.  Moving to format CQ data')
@@ -102,107 +154,148 @@ def formatVDEMData():
     
     '''
     print('Format VDEM Data')
-    vdem_formatter = VDemFormatter(data_path= DATA_PATH)
+    vdem_formatter = VDemFormatter(data_path= DATA_PATH, storage= STORE)
     vdem_formatter.formatPartyData()
     print('Finished Formatting VDem Data')
 
-def consolidateVotingDemographicAndIndicatorData():
+def consolidateStates(states, df_vdem):
     '''
-    
+    Join the voting results of a group of states with the county level culture, gdp, employment, demographic and education
+    data and the national party data
+    ...
+    Parameters
+    ----------
+    states: A list of the state abbreviations (state_po) in the chunk
+    df_vdem: The V-Dem party data for the United States
+    ...
+    Returns
+    ----------
+     > A DataFrame
     '''
-    print('Getting Culture Data')
-    df_vote = pd.read_csv(DATA_PATH.joinpath('processed','mit_voting.tsv.gz'),
-                        compression = 'gzip',
-                        sep = '\t',
-                        index_col = False,
-                        encoding = 'utf-8',
-                        lineterminator = '\n')
-
-    df_cult = pd.read_csv(DATA_PATH.joinpath('processed','culture.tsv.gz'),
-                        compression = 'gzip',
-                        sep = '\t',
-                        index_col = False,
-                        encoding = 'utf-8',
-                        lineterminator = '\n')
-
-    df_gdp = pd.read_csv(DATA_PATH.joinpath('processed','gdp.tsv.gz'),
-                        compression = 'gzip',
-                        sep = '\t',
-                        index_col = False,
-                        encoding = 'utf-8',
-                        lineterminator = '\n')
-
-    df_employ = pd.read_csv(DATA_PATH.joinpath('processed','employment.tsv.gz'),
-                        compression = 'gzip',
-                        sep = '\t',
-                        index_col = False,
-                        encoding = 'utf-8',
-                        lineterminator = '\n')
-
-    df_demo = pd.read_csv(DATA_PATH.joinpath('processed','demographics.tsv.gz'),
-                        compression = 'gzip',
-                        sep = '\t',
-                        index_col = False,
-                        encoding = 'utf-8',
-                        lineterminator = '\n')
-
-    df_edu = pd.read_csv(DATA_PATH.joinpath('processed','education.tsv.gz'),
-                        compression = 'gzip',
-                        sep = '\t',
-                        index_col = False,
-                        encoding = 'utf-8',
-                        lineterminator = '\n')
-    
-    df_vdem = pd.read_csv(DATA_PATH.joinpath('processed','vdem_party.tsv.gz'),
-                        compression = 'gzip',
-                        sep = '\t',
-                        index_col = False,
-                        encoding = 'utf-8',
-                        lineterminator = '\n')
-
-    df_vote['year_join'] = df_vote['year'].astype('int') // 10 * 10
-    df_vote['year_join'] = df_vote['year_join'].replace(2020, 2010)
-    # Bring together the dataframes and filter out AK & HI
-    df_agg = df_vote[(~df_vote['state_po'].isin(['AK','HI'])) & (df_vote['year'] >= 2000)]\
-                    .merge(df_cult, on = ['fips','year_join'], how = 'left')
-    df_agg.drop('state', inplace = True, axis = 1)
-    
-    print('Format GDP Data')
+    # Only read the years, states and counties that make it into the consolidated output
+    df_vote = STORE.readDataset('mit_voting', years = (2000, None), filters = [('state_po', 'in', states)])
+    fips = [int(x) for x in df_vote['fips'].dropna().unique()]
+    county_filter = [('fips', 'in', fips)]
+    df_cult = STORE.readDataset('culture', columns = [col for col in STORE.getColumns('culture') if col != 'state'], filters = county_filter)
+    df_gdp = STORE.readDataset('gdp', years = (2000, None), filters = county_filter)
+    df_employ = STORE.readDataset('employment', columns = [col for col in STORE.getColumns('employment') if col != 'state'],
+                                years = (2000, None), filters = county_filter)
+    df_demo = STORE.readDataset('demographics', years = (2000, None), filters = county_filter)
+    df_edu = STORE.readDataset('education', years = (2000, None), filters = county_filter)
+
+    # Join on the integer fips codes and small integer years
     df_gdp.rename({'yr':'year'}, axis = 1, inplace = True)
+    df_employ.rename({'yr':'year'}, axis = 1, inplace = True)
+    df_edu.rename({'year':'year_join'}, axis = 1, inplace = True)
+
+    df_vote['year_join'] = df_vote['year'] // 10 * 10
+    df_vote['year_join'] = df_vote['year_join'].replace(2020, 2010)
+    # Bring together the dataframes
+    df_agg = df_vote.merge(df_cult, on = ['fips','year_join'], how = 'left')
+
     df_agg = df_agg.merge(df_gdp, on = ['fips','year'], how = 'left')
 
-    print('Getting Employment Data')
-    df_employ.rename({'yr':'year'}, axis = 1, inplace = True)
-    df_employ.drop(columns = 'state', inplace = True)
     df_agg = df_agg.merge(df_employ, on = ['fips','year'], how = 'left')
 
-    print('Getting Demographic Data')
     df_agg = df_agg.merge(df_demo, on = ['fips','year'], how = 'left')
-    
-    print('Getting Education Data')
-    df_edu.rename({'year':'year_join'}, axis = 1, inplace = True)
+
     df_agg = df_agg.merge(df_edu, on = ['fips','year_join'], how = 'left')
     df_agg.drop('year_join', inplace = True, axis = 1)
 
-    # Get the Education Data
-    df_vdem = df_vdem[df_vdem['country_name'] == 'United States of America']
     df_agg = df_agg.merge(df_vdem, on = ['party','year'], how = 'left')
-    df_agg = df_agg.groupby('fips').apply(lambda x: x.ffill().bfill())
+
+    # Fill the gaps within each county with grouped fills instead of a python function per county.  Rows without a
+    # county can't be filled and are dropped like the groupby did before
+    df_agg = df_agg[df_agg['fips'].notnull()]
+    value_cols = [col for col in df_agg.columns if col != 'fips']
+    df_agg[value_cols] = df_agg.groupby('fips', sort = False)[value_cols].ffill()
+    df_agg[value_cols] = df_agg.groupby('fips', sort = False)[value_cols].bfill()
 
     # Get rid of null values and convert the year to an integer
     df_agg = df_agg[~df_agg['year'].isnull()]
     df_agg['year'] = df_agg['year'].astype('int')
+    return df_agg
+
+def consolidateVotingDemographicAndIndicatorData(states_per_chunk = 8):
+    '''
+    Consolidate the voting results with the indicator, demographic and party data.  The joins and fills only ever look
+    within a county, so the states are processed in independent chunks and written out one chunk at a time to keep the
+    peak memory bounded.
+    ...
+    Parameters
+    ----------
+    states_per_chunk: The number of states joined at a time
+    '''
+    print('Getting V-Dem Party Data')
+    df_vdem = STORE.readDataset('vdem_party', columns = [col for col in STORE.getColumns('vdem_party') if col != 'country_name'],
+                                years = (2000, None), filters = [('country_name', '=', 'United States of America')])
+
+    # Filter out AK & HI
+    states = STORE.readDataset('mit_voting', columns = ['state_po'], years = (2000, None))['state_po'].dropna().unique()
+    states = sorted(x for x in states if x not in ['AK','HI'])
+    chunks = [states[i:i + states_per_chunk] for i in range(0, len(states), states_per_chunk)]
+
+    def consolidatedChunks():
+        for chunk in chunks:
+            print('Consolidating the data for %s' % ', '.join(chunk))
+            yield consolidateStates(chunk, df_vdem)
 
     print('Writing data to the consolidated file output')
-    df_agg.to_csv(DATA_PATH.joinpath('processed','voting_demographic.tsv.gz'),
-                compression = 'gzip',
-                mode = 'a',
-                sep='\t',
-                index = False,
-                encoding='utf-8',
-                line_terminator = '\n')
-
-def main(download_to_run= None):
+    STORE.writeDatasetChunks(consolidatedChunks(), 'voting_demographic')
+
+def pipelineStages():
+    '''
+    The formatting stages with the raw files they read and the processed datasets they write
+    '''
+    RAW = DATA_PATH.joinpath('raw')
+    CC_EST = RAW.joinpath('demographics','2018','cc-est2018-alldata.csv.gz')
+    FEC_ZIP = FECDownloadManager(RAW.joinpath('campaign-finance','zip'))
+    # The demographic and voting formatters run their own process pools, so they run on a thread of the runner
+    return [Stage('demographic', formatDemographicData, in_process = True,
+                inputs = [RAW.joinpath('demographics','2009'), CC_EST],
+                outputs = [STORE.datasetPath('demographics')]),
+            Stage('indicator', formatIndicatorAndEmploymentData,
+                inputs = [RAW.joinpath('indicators','regions.csv'), RAW.joinpath('indicators','Rural_Atlas_Update22'),
+                        RAW.joinpath('indicators','Unemployment.xls'), RAW.joinpath('indicators','Education.xls'),
+                        RAW.joinpath('employment','CAEMP25S__ALL_AREAS_1969_2000.csv'),
+                        RAW.joinpath('employment','CAEMP25N__ALL_AREAS_2001_2018.csv')],
+                outputs = [STORE.datasetPath(name) for name in ['culture','employment','education']]),
+            Stage('voting', formatVotingData, in_process = True,
+                inputs = [RAW.joinpath('voting','mit'), RAW.joinpath('voting','cq'), RAW.joinpath('lookup','cd116'), CC_EST],
+                outputs = [STORE.datasetPath(name) for name in ['mit_voting','cq_voting']]),
+            Stage('vdem', formatVDEMData,
+                inputs = [RAW.joinpath('v-dem','V-Dem-CPD-Party-V1.csv')],
+                outputs = [STORE.datasetPath('vdem_party')]),
+            Stage('gdp', formatGDPData,
+                inputs = [RAW.joinpath('indicators','gdp_usd_all_areas.tsv.gz'), RAW.joinpath('indicators','gdp_change_all_areas.tsv.gz')],
+                outputs = [STORE.datasetPath('gdp')]),
+            # The FEC files are remote, the download always runs and the download manager decides what has changed.  The
+            # formatting only runs when one of the downloaded zip files changed
+            Stage('campaign-download', downloadCampaignFinanceFiles,
+                outputs = [FEC_ZIP.zipPath(dataset, yr) for dataset, yr in campaignFinanceJobs()]),
+            Stage('campaign', formatCampaignFinanceData,
+                inputs = [FEC_ZIP.zipPath(dataset, yr) for dataset, yr in campaignFinanceJobs()],
+                outputs = [DATA_PATH.joinpath('processed','campaign-finance')]),
+            Stage('consolidate', consolidateVotingDemographicAndIndicatorData,
+                inputs = [STORE.datasetPath(name) for name in ['mit_voting','culture','gdp','employment','demographics','education','vdem_party']],
+                outputs = [STORE.datasetPath('voting_demographic')])]
+
+def runPipeline(targets = None, force = False):
+    '''
+    Run the formatting stages in dependency order, independent stages run at the same time and stages whose inputs haven't
+    changed are skipped
+    ...
+    Parameters
+    ----------
+    targets: A list of the stages to run along with their upstream stages, all stages if None
+    force: Rerun the stages even if their inputs haven't changed
+    '''
+    runner = StageRunner(pipelineStages(), state_path = DATA_PATH.joinpath('processed','_stage_state.json'))
+    results = runner.run(targets = targets, force = force)
+    for name, result in sorted(results.items()):
+        print('%s: %s' % (name, result))
+
+def main(download_to_run= None, force = False):
     if download_to_run == 'demographic':
         formatDemographicData()
     elif download_to_run == 'indicator':
@@ -219,7 +312,12 @@ def main(download_to_run= None):
         downloadCampaignFinanceData(full_load = True)
     elif download_to_run == 'gdp':
         formatGDPData()
+    elif download_to_run == 'all':
+        # Everything but the FEC download, it doesn't feed the consolidated data
+        runPipeline(targets = ['consolidate'], force = force)
+    elif download_to_run == 'pipeline':
+        runPipeline(force = force)
 
 if __name__ == '__main__':
     #import the process to run
-    main(download_to_run = sys.argv[1])
\ No newline at end of file
+    main(download_to_run = sys.argv[1], force = '--force' in sys.argv[2:])
\ No newline at end of file
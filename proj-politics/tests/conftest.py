@@ -0,0 +1,8 @@
+"""
+    Shared fixtures of the proj-politics tests.  The download_and_format package is imported from src the same way the
+    scripts in src import it.
+"""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath('src')))
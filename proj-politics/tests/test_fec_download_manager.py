@@ -0,0 +1,148 @@
+"""
+    Runs the FECDownloadManager against a local http.server that stands in for the FEC bulk downloads.  The server serves
+    fixture zips, answers HEAD requests with the ETag/Last-Modified of each file and honours Range/If-Range requests.
+"""
+import http.server
+import io
+import re
+import threading
+import zipfile
+import pytest
+from download_and_format.fec_download_manager import FECDownloadManager
+
+def fixtureZip(member, lines):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression = zipfile.ZIP_STORED) as z:
+        z.writestr(member, '\n'.join(lines))
+    return buffer.getvalue()
+
+class FixtureFile(object):
+
+    def __init__(self, body, etag = None, last_modified = None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+
+class BulkHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def sendValidators(self, fixture):
+        if fixture.etag is not None:
+            self.send_header('ETag', fixture.etag)
+        if fixture.last_modified is not None:
+            self.send_header('Last-Modified', fixture.last_modified)
+
+    def do_HEAD(self):
+        fixture = self.server.files.get(self.path)
+        if fixture is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(fixture.body)))
+        self.sendValidators(fixture)
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.gets.append((self.path, self.headers.get('Range'), self.headers.get('If-Range')))
+        fixture = self.server.files.get(self.path)
+        if fixture is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body, status = fixture.body, 200
+        match = re.match(r'^bytes=(\d+)-$', self.headers.get('Range') or '')
+        if match is not None and self.headers.get('If-Range') in [fixture.etag, fixture.last_modified]:
+            body, status = fixture.body[int(match.group(1)):], 206
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if status == 206:
+            self.send_header('Content-Range', 'bytes %i-%i/%i' % (len(fixture.body) - len(body), len(fixture.body) - 1, len(fixture.body)))
+        self.sendValidators(fixture)
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def server():
+    srv = http.server.ThreadingHTTPServer(('127.0.0.1', 0), BulkHandler)
+    srv.files, srv.gets = {}, []
+    srv.files['/2020/cn20.zip'] = FixtureFile(fixtureZip('cn.txt', ['H0AK00097|PELTOLA|DEM|2020'] * 200), etag = '"cn-v1"')
+    srv.files['/2020/ccl20.zip'] = FixtureFile(fixtureZip('ccl.txt', ['H0AK00097|2020|C00123456'] * 200),
+                                               last_modified = 'Wed, 01 Jan 2020 00:00:00 GMT')
+    thread = threading.Thread(target = srv.serve_forever, daemon = True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+@pytest.fixture
+def manager_factory(server, tmp_path):
+    return lambda: FECDownloadManager(tmp_path.joinpath('zip'), base_url = 'http://127.0.0.1:%i' % server.server_address[1], max_workers = 2)
+
+JOBS = [('CANDIDATE_MASTER', 20), ('CANDIDATE_COMMITTEE', 20)]
+
+def test_download_writes_the_files_and_the_manifest(server, manager_factory):
+    manager = manager_factory()
+    results, failures = manager.downloadAll(JOBS)
+    assert failures == {}
+    for job, url_path in zip(JOBS, ['/2020/cn20.zip', '/2020/ccl20.zip']):
+        zip_path, changed = results[job]
+        assert changed
+        assert zip_path.read_bytes() == server.files[url_path].body
+        assert not zip_path.with_suffix('.zip.part').exists()
+
+    manager.markCompleted('CANDIDATE_MASTER', 20)
+    reloaded = manager_factory()
+    assert reloaded.isCompleted('CANDIDATE_MASTER', 20)
+    assert not reloaded.isCompleted('CANDIDATE_COMMITTEE', 20)
+    entry = reloaded.manifest[reloaded.key('CANDIDATE_MASTER', 20)]
+    assert entry['etag'] == '"cn-v1"'
+    assert entry['size'] == len(server.files['/2020/cn20.zip'].body)
+    assert reloaded.manifest[reloaded.key('CANDIDATE_COMMITTEE', 20)]['last_modified'] == 'Wed, 01 Jan 2020 00:00:00 GMT'
+
+def test_unchanged_files_are_skipped(server, manager_factory):
+    manager_factory().downloadAll(JOBS)
+    server.gets.clear()
+
+    results, failures = manager_factory().downloadAll(JOBS)
+    assert failures == {}
+    assert not any(changed for _, changed in results.values())
+    assert server.gets == []
+
+    # A new version of one file is downloaded again
+    server.files['/2020/cn20.zip'] = FixtureFile(fixtureZip('cn.txt', ['H0AK00097|PELTOLA|DEM|2022']), etag = '"cn-v2"')
+    results, _ = manager_factory().downloadAll(JOBS)
+    assert results[('CANDIDATE_MASTER', 20)][1]
+    assert not results[('CANDIDATE_COMMITTEE', 20)][1]
+    assert results[('CANDIDATE_MASTER', 20)][0].read_bytes() == server.files['/2020/cn20.zip'].body
+
+@pytest.mark.parametrize('data_typ, url_path, validator', [('CANDIDATE_MASTER', '/2020/cn20.zip', '"cn-v1"'),
+                                                           ('CANDIDATE_COMMITTEE', '/2020/ccl20.zip', 'Wed, 01 Jan 2020 00:00:00 GMT')])
+def test_partial_download_is_resumed(server, manager_factory, data_typ, url_path, validator):
+    manager = manager_factory()
+    body = server.files[url_path].body
+    offset = len(body) // 2
+    zip_path = manager.zipPath(data_typ, 20)
+    zip_path.with_suffix('.zip.part').write_bytes(body[:offset])
+    manager.manifest[manager.key(data_typ, 20)] = {'url': manager.url(data_typ, 20), 'partial_validator': validator, 'completed': False}
+    manager.saveManifest()
+
+    zip_path, changed = manager_factory().downloadFile(data_typ, 20)
+    assert changed
+    assert server.gets == [(url_path, 'bytes=%i-' % offset, validator)]
+    assert zip_path.read_bytes() == body
+
+def test_partial_download_of_another_version_starts_over(server, manager_factory):
+    manager = manager_factory()
+    body = server.files['/2020/cn20.zip'].body
+    zip_path = manager.zipPath('CANDIDATE_MASTER', 20)
+    zip_path.with_suffix('.zip.part').write_bytes(b'stale bytes of an older version')
+    manager.manifest[manager.key('CANDIDATE_MASTER', 20)] = {'partial_validator': '"cn-v0"', 'completed': False}
+    manager.saveManifest()
+
+    zip_path, _ = manager_factory().downloadFile('CANDIDATE_MASTER', 20)
+    assert server.gets == [('/2020/cn20.zip', None, None)]
+    assert zip_path.read_bytes() == body
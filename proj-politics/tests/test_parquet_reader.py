@@ -0,0 +1,40 @@
+"""
+    Reads a small file_nm partitioned dataset with the ParquetReader.  The read ahead thread pool is shut down when the
+    groups run out and when the caller stops early.
+"""
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+from download_and_format.parquet_reader import ParquetReader
+
+@pytest.fixture
+def dataset_path(tmp_path):
+    table = pa.table({'file_nm': ['indiv-%i' % (i % 6) for i in range(60)], 'amount': list(range(60))})
+    ds.write_dataset(table, str(tmp_path), format = 'parquet', partitioning = ['file_nm'], partitioning_flavor = 'hive')
+    return tmp_path
+
+def isClosed(reader):
+    return reader.executor._shutdown and len(reader.pending) == 0
+
+def test_reads_every_group(dataset_path):
+    reader = ParquetReader(dataset_path, 'file_nm', n = 2, prefetch = 2)
+    assert sum(df['amount'].sum() for df in reader) == sum(range(60))
+    assert isClosed(reader)
+
+def test_early_break_closes(dataset_path):
+    with ParquetReader(dataset_path, 'file_nm', n = 1, prefetch = 2) as reader:
+        for df in reader:
+            assert len(reader.pending) > 0
+            break
+    assert isClosed(reader)
+
+def test_batches_close(dataset_path):
+    reader = ParquetReader(dataset_path, 'file_nm', n = 1, filters = [('amount', '<', 30)])
+    batches = reader.batches()
+    next(batches)
+    batches.close()
+    assert isClosed(reader)
+
+    reader = ParquetReader(dataset_path, 'file_nm', n = 1, filters = [('amount', '<', 30)])
+    assert sum(batch.num_rows for batch in reader.batches()) == 30
+    assert isClosed(reader)
@@ -0,0 +1,45 @@
+"""
+    Runs the StageRunner over small stages that write files.  A stage that starts a process pool of its own runs on a thread
+    of the runner, the other stages run in the runner's process pool, and a stage is skipped until its inputs change.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from download_and_format.stage_runner import Stage, StageRunner
+
+def square(x):
+    return x * x
+
+def writeSquares(in_path, out_path):
+    with ProcessPoolExecutor(max_workers = 2) as executor:
+        squares = list(executor.map(square, json.loads(in_path.read_text())))
+    out_path.write_text(json.dumps({'pid': os.getpid(), 'values': squares}))
+
+def writeTotal(in_path, out_path):
+    out_path.write_text(json.dumps({'pid': os.getpid(), 'total': sum(json.loads(in_path.read_text())['values'])}))
+
+def pipeline(tmp_path):
+    numbers, squares, total = tmp_path.joinpath('numbers.json'), tmp_path.joinpath('squares.json'), tmp_path.joinpath('total.json')
+    stages = [Stage('squares', partial(writeSquares, numbers, squares), inputs = [numbers], outputs = [squares], in_process = True),
+              Stage('total', partial(writeTotal, squares, total), inputs = [squares], outputs = [total])]
+    return StageRunner(stages, state_path = tmp_path.joinpath('state.json'), max_workers = 2), numbers, squares, total
+
+def test_pool_stage_runs_in_process(tmp_path):
+    runner, numbers, squares, total = pipeline(tmp_path)
+    numbers.write_text(json.dumps([1, 2, 3]))
+    assert runner.run() == {'squares': 'ran', 'total': 'ran'}
+    assert json.loads(total.read_text())['total'] == 14
+    assert json.loads(squares.read_text())['pid'] == os.getpid()
+    assert json.loads(total.read_text())['pid'] != os.getpid()
+
+def test_unchanged_inputs_skip(tmp_path):
+    runner, numbers, squares, total = pipeline(tmp_path)
+    numbers.write_text(json.dumps([1, 2, 3]))
+    runner.run()
+    runner, numbers, squares, total = pipeline(tmp_path)
+    assert runner.run() == {'squares': 'skipped', 'total': 'skipped'}
+
+    numbers.write_text(json.dumps([1, 2, 3, 4]))
+    assert runner.run() == {'squares': 'ran', 'total': 'ran'}
+    assert json.loads(total.read_text())['total'] == 30